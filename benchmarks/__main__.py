@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+from random import Random
+from tempfile import TemporaryDirectory
+
+from tortoise import Tortoise
+
+from benchmarks.client import ASGIClient
+from benchmarks.data import generate
+from benchmarks.metrics import QueryCounter
+from benchmarks.scenarios import SCENARIOS, Bench
+from echo import config
+
+
+BASELINES = Path(__file__).parent / 'baselines'
+SIZE_ARGUMENTS = ['subnets', 'devices', 'degree', 'requests', 'concurrency', 'rounds', 'churn', 'deployments', 'hops']
+LOWER_IS_BETTER = ['p50_ms', 'p99_ms', 'queries_per_request']
+HIGHER_IS_BETTER = ['throughput']
+
+
+parser = argparse.ArgumentParser(prog='python -m benchmarks')
+
+parser.add_argument('scenarios', nargs='*', metavar='scenario', help=f'any of {", ".join(SCENARIOS)}, all by default')
+parser.add_argument('--db-url', type=str, help='database that does not exist yet, it is created and dropped')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--subnets', type=int, default=20)
+parser.add_argument('--devices', type=int, default=200, help='devices per subnet')
+parser.add_argument('--degree', type=float, default=3, help='average number of links per device')
+parser.add_argument('--requests', type=int, default=500)
+parser.add_argument('--concurrency', type=int, default=10)
+parser.add_argument('--rounds', type=int, default=5, help='scan reports per agent')
+parser.add_argument('--churn', type=float, default=0.05, help='share of devices changed between scan reports')
+parser.add_argument('--deployments', type=int, default=10)
+parser.add_argument('--hops', type=int, default=4)
+parser.add_argument('--probe-latency', type=float, default=0.05)
+parser.add_argument('--ssh-latency', type=float, default=0.1)
+parser.add_argument('--baseline', type=Path, help='defaults to benchmarks/baselines/<backend>.json')
+parser.add_argument('--save-baseline', action='store_true')
+parser.add_argument('--tolerance', type=float, default=0.5, help='relative change reported as a regression')
+parser.add_argument('--fail-on-regression', action='store_true')
+parser.add_argument('--output', type=Path, help='write results as JSON')
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> dict[str, list[str]]:
+    changes = {}
+
+    for name, result in results.items():
+        previous = baseline.get(name)
+
+        if previous is None:
+            continue
+
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if not previous[metric]:
+                continue
+
+            change = result[metric] / previous[metric] - 1
+            regressed = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+
+            changes.setdefault(name, []).append(f'{metric} {change:+.0%}{" !" if regressed else ""}')
+
+    return changes
+
+
+def report(results: dict, changes: dict[str, list[str]]):
+    print(f'{"scenario":<22}{"requests":>10}{"errors":>8}{"p50 ms":>10}{"p99 ms":>10}{"req/s":>10}{"queries":>10}')
+
+    for name, result in results.items():
+        print(
+            f'{name:<22}{result["requests"]:>10}{result["errors"]:>8}{result["p50_ms"]:>10.2f}'
+            f'{result["p99_ms"]:>10.2f}{result["throughput"]:>10.1f}{result["queries_per_request"]:>10.2f}'
+        )
+
+        if name in changes:
+            print(f'{"":<22}{", ".join(changes[name])}')
+
+
+async def run(args) -> dict:
+    # The application reads the database settings when it is imported
+    config.DATABASE_URL = args.db_url
+    config.DATABASE_REPLICA_URL = ''
+
+    from echo.app import app
+    from echo.auth import authenticate
+    from echo.database import database_config
+    from echo.migrations import upgrade
+
+    rng = Random(args.seed)
+    database = database_config(args.db_url, None)
+
+    await Tortoise.init(config=database, _create_db=True)
+    await upgrade()
+
+    print(f'Generating {args.subnets} subnets x {args.devices} devices', file=sys.stderr)
+    dataset = await generate(rng, args.subnets, args.devices, args.degree)
+
+    await Tortoise.close_connections()
+
+    app.dependency_overrides[authenticate] = lambda: {}
+    queries = QueryCounter()
+    results = {}
+
+    await app.router.startup()
+    queries.install()
+
+    try:
+        bench = Bench(ASGIClient(app), dataset, rng, queries, args)
+
+        for name in args.scenarios or SCENARIOS:
+            print(f'Running {name}', file=sys.stderr)
+
+            measurement = bench.measure(name)
+            await SCENARIOS[name](bench, measurement)
+            results[name] = measurement.result()
+    finally:
+        queries.uninstall()
+        await app.router.shutdown()
+
+        await Tortoise.init(config=database)
+        await Tortoise._drop_databases()
+
+    return results
+
+
+def main(args) -> int:
+    unknown = set(args.scenarios) - set(SCENARIOS)
+
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    with TemporaryDirectory() as directory:
+        if args.db_url is None:
+            args.db_url = f'sqlite://{directory}/echo.sqlite3'
+
+        results = asyncio.run(run(args))
+
+    backend = args.db_url.split(':', 1)[0]
+    baseline_path = args.baseline or BASELINES / f'{backend}.json'
+    sizes = {name: getattr(args, name) for name in SIZE_ARGUMENTS}
+    changes = {}
+
+    if baseline_path.exists() and not args.save_baseline:
+        baseline = json.loads(baseline_path.read_text())
+
+        if baseline['sizes'] == sizes:
+            changes = compare(results, baseline['results'], args.tolerance)
+        else:
+            print(f'Baseline {baseline_path} was recorded with different sizes, skipping comparison', file=sys.stderr)
+
+    report(results, changes)
+
+    if args.output is not None:
+        args.output.write_text(json.dumps({'backend': backend, 'sizes': sizes, 'results': results}, indent=2))
+
+    if args.save_baseline:
+        baseline_path.parent.mkdir(exist_ok=True)
+        baseline_path.write_text(json.dumps({'sizes': sizes, 'results': results}, indent=2) + '\n')
+
+    if args.fail_on_regression and any(change.endswith('!') for items in changes.values() for change in items):
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(parser.parse_args()))
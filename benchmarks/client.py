@@ -0,0 +1,73 @@
+import asyncio
+from typing import Any, Optional
+from urllib.parse import urlencode
+
+import ujson
+
+
+class ASGIClient:
+    def __init__(self, app):
+        self.app = app
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[dict] = None,
+        json: Any = None,
+    ) -> tuple[int, bytes]:
+        body = ujson.dumps(json).encode() if json is not None else b''
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'root_path': '',
+            'query_string': urlencode(params or {}).encode(),
+            'headers': [
+                (b'host', b'benchmark'),
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+            'client': ('127.0.0.1', 0),
+            'server': ('benchmark', 80),
+        }
+
+        disconnected = asyncio.Event()
+        received = False
+        status = 0
+        chunks = []
+
+        async def receive() -> dict:
+            nonlocal received
+
+            if not received:
+                received = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message: dict):
+            nonlocal status
+
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+
+                if not message.get('more_body', False):
+                    disconnected.set()
+
+        await self.app(scope, receive, send)
+
+        return status, b''.join(chunks)
+
+    async def get(self, path: str, **params) -> tuple[int, bytes]:
+        return await self.request('GET', path, params=params)
+
+    async def post(self, path: str, json: Any = None) -> tuple[int, bytes]:
+        return await self.request('POST', path, json=json)
@@ -0,0 +1,163 @@
+from ipaddress import IPv4Network
+from math import ceil, log2
+from random import Random
+from typing import NamedTuple
+
+from echo.models import DeviceStatusEnum, DeviceTypeEnum
+from echo.models.db import Agent, Device, DeviceLink, DevicePort, Subnet
+
+
+PORTS = [('ssh', 22), ('telnet', 23), ('http', 80), ('https', 443), ('rdp', 3389), ('vnc', 5900)]
+DEVICE_TYPES = [device_type for device_type in DeviceTypeEnum if device_type is not DeviceTypeEnum.ECHO]
+BATCH_SIZE = 1000
+
+
+def random_mac(rng: Random) -> str:
+    return ':'.join(f'{rng.randrange(256):02x}' for _ in range(6))
+
+
+def random_ports(rng: Random) -> list[tuple[str, int]]:
+    return sorted(rng.sample(PORTS, rng.randrange(len(PORTS) // 2 + 1)), key=lambda port: port[1])
+
+
+class SimulatedAgent:
+    def __init__(self, rng: Random, token: str, hosts: list[str], devices: int):
+        self.rng = rng
+        self.token = token
+        self.gateway = hosts[0]
+        self.address = hosts[1]
+        self.generation = 0
+
+        self._free = hosts[devices + 1:]
+        self.devices = {
+            ip: (random_mac(rng), random_ports(rng), ip == self.gateway)
+            for ip in [self.gateway, *hosts[2:devices + 1]]
+        }
+
+    def _row(self, ip: str) -> dict:
+        mac, ports, is_gateway = self.devices[ip]
+
+        return {'ip': ip, 'mac': mac, 'ports': ports, 'is_gateway': is_gateway}
+
+    def report(self) -> dict:
+        return {'agent_token': self.token, 'devices': [self._row(ip) for ip in self.devices]}
+
+    def churn(self, fraction: float) -> tuple[list[dict], list[str]]:
+        count = max(1, round(len(self.devices) * fraction))
+        candidates = [ip for ip in self.devices if ip != self.gateway]
+
+        removed = self.rng.sample(candidates, min(count // 3, len(candidates)))
+        changed = self.rng.sample(candidates, min(count - len(removed), len(candidates)))
+
+        for ip in removed:
+            del self.devices[ip]
+            self._free.append(ip)
+
+        upserted = []
+
+        for ip in changed:
+            if ip in self.devices:
+                mac, _, is_gateway = self.devices[ip]
+                self.devices[ip] = (mac, random_ports(self.rng), is_gateway)
+                upserted.append(ip)
+
+        for _ in range(min(len(removed), len(self._free))):
+            ip = self._free.pop(self.rng.randrange(len(self._free)))
+            self.devices[ip] = (random_mac(self.rng), random_ports(self.rng), False)
+            upserted.append(ip)
+
+        return [self._row(ip) for ip in upserted], removed
+
+
+class Dataset(NamedTuple):
+    subnets: list[Subnet]
+    agents: list[SimulatedAgent]
+    agent_ids: list[int]
+    device_ids: list[int]
+    subnet_devices: dict[int, list[str]]
+
+
+def subnet_networks(subnets: int, devices: int) -> list[IPv4Network]:
+    prefix = min(30, 32 - ceil(log2(devices * 2 + 4)))
+    networks = IPv4Network('10.0.0.0/8').subnets(new_prefix=prefix)
+
+    return [next(networks) for _ in range(subnets)]
+
+
+async def generate(rng: Random, subnets: int, devices: int, degree: float, up_ratio: float = 0.9) -> Dataset:
+    networks = subnet_networks(subnets, devices)
+    db_subnets = []
+
+    for network in networks:
+        hosts = network.hosts()
+        subnet = Subnet(cidr=str(network), gateway_address=str(next(hosts)))
+        subnet.compute_range()
+        db_subnets.append(subnet)
+
+    await Subnet.bulk_create(db_subnets)
+    db_subnets = await Subnet.all().order_by('id')
+
+    agents = [
+        SimulatedAgent(rng, f'bench-{i}', list(map(str, network.hosts())), devices)
+        for i, network in enumerate(networks)
+    ]
+
+    await Agent.bulk_create(
+        [
+            Agent(address=agent.address, subnet=subnet, token=agent.token, username='bench', password='bench')
+            for subnet, agent in zip(db_subnets, agents)
+        ]
+    )
+
+    db_devices = [
+        Device(
+            subnet=subnet,
+            address=ip,
+            mac=mac,
+            name=f'device-{ip}',
+            type=DeviceTypeEnum.ROUTER if is_gateway else rng.choice(DEVICE_TYPES),
+            connection_options=ports,
+            status=DeviceStatusEnum.UP if rng.random() < up_ratio else DeviceStatusEnum.DOWN,
+        )
+        for subnet, agent in zip(db_subnets, agents)
+        for ip, (mac, ports, is_gateway) in agent.devices.items()
+    ]
+
+    for i in range(0, len(db_devices), BATCH_SIZE):
+        await Device.bulk_create(db_devices[i:i + BATCH_SIZE])
+
+    rows = await Device.all().order_by('id').values_list('id', 'subnet_id', 'address', 'connection_options')
+    device_ids = [device_id for device_id, *_ in rows]
+    by_subnet: dict[int, list[int]] = {}
+    subnet_devices: dict[int, list[str]] = {}
+
+    for device_id, subnet_id, address, _ in rows:
+        by_subnet.setdefault(subnet_id, []).append(device_id)
+        subnet_devices.setdefault(subnet_id, []).append(address)
+
+    ports = [
+        DevicePort(device_id=device_id, port=port)
+        for device_id, _, _, connection_options in rows
+        for port in {port for _, port in connection_options}
+    ]
+
+    for i in range(0, len(ports), BATCH_SIZE):
+        await DevicePort.bulk_create(ports[i:i + BATCH_SIZE])
+
+    pairs = set()
+
+    for ids in by_subnet.values():
+        for i in range(1, len(ids)):
+            pairs.add((ids[rng.randrange(i)], ids[i]))
+
+        for _ in range(max(0, round(len(ids) * (degree - 2) / 2))):
+            pairs.add((rng.choice(ids), rng.choice(ids)))
+
+    gateways = [ids[0] for ids in by_subnet.values()]
+    pairs.update(zip(gateways, gateways[1:]))
+
+    await DeviceLink.link(pairs)
+
+    agent_ids = await Agent.all().order_by('id').values_list('id', flat=True)
+
+    return Dataset(db_subnets, agents, agent_ids, device_ids, subnet_devices)
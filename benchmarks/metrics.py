@@ -0,0 +1,76 @@
+import logging
+from math import ceil
+from time import perf_counter
+from typing import Optional
+
+
+class QueryCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord):
+        if not str(record.msg).startswith(('Created connection', 'Closed connection')):
+            self.count += 1
+
+    def install(self):
+        logger = logging.getLogger('db_client')
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        logger.addHandler(self)
+
+    def uninstall(self):
+        logger = logging.getLogger('db_client')
+        logger.removeHandler(self)
+        logger.setLevel(logging.NOTSET)
+        logger.propagate = True
+
+
+def percentile(values: list[float], rank: float) -> float:
+    if not values:
+        return 0
+
+    ordered = sorted(values)
+
+    return ordered[max(0, ceil(len(ordered) * rank / 100) - 1)]
+
+
+class Measurement:
+    def __init__(self, name: str, queries: QueryCounter):
+        self.name = name
+        self.latencies: list[float] = []
+        self.errors = 0
+        self.queries = 0
+
+        self._queries = queries
+        self._queries_at = 0
+        self._started_at = 0.0
+        self._finished_at: Optional[float] = None
+
+    def __enter__(self) -> 'Measurement':
+        self._queries_at = self._queries.count
+        self._started_at = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._finished_at = perf_counter()
+        self.queries = self._queries.count - self._queries_at
+
+    def record(self, latency: float, ok: bool = True):
+        self.latencies.append(latency)
+
+        if not ok:
+            self.errors += 1
+
+    def result(self) -> dict:
+        duration = self._finished_at - self._started_at
+        count = len(self.latencies)
+
+        return {
+            'requests': count,
+            'errors': self.errors,
+            'p50_ms': percentile(self.latencies, 50) * 1000,
+            'p99_ms': percentile(self.latencies, 99) * 1000,
+            'throughput': count / duration if duration else 0,
+            'queries_per_request': self.queries / count if count else 0,
+        }
@@ -0,0 +1,35 @@
+import time
+from contextlib import ExitStack, contextmanager
+from ipaddress import IPv4Address
+from random import Random
+from typing import Iterator
+from unittest.mock import patch
+
+from benchmarks.data import Dataset, random_ports
+from echo import jobs
+from echo.models.db import Agent
+from echo.models.pydantic import PyDeviceTraced
+
+
+@contextmanager
+def mocked_probes(rng: Random, dataset: Dataset, hops: int, probe_latency: float, ssh_latency: float) -> Iterator[None]:
+    paths = {}
+
+    for subnet, agent in zip(dataset.subnets, dataset.agents):
+        addresses = [address for address in dataset.subnet_devices[subnet.pk] if address != agent.gateway]
+        paths[agent.address] = [agent.gateway, *rng.sample(addresses, min(hops, len(addresses))), agent.address]
+
+    def trace_and_scan(ip: IPv4Address) -> list[PyDeviceTraced]:
+        time.sleep(probe_latency)
+
+        return [PyDeviceTraced(ip=hop, ports=random_ports(rng)) for hop in paths[str(ip)]]
+
+    def deploy_agent(agent: Agent):
+        time.sleep(ssh_latency)
+
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(jobs, 'trace_and_scan', trace_and_scan))
+        stack.enter_context(patch.object(jobs, 'deploy_agent', deploy_agent))
+        stack.enter_context(patch.object(jobs, 'destroy', deploy_agent))
+
+        yield
@@ -0,0 +1,180 @@
+import asyncio
+from random import Random
+from time import perf_counter
+from typing import Awaitable, Callable
+
+import ujson
+
+from benchmarks.client import ASGIClient
+from benchmarks.data import Dataset
+from benchmarks.metrics import Measurement, QueryCounter
+from benchmarks.mocks import mocked_probes
+from echo.ingest import ingest_queue
+from echo.jobs import deployment_runner
+from echo.models import DeploymentJobStatusEnum
+from echo.models.db import DeploymentJob
+from echo.response_cache import response_cache
+
+
+class Bench:
+    def __init__(self, client: ASGIClient, dataset: Dataset, rng: Random, queries: QueryCounter, args):
+        self.client = client
+        self.dataset = dataset
+        self.rng = rng
+        self.queries = queries
+        self.args = args
+
+    def measure(self, name: str) -> Measurement:
+        return Measurement(name, self.queries)
+
+    async def run(self, calls: int, call: Callable[[int], Awaitable]):
+        indexes = iter(range(calls))
+
+        async def worker():
+            for i in indexes:
+                await call(i)
+
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+
+    async def timed(self, measurement: Measurement, method: str, path: str, expected: int = 200, **kwargs) -> bytes:
+        started_at = perf_counter()
+        status, body = await self.client.request(method, path, **kwargs)
+        measurement.record(perf_counter() - started_at, status == expected)
+
+        return body
+
+    def device_filters(self) -> dict:
+        subnet = self.rng.choice(self.dataset.subnets)
+
+        return self.rng.choice(
+            [
+                {},
+                {'subnet_id': subnet.pk},
+                {'after': self.rng.choice(self.dataset.device_ids)},
+                {'address': subnet.cidr.rsplit('.', 1)[0]},
+                {'status': 'down'},
+                {'port': 22},
+            ]
+        )
+
+
+async def list_devices(bench: Bench, measurement: Measurement):
+    async def call(_):
+        await response_cache.bump('devices')
+        await bench.timed(measurement, 'GET', '/devices/', params=bench.device_filters())
+
+    with measurement:
+        await bench.run(bench.args.requests, call)
+
+
+async def list_devices_cached(bench: Bench, measurement: Measurement):
+    async def call(_):
+        await bench.timed(measurement, 'GET', '/devices/', params=bench.device_filters())
+
+    with measurement:
+        await bench.run(bench.args.requests, call)
+
+
+async def get_device(bench: Bench, measurement: Measurement):
+    async def call(_):
+        await response_cache.bump('devices')
+        await bench.timed(measurement, 'GET', f'/devices/{bench.rng.choice(bench.dataset.device_ids)}')
+
+    with measurement:
+        await bench.run(bench.args.requests, call)
+
+
+async def topology_path(bench: Bench, measurement: Measurement):
+    async def call(_):
+        source_id, target_id = bench.rng.sample(bench.dataset.device_ids, 2)
+        await bench.timed(measurement, 'GET', '/topology/path', params={'source_id': source_id, 'target_id': target_id})
+
+    with measurement:
+        await bench.run(bench.args.requests, call)
+
+
+async def from_scan(bench: Bench, measurement: Measurement):
+    agents = bench.dataset.agents
+
+    async def call(i):
+        agent = agents[i]
+        agent.churn(bench.args.churn)
+        body = await bench.timed(measurement, 'POST', '/devices/from_scan', 202, json=agent.report())
+        agent.generation = ujson.loads(body).get('generation', agent.generation)
+
+    failed = ingest_queue.failed
+
+    with measurement:
+        for _ in range(bench.args.rounds):
+            await bench.run(len(agents), call)
+            await ingest_queue.join()
+
+    measurement.errors += ingest_queue.failed - failed
+
+
+async def from_scan_delta(bench: Bench, measurement: Measurement):
+    agents = bench.dataset.agents
+
+    for agent in agents:
+        if not agent.generation:
+            status, body = await bench.client.request('POST', '/devices/from_scan', json=agent.report())
+            agent.generation = ujson.loads(body)['generation']
+
+    await ingest_queue.join()
+
+    async def call(i):
+        agent = agents[i]
+        upserted, removed = agent.churn(bench.args.churn)
+        body = await bench.timed(
+            measurement,
+            'POST',
+            '/devices/from_scan/delta',
+            202,
+            json={'agent_token': agent.token, 'generation': agent.generation, 'upserted': upserted, 'removed': removed},
+        )
+        agent.generation = ujson.loads(body).get('generation', agent.generation)
+
+    failed = ingest_queue.failed
+
+    with measurement:
+        for _ in range(bench.args.rounds):
+            await bench.run(len(agents), call)
+            await ingest_queue.join()
+
+    measurement.errors += ingest_queue.failed - failed
+
+
+async def deploy(bench: Bench, measurement: Measurement):
+    args = bench.args
+    agent_ids = bench.rng.sample(bench.dataset.agent_ids, min(args.deployments, len(bench.dataset.agent_ids)))
+    job_ids = []
+
+    async def call(i):
+        status, body = await bench.client.request('POST', f'/agents/{agent_ids[i]}/deployment')
+
+        if status == 202:
+            job_ids.append(ujson.loads(body)['pk'])
+        else:
+            measurement.record(0, False)
+
+    with mocked_probes(bench.rng, bench.dataset, args.hops, args.probe_latency, args.ssh_latency):
+        with measurement:
+            await bench.run(len(agent_ids), call)
+            await deployment_runner.join()
+
+    for job in await DeploymentJob.filter(pk__in=job_ids):
+        measurement.record(
+            (job.finished_at - job.created_at).total_seconds(),
+            job.status == DeploymentJobStatusEnum.DONE,
+        )
+
+
+SCENARIOS: dict[str, Callable[[Bench, Measurement], Awaitable]] = {
+    'list_devices': list_devices,
+    'list_devices_cached': list_devices_cached,
+    'get_device': get_device,
+    'topology_path': topology_path,
+    'from_scan': from_scan,
+    'from_scan_delta': from_scan_delta,
+    'deploy': deploy,
+}
@@ -3,7 +3,9 @@ import asyncio
 
 from tortoise import Tortoise
 
-from echo.config import DATABASE_URL
+from echo.database import database_config
+from echo.executor import hash_executor
+from echo.migrations import upgrade
 from echo.models.db import User
 
 
@@ -16,17 +18,18 @@ parser.add_argument('--last-name', type=str)
 
 
 async def main(args):
-    await Tortoise.init(db_url=DATABASE_URL, modules={'models': ['echo.models.db']})
-    await Tortoise.generate_schemas()
+    await Tortoise.init(config=database_config())
+    await upgrade()
 
     await User.create(
         username=args.username,
-        password=User.get_password_hash(args.password),
+        password=await hash_executor.run(User.get_password_hash, args.password),
         first_name=args.first_name,
         last_name=args.last_name,
     )
 
     await Tortoise.close_connections()
+    hash_executor.shutdown()
 
 
 if __name__ == '__main__':
@@ -1,29 +1,100 @@
+import logging
 from socket import gethostname, gethostbyname
 
 from fastapi import FastAPI
 from fastapi.requests import Request
 from fastapi.responses import UJSONResponse
 from fastapi_jwt_auth.exceptions import AuthJWTException
+from tortoise import Tortoise
 from tortoise.contrib.fastapi import register_tortoise
 import ujson
 
 from echo import config
+from echo.coordination import coordinator
+from echo.database import PoolTimeout, ReplicaMiddleware, database_config
+from echo.executor import hash_executor, probe_executor, ssh_executor
+from echo.ingest import ingest_queue
+from echo.jobs import deployment_runner
+from echo.metrics import MetricsMiddleware, instrument_db, loop_lag_monitor
+from echo.migrations import upgrade
+from echo.profiling import ProfilingMiddleware
 from echo.models.db import Device, DeviceTypeEnum
 from echo.routing import router
+from echo.scheduler import scan_scheduler
+from echo.ssh import ssh_pool
+from echo.status import status_compactor
+from echo.subnet_index import subnet_index
+from echo.topology import topology
 
 
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter(config.LOG_FORMAT))
+
+logger = logging.getLogger('echo')
+logger.setLevel(config.LOG_LEVEL)
+logger.addHandler(log_handler)
+logger.propagate = False
+
 app = FastAPI()
 app.include_router(router)
+app.add_middleware(MetricsMiddleware)
+
+if config.DATABASE_REPLICA_URL:
+    app.add_middleware(ReplicaMiddleware)
+
+if config.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+
+@app.on_event('shutdown')
+async def stop_background_tasks():
+    await ingest_queue.stop()
+    await deployment_runner.stop()
+    await ssh_pool.stop()
+    await status_compactor.stop()
+    await scan_scheduler.stop()
+    await loop_lag_monitor.stop()
+    await coordinator.stop()
+    probe_executor.shutdown()
+    ssh_executor.shutdown()
+    hash_executor.shutdown()
+
 
 register_tortoise(
     app,
-    db_url=config.DATABASE_URL,
-    modules={'models': ['echo.models.db']},
-    generate_schemas=True,
+    config=database_config(config.DATABASE_URL, config.DATABASE_REPLICA_URL),
     add_exception_handlers=True,
 )
 
 
+@app.on_event('startup')
+async def start_background_tasks():
+    for connection in Tortoise._connections.values():
+        instrument_db(connection)
+
+    if config.MIGRATE_ON_STARTUP:
+        await upgrade()
+
+    await coordinator.start()
+    await topology.load()
+    await subnet_index.load()
+    await ingest_queue.start()
+    await deployment_runner.start()
+    await ssh_pool.start()
+    await status_compactor.start()
+    await scan_scheduler.start()
+    await loop_lag_monitor.start()
+
+
 @app.exception_handler(AuthJWTException)
 def authjwt_exception_handler(request: Request, exception: AuthJWTException):
     return UJSONResponse(status_code=exception.status_code, content={'detail': exception.message})  # noqa
+
+
+@app.exception_handler(PoolTimeout)
+def pool_timeout_exception_handler(request: Request, exception: PoolTimeout):
+    return UJSONResponse(
+        status_code=503,
+        content={'detail': 'Database connection pool is exhausted'},
+        headers={'Retry-After': '1'},
+    )
@@ -0,0 +1,166 @@
+from time import monotonic, time
+from typing import Optional
+
+from fastapi import Depends, HTTPException
+from fastapi.requests import Request
+from fastapi_jwt_auth import AuthJWT
+from pydantic import BaseModel
+from tortoise.signals import post_delete, post_save
+
+from echo.cache import TTLCache
+from echo.config import (
+    AUTH_TOKEN_CACHE_SIZE,
+    AUTH_TOKEN_CACHE_TTL,
+    AUTH_USER_CACHE_SIZE,
+    AUTH_USER_CACHE_TTL,
+    JWT_SECRET_KEY,
+    LOGIN_MAX_ATTEMPTS,
+    LOGIN_THROTTLE_SIZE,
+    LOGIN_WINDOW,
+)
+from echo.coordination import coordinator
+from echo.executor import hash_executor
+from echo.models.db import User
+from echo.models.pydantic import PyAuthCacheStats, PyCacheStats
+
+
+class JWTConfig(BaseModel):
+    authjwt_secret_key: str = JWT_SECRET_KEY
+
+
+@AuthJWT.load_config
+def get_config():
+    return JWTConfig()
+
+
+token_cache = TTLCache(AUTH_TOKEN_CACHE_SIZE, AUTH_TOKEN_CACHE_TTL)
+user_cache = TTLCache(AUTH_USER_CACHE_SIZE, AUTH_USER_CACHE_TTL)
+
+
+async def authenticate(request: Request) -> dict:
+    header = request.headers.get('authorization')
+    claims = token_cache.get(header) if header else None
+
+    if claims is None:
+        auth = AuthJWT(req=request)
+        auth.jwt_required()
+
+        claims = auth.get_raw_jwt()
+        ttl = AUTH_TOKEN_CACHE_TTL
+
+        if claims.get('exp') is not None:
+            ttl = min(ttl, claims['exp'] - time())
+
+        if ttl > 0:
+            token_cache.set(header, claims, ttl)
+
+    request.state.jwt_claims = claims
+
+    return claims
+
+
+async def get_current_user(claims: dict = Depends(authenticate)) -> User:
+    user_id = int(claims['sub'])
+    user: Optional[User] = user_cache.get(user_id)
+
+    if user is None:
+        user = await User.get_or_none(pk=user_id)
+
+        if user is None:
+            raise HTTPException(status_code=404)
+
+        user_cache.set(user_id, user)
+
+    return user
+
+
+def invalidate_user(user_id: int):
+    user_cache.pop(user_id)
+
+    coordinator.publish('users', [user_id])
+
+
+def _forget_users(user_ids: list[int]):
+    for user_id in user_ids:
+        user_cache.pop(user_id)
+
+
+@post_save(User)
+async def on_user_saved(sender, instance: User, created, using_db, update_fields):
+    invalidate_user(instance.pk)
+
+
+@post_delete(User)
+async def on_user_deleted(sender, instance: User, using_db):
+    invalidate_user(instance.pk)
+
+
+coordinator.subscribe('users', _forget_users, user_cache.clear)
+
+
+class LoginThrottle:
+    def __init__(self, max_attempts: int, window: float, maxsize: int):
+        self.max_attempts = max_attempts
+        self.window = window
+
+        self._failures = TTLCache(maxsize, window)
+
+    def _recent(self, key: str) -> list[float]:
+        deadline = monotonic() - self.window
+
+        return [attempt for attempt in self._failures.get(key, []) if attempt > deadline]
+
+    def retry_after(self, *keys: str) -> Optional[int]:
+        retry_after = None
+
+        for key in keys:
+            attempts = self._recent(key)
+
+            if len(attempts) >= self.max_attempts:
+                wait = int(attempts[-self.max_attempts] + self.window - monotonic()) + 1
+                retry_after = max(retry_after or 0, wait)
+
+        return retry_after
+
+    def fail(self, *keys: str):
+        for key in keys:
+            self._failures.set(key, self._recent(key)[-self.max_attempts:] + [monotonic()])
+
+    def reset(self, *keys: str):
+        for key in keys:
+            self._failures.pop(key)
+
+
+login_throttle = LoginThrottle(LOGIN_MAX_ATTEMPTS, LOGIN_WINDOW, LOGIN_THROTTLE_SIZE)
+
+
+def client_address(request: Request) -> str:
+    forwarded_for = request.headers.get('x-forwarded-for')
+
+    if forwarded_for:
+        return forwarded_for.split(',')[-1].strip()
+
+    return request.client.host if request.client else ''
+
+
+async def check_password(user: User, plain_password: str) -> bool:
+    is_valid, new_hash = await hash_executor.run(User.verify_and_update_password, plain_password, user.password)
+
+    if is_valid and new_hash is not None:
+        user.password = new_hash
+        await user.save(update_fields=['password'])
+
+    return is_valid
+
+
+def _cache_stats(cache: TTLCache) -> PyCacheStats:
+    return PyCacheStats(
+        size=len(cache),
+        hits=cache.hits,
+        misses=cache.misses,
+        hit_rate=cache.hit_rate,
+    )
+
+
+def auth_cache_stats() -> PyAuthCacheStats:
+    return PyAuthCacheStats(tokens=_cache_stats(token_cache), users=_cache_stats(user_cache))
@@ -2,3 +2,75 @@ DATABASE_URL = 'postgres://postgres:postgres@db:5432/postgres'
 JWT_SECRET_KEY = ''
 SERVER_HOST = ''
 AGENT_INSECURE = False
+INGEST_WORKERS = 4
+INGEST_QUEUE_SIZE = 256
+INGEST_RETRY_AFTER = 30
+SCAN_TIMEOUT = 2
+SCAN_RATE = 0
+PROBE_WORKERS = 4
+PROBE_TIMEOUT = 120
+SSH_WORKERS = 8
+SSH_CONNECT_TIMEOUT = 10
+SSH_TIMEOUT = 1800
+DEPLOY_CONCURRENCY = 8
+SSH_IDLE_TIMEOUT = 300
+FLEET_CONCURRENCY = 16
+FLEET_CONCURRENCY_MAX = 64
+DEVICE_PAGE_SIZE = 1000
+DEVICE_PAGE_SIZE_MAX = 5000
+EXPORT_BATCH_SIZE = 1000
+AUTH_TOKEN_CACHE_SIZE = 4096
+AUTH_TOKEN_CACHE_TTL = 60
+AUTH_USER_CACHE_SIZE = 1024
+AUTH_USER_CACHE_TTL = 30
+HASH_WORKERS = 2
+HASH_QUEUE_SIZE = 32
+HASH_TIMEOUT = 10
+LOGIN_MAX_ATTEMPTS = 5
+LOGIN_WINDOW = 300
+LOGIN_THROTTLE_SIZE = 10000
+RESPONSE_CACHE_BACKEND = 'memory'
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 300
+EVENTS_COALESCE_WINDOW = 0.2
+EVENTS_KEEPALIVE = 15
+EVENTS_MAX_PENDING = 10000
+STATUS_MAX_GAP = 600
+STATUS_COMPACT_AFTER = 3600
+STATUS_COMPACT_INTERVAL = 900
+STATUS_COMPACT_BATCH = 500
+STATUS_RETENTION = 31536000
+STATUS_HISTORY_WINDOW = 86400
+INGEST_MAX_BODY_SIZE = 67108864
+METRICS_TOKEN = ''
+METRICS_LOOP_LAG_INTERVAL = 1
+LOG_LEVEL = 'INFO'
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+PROFILING_ENABLED = False
+PROFILING_MAX_PROFILES = 50
+PROFILING_RETENTION = 3600
+PROFILING_SAMPLE_INTERVAL = 0.005
+PROFILING_MAX_DURATION = 60
+PROFILING_MAX_CONCURRENT = 4
+PROFILING_MAX_QUERIES = 1000
+SCAN_SCHEDULER_ENABLED = False
+SCAN_SCHEDULER_INTERVAL = 5
+SCAN_ROUND_INTERVAL = 900
+SCAN_SPREAD = 600
+SCAN_LEASE_DURATION = 300
+SCAN_UNIT_SIZE = 256
+SCAN_UNIT_PORTS = 0
+MIGRATE_ON_STARTUP = False
+COORDINATION_ENABLED = False
+COORDINATION_CHANNEL = 'echo'
+COORDINATION_FLUSH_INTERVAL = 0.05
+COORDINATION_RECONNECT_INTERVAL = 5
+DATABASE_REPLICA_URL = ''
+DATABASE_REPLICA_CACHE_TTL = 5
+DATABASE_POOL_MIN_SIZE = 1
+DATABASE_POOL_MAX_SIZE = 10
+DATABASE_POOL_MAX_IDLE = 300
+DATABASE_ACQUIRE_TIMEOUT = 10
+DATABASE_COMMAND_TIMEOUT = 0
+DATABASE_STATEMENT_CACHE_SIZE = 100
+DATABASE_STATEMENT_CACHE_LIFETIME = 300
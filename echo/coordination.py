@@ -0,0 +1,315 @@
+import asyncio
+import inspect
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+from uuid import uuid4
+
+import ujson
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.transactions import in_transaction
+
+from echo.config import (
+    COORDINATION_CHANNEL,
+    COORDINATION_ENABLED,
+    COORDINATION_FLUSH_INTERVAL,
+    COORDINATION_RECONNECT_INTERVAL,
+)
+from echo.metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+LOCK_MIGRATIONS = 1
+LOCK_SUBNET = 2
+LOCK_SNAPSHOT = 3
+LOCK_DEPLOYMENT_JOB = 4
+LOCK_SCAN_SCHEDULER = 5
+LOCK_STATUS_COMPACTOR = 6
+LOCK_AGENT_DEPLOYMENTS = 7
+
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes and more
+MAX_PAYLOAD = 7900
+RESYNC = '*'
+
+Handler = Callable[[list], Optional[object]]
+
+
+def _is_postgres(connection: BaseDBAsyncClient) -> bool:
+    return connection.capabilities.dialect == 'postgres'
+
+
+@asynccontextmanager
+async def migration_lock() -> AsyncIterator[None]:
+    connection = Tortoise.get_connection('default')
+
+    if not _is_postgres(connection):
+        yield
+        return
+
+    async with connection.acquire_connection() as raw_connection:
+        await raw_connection.execute('SELECT pg_advisory_lock($1, 0)', LOCK_MIGRATIONS)
+
+        try:
+            yield
+        finally:
+            await raw_connection.execute('SELECT pg_advisory_unlock($1, 0)', LOCK_MIGRATIONS)
+
+
+class Coordinator:
+    def __init__(self, enabled: bool, channel: str, flush_interval: float, reconnect_interval: float):
+        self.enabled = enabled
+        self.channel = channel
+        self.flush_interval = flush_interval
+        self.reconnect_interval = reconnect_interval
+        self.worker_id = uuid4().hex[:12]
+
+        self._handlers: dict[str, Handler] = {}
+        self._resync_handlers: list[Callable] = []
+        self._locks: dict[tuple[int, int], asyncio.Lock] = {}
+        self._held: set[tuple[int, int]] = set()
+
+        self._connection = None
+        self._connection_lock: Optional[asyncio.Lock] = None
+        self._reconnect_lock: Optional[asyncio.Lock] = None
+        self._outbox: list[tuple[str, object]] = []
+        self._outbox_ready: Optional[asyncio.Event] = None
+        self._inbox: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+
+        self.sent = 0
+        self.received = 0
+        self.resyncs = 0
+
+    @property
+    def active(self) -> bool:
+        return self._outbox_ready is not None
+
+    @property
+    def connected(self) -> bool:
+        return self._connection is not None and not self._connection.is_closed()
+
+    def subscribe(self, topic: str, handler: Handler, resync: Optional[Callable] = None):
+        self._handlers[topic] = handler
+
+        if resync is not None:
+            self._resync_handlers.append(resync)
+
+    def publish(self, topic: str, items: list):
+        if not self.active or not items:
+            return
+
+        self._outbox.extend((topic, item) for item in items)
+        self._outbox_ready.set()
+
+    @asynccontextmanager
+    async def lock(self, namespace: int, key: int) -> AsyncIterator[BaseDBAsyncClient]:
+        async with self._locks.setdefault((namespace, key), asyncio.Lock()):
+            if not self.enabled:
+                yield Tortoise.get_connection('default')
+                return
+
+            async with in_transaction('default') as connection:
+                await connection.execute_query('SELECT pg_advisory_xact_lock($1, $2)', [namespace, key])
+
+                yield connection
+
+    async def try_lock(self, namespace: int, key: int = 0) -> bool:
+        if (namespace, key) in self._held:
+            return False
+
+        if self.enabled:
+            if not self.connected:
+                return False
+
+            async with self._connection_lock:
+                if not await self._connection.fetchval('SELECT pg_try_advisory_lock($1, $2)', namespace, key):
+                    return False
+
+        self._held.add((namespace, key))
+
+        return True
+
+    async def unlock(self, namespace: int, key: int = 0):
+        if (namespace, key) not in self._held:
+            return
+
+        self._held.discard((namespace, key))
+
+        if self.enabled and self.connected:
+            async with self._connection_lock:
+                await self._connection.execute('SELECT pg_advisory_unlock($1, $2)', namespace, key)
+
+    async def is_leader(self, namespace: int) -> bool:
+        if self.enabled and not self.connected:
+            return False
+
+        return (namespace, 0) in self._held or await self.try_lock(namespace)
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str):
+        worker_id, topic, items = ujson.loads(payload)
+
+        if worker_id != self.worker_id:
+            self._inbox.put_nowait((topic, items))
+
+    def _on_termination(self, connection):
+        logger.warning('Lost the coordination connection')
+
+        # PostgreSQL releases session locks together with the connection
+        self._held.clear()
+
+    async def _connect(self):
+        import asyncpg
+
+        client = Tortoise.get_connection('default')
+
+        self._connection = await asyncpg.connect(
+            host=client.host,
+            port=client.port,
+            user=client.user,
+            password=client.password,
+            database=client.database,
+        )
+        self._connection.add_termination_listener(self._on_termination)
+        await self._connection.add_listener(self.channel, self._on_notification)
+
+        self._held.clear()
+
+    async def _notify(self, topic: str, items: list):
+        payload = ujson.dumps([self.worker_id, topic, items], escape_forward_slashes=False)
+
+        async with self._connection_lock:
+            await self._connection.execute('SELECT pg_notify($1, $2)', self.channel, payload)
+
+        self.sent += 1
+
+    async def _flush(self):
+        outbox, self._outbox = self._outbox, []
+        topic, items, size = None, [], 0
+
+        for item_topic, item in outbox:
+            item_size = len(ujson.dumps(item, escape_forward_slashes=False)) + 1
+
+            if items and (item_topic != topic or size + item_size > MAX_PAYLOAD):
+                await self._notify(topic, items)
+                items, size = [], 0
+
+            topic = item_topic
+            items.append(item)
+            size += item_size
+
+        if items:
+            await self._notify(topic, items)
+
+    async def _send_periodically(self):
+        while True:
+            await self._outbox_ready.wait()
+            await asyncio.sleep(self.flush_interval)
+
+            self._outbox_ready.clear()
+
+            try:
+                await self._flush()
+            except Exception:  # noqa
+                logger.exception('Failed to publish invalidations, resynchronizing workers')
+
+                self._connection.terminate()
+                await self._reconnect()
+
+    async def _reconnect(self):
+        async with self._reconnect_lock:
+            while not self.connected:
+                try:
+                    await self._connect()
+                    await self._notify(RESYNC, [])
+                except Exception:  # noqa
+                    logger.exception('Failed to connect the coordination channel')
+
+                    if self._connection is not None:
+                        self._connection.terminate()
+
+                    await asyncio.sleep(self.reconnect_interval)
+                    continue
+
+                self._outbox = []
+                self._inbox.put_nowait((RESYNC, []))
+
+    async def _watch_connection(self):
+        while True:
+            await asyncio.sleep(self.reconnect_interval)
+
+            if not self.connected:
+                await self._reconnect()
+
+    async def _resync(self):
+        self.resyncs += 1
+
+        for handler in self._resync_handlers:
+            result = handler()
+
+            if inspect.isawaitable(result):
+                await result
+
+    async def _dispatch(self):
+        while True:
+            topic, items = await self._inbox.get()
+            self.received += 1
+
+            try:
+                if topic == RESYNC:
+                    await self._resync()
+                elif topic in self._handlers:
+                    result = self._handlers[topic](items)
+
+                    if inspect.isawaitable(result):
+                        await result
+            except Exception:  # noqa
+                logger.exception('Failed to apply %s invalidation', topic)
+
+    async def start(self):
+        if not self.enabled:
+            return
+
+        if not _is_postgres(Tortoise.get_connection('default')):
+            raise RuntimeError('Worker coordination requires a PostgreSQL database')
+
+        self._connection_lock = asyncio.Lock()
+        self._reconnect_lock = asyncio.Lock()
+        self._outbox_ready = asyncio.Event()
+        self._inbox = asyncio.Queue()
+
+        await self._connect()
+
+        self._tasks = [
+            asyncio.create_task(self._send_periodically()),
+            asyncio.create_task(self._dispatch()),
+            asyncio.create_task(self._watch_connection()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        self._tasks = []
+        self._outbox_ready = None
+
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+        self._held.clear()
+
+
+coordinator = Coordinator(
+    COORDINATION_ENABLED,
+    COORDINATION_CHANNEL,
+    COORDINATION_FLUSH_INTERVAL,
+    COORDINATION_RECONNECT_INTERVAL,
+)
+
+registry.counter('echo_coordination_sent_total', 'Invalidation messages sent', function=lambda: coordinator.sent)
+registry.counter('echo_coordination_received_total', 'Invalidation messages received', function=lambda: coordinator.received)
+registry.counter('echo_coordination_resyncs_total', 'Full resynchronizations', function=lambda: coordinator.resyncs)
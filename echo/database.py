@@ -0,0 +1,125 @@
+from contextvars import ContextVar
+from typing import Any, Optional, Type
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+from tortoise import Model, Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.backends.base.config_generator import expand_db_url
+from tortoise.transactions import current_transaction_map
+
+from echo.config import (
+    DATABASE_ACQUIRE_TIMEOUT,
+    DATABASE_COMMAND_TIMEOUT,
+    DATABASE_POOL_MAX_IDLE,
+    DATABASE_POOL_MAX_SIZE,
+    DATABASE_POOL_MIN_SIZE,
+    DATABASE_REPLICA_URL,
+    DATABASE_STATEMENT_CACHE_LIFETIME,
+    DATABASE_STATEMENT_CACHE_SIZE,
+    DATABASE_URL,
+)
+
+
+REPLICA = 'replica'
+READ_METHODS = ('GET', 'HEAD')
+
+_read_replica: ContextVar[bool] = ContextVar('read_replica', default=False)
+
+
+class PoolTimeout(Exception):
+    def __init__(self, connection_name: str, timeout: float):
+        super().__init__(f'Timed out after {timeout}s waiting for a connection from the {connection_name} pool')
+        self.connection_name = connection_name
+        self.timeout = timeout
+
+
+def connection_config(url: str) -> dict:
+    config = expand_db_url(url)
+
+    if config['engine'] != 'tortoise.backends.asyncpg':
+        return config
+
+    credentials = config['credentials']
+
+    config['engine'] = 'echo.postgres'
+    credentials['minsize'] = credentials.pop('min_size', DATABASE_POOL_MIN_SIZE)
+    credentials['maxsize'] = credentials.pop('max_size', DATABASE_POOL_MAX_SIZE)
+    credentials.setdefault('acquire_timeout', DATABASE_ACQUIRE_TIMEOUT)
+    credentials.setdefault('statement_cache_size', DATABASE_STATEMENT_CACHE_SIZE)
+    credentials.setdefault('max_cached_statement_lifetime', DATABASE_STATEMENT_CACHE_LIFETIME)
+    credentials.setdefault('max_inactive_connection_lifetime', DATABASE_POOL_MAX_IDLE)
+
+    if DATABASE_COMMAND_TIMEOUT:
+        credentials.setdefault('command_timeout', DATABASE_COMMAND_TIMEOUT)
+
+    return config
+
+
+def database_config(url: str = DATABASE_URL, replica_url: Optional[str] = DATABASE_REPLICA_URL) -> dict:
+    config = {
+        'connections': {'default': connection_config(url)},
+        'apps': {'models': {'models': ['echo.models.db'], 'default_connection': 'default'}},
+    }
+
+    if replica_url:
+        config['connections'][REPLICA] = connection_config(replica_url)
+        config['routers'] = [ReplicaRouter]
+
+    return config
+
+
+def reads_from_replica() -> bool:
+    return _read_replica.get() and REPLICA in Tortoise._connections
+
+
+class ReplicaRouter:
+    def db_for_read(self, model: Type[Model]) -> Optional[str]:
+        # Reads inside a transaction must see its own writes
+        if reads_from_replica() and current_transaction_map['default'].get() is Tortoise._connections['default']:
+            return REPLICA
+
+        return None
+
+    def db_for_write(self, model: Type[Model]) -> Optional[str]:
+        return None
+
+
+class ReplicaMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or scope['method'] not in READ_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        token = _read_replica.set(True)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _read_replica.reset(token)
+
+
+class Parameters:
+    def __init__(self, connection: BaseDBAsyncClient):
+        self.values = []
+
+        self._numbered = connection.capabilities.dialect == 'postgres'
+
+    def add(self, value: Any) -> str:
+        self.values.append(value)
+
+        return f'${len(self.values)}' if self._numbered else '?'
+
+
+def select_columns(model: Type[Model]) -> str:
+    table = model._meta.db_table
+
+    return ', '.join(f'"{table}"."{column}"' for column in model._meta.fields_db_projection.values())
+
+
+async def fetch_models(model: Type[Model], query: str, values: list, connection: BaseDBAsyncClient) -> list[Model]:
+    rows = await connection.execute_query_dict(query, values)
+
+    return [model._init_from_db(**row) for row in rows]
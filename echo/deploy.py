@@ -1,15 +1,26 @@
 import os
-from ipaddress import IPv4Address, IPv4Network
+from contextlib import AsyncExitStack
+from ipaddress import IPv4Address
 
 from cryptography.fernet import Fernet
-from fabric import Config as FabricConfig, Connection
-from scapy.layers.inet import IP, TCP, sr1, traceroute as scapy_traceroute
+from fabric import Connection
+from scapy.layers.inet import IP, TCP, sr, traceroute as scapy_traceroute
+from scapy.sendrecv import send
 from scapy.volatile import RandShort
+from tortoise.transactions import in_transaction
 import json
 
-from echo.config import AGENT_INSECURE, SERVER_HOST
-from echo.models.db import Agent, Device, DeviceTypeEnum
+from echo.config import AGENT_INSECURE, SCAN_RATE, SCAN_TIMEOUT, SERVER_HOST, SSH_TIMEOUT
+from echo.coordination import LOCK_SUBNET, coordinator
+from echo.events import event_bus
+from echo.executor import probe_executor, ssh_executor
+from echo.metrics import DEPLOY_OPERATION_DURATION
+from echo.models.db import Agent, Device, DeviceLink, DevicePort, DeviceTypeEnum
 from echo.models.pydantic import PyDeviceTraced
+from echo.response_cache import response_cache
+from echo.ssh import ssh_pool
+from echo.subnet_index import subnet_index
+from echo.topology import topology
 
 
 class TemporaryAgentConfig:
@@ -42,6 +53,7 @@ class TemporaryAgentConfig:
         os.remove(self.__temp_file_name)
 
 
+@DEPLOY_OPERATION_DURATION.time(operation='traceroute')
 def traceroute(ip: IPv4Address) -> list[IPv4Address]:
     ip_string = str(ip)
 
@@ -60,34 +72,57 @@ def traceroute(ip: IPv4Address) -> list[IPv4Address]:
     return list(map(lambda node: node[1], nodes))
 
 
-def scan_address(ip: IPv4Address) -> PyDeviceTraced:
-    ip_string = str(ip)
-
+def load_ports() -> dict[str, str]:
     with open('agent_config.json') as config:
-        ports = json.load(config)['ports']
+        return json.load(config)['ports']
+
+
+@DEPLOY_OPERATION_DURATION.time(operation='scan')
+def scan_addresses(
+    ips: list[IPv4Address],
+    timeout: float = SCAN_TIMEOUT,
+    rate: int = SCAN_RATE,
+) -> list[PyDeviceTraced]:
+    if not ips:
+        return []
+
+    ports = load_ports()
+    port_order = list(map(int, ports))
+    ip_strings = [str(ip) for ip in ips]
+
+    answered, unanswered = sr(
+        IP(dst=ip_strings) / TCP(sport=RandShort(), dport=port_order, flags='S'),
+        verbose=0,
+        timeout=timeout,
+        inter=1 / rate if rate else 0,
+    )
+
+    available_ports = {ip_string: [] for ip_string in ip_strings}
+    resets = []
 
-    available_ports = []
-    source_port = RandShort()
+    for snd, rcv in answered:
+        if rcv.haslayer(TCP) and rcv.getlayer(TCP).flags == 0x12:
+            available_ports[snd.dst].append((ports[str(snd.dport)], snd.dport))
+            resets.append(IP(dst=snd.dst) / TCP(sport=snd.sport, dport=snd.dport, flags='R'))
 
-    for port_ in ports:
-        port = int(port_)
+    if resets:
+        send(resets, verbose=0)
 
-        answer = sr1(
-            IP(dst=ip_string) / TCP(sport=source_port, dport=port, flags='S'),
-            verbose=0,
-            timeout=0.5,
+    return [
+        PyDeviceTraced(
+            ip=ip,
+            ports=sorted(available_ports[str(ip)], key=lambda port: port_order.index(port[1])),
         )
+        for ip in ips
+    ]
 
-        if (answer is not None) and (answer.haslayer(TCP)) and (answer.getlayer(TCP).flags == 0x12):
-            available_ports.append((ports[str(port)], port))
 
-            sr1(
-                IP(dst=ip_string) / TCP(sport=source_port, dport=port, flags='R'),
-                verbose=0,
-                timeout=0,
-            )
+def scan_address(ip: IPv4Address) -> PyDeviceTraced:
+    return scan_addresses([ip])[0]
+
 
-    return PyDeviceTraced(ip=ip, ports=available_ports)
+def trace_and_scan(ip: IPv4Address) -> list[PyDeviceTraced]:
+    return scan_addresses(traceroute(ip))
 
 
 async def create_non_existent_devices(device_list: list[PyDeviceTraced], agent: Agent):
@@ -95,83 +130,84 @@ async def create_non_existent_devices(device_list: list[PyDeviceTraced], agent:
         return
 
     db_devices = []
+    created_devices = []
 
-    for traced_device in device_list:
-        device = await Device.get_or_none(address=str(traced_device.ip))
-
-        if device is None:
-            device = await Device.create(
-                address=str(traced_device.ip),
-                subnet=agent.subnet if traced_device.ip in IPv4Network(agent.subnet.cidr) else None,
-                type=DeviceTypeEnum.ECHO if str(traced_device.ip) == agent.address else DeviceTypeEnum.UNKNOWN,
-                connected_with=[],
-                connection_options=traced_device.ports,
-            )
-
-        db_devices.append(device)
+    subnet_ids = {str(traced_device.ip): subnet_index.resolve(str(traced_device.ip)) for traced_device in device_list}
 
-    for i in range(len(db_devices)):
-        neighbours = []
+    # Hops can belong to any subnet, so every one of them is locked in order the same way a scan report locks it
+    async with AsyncExitStack() as stack:
+        for subnet_id in sorted({subnet_id for subnet_id in subnet_ids.values() if subnet_id is not None}):
+            await stack.enter_async_context(coordinator.lock(LOCK_SUBNET, subnet_id))
 
-        if i != 0:
-            neighbours.append(db_devices[i - 1].pk)
+        async with in_transaction('default') as connection:
+            for traced_device in device_list:
+                address = str(traced_device.ip)
+                device = await Device.get_or_none(address=address).using_db(connection)
 
-        if i != len(db_devices) - 1:
-            neighbours.append(db_devices[i + 1].pk)
+                if device is None:
+                    device = await Device.create(
+                        address=address,
+                        subnet_id=subnet_ids[address],
+                        type=DeviceTypeEnum.ECHO if address == agent.address else DeviceTypeEnum.UNKNOWN,
+                        connection_options=traced_device.ports,
+                        using_db=connection,
+                    )
 
-        db_devices[i].connected_with.extend(neighbours)
+                    created_devices.append(device)
 
-        db_devices[i].connected_with = list(set(db_devices[i].connected_with))
+                db_devices.append(device)
 
-        await db_devices[i].save()
+            await DevicePort.replace(created_devices, using_db=connection)
 
+            links = await DeviceLink.link(
+                ((db_devices[i - 1].pk, db_devices[i].pk) for i in range(1, len(db_devices))),
+                using_db=connection,
+            )
 
-def deploy_agent(agent: Agent):
-    config = None
+    topology.update_devices(db_devices)
+    topology.link(links)
 
-    if agent.username != 'root':
-        config = FabricConfig(overrides={'sudo': {'password': agent.password}})
+    event_bus.devices_created(created_devices)
+    event_bus.linked(links)
 
-    connection = Connection(
-        host=agent.address,
-        port=22,
-        user=agent.username,
-        config=config,
-    )
+    await response_cache.bump('devices')
 
-    connection.connect_kwargs.password = agent.password
 
+def push_config(agent: Agent, connection: Connection):
     with TemporaryAgentConfig(agent) as config_file:
         connection.put(config_file, 'config.json')
 
-    connection.put('deploy.sh', '.')
-    connection.sudo('/bin/sh deploy.sh')
 
-    connection.close()
+@DEPLOY_OPERATION_DURATION.time(operation='ssh_deploy')
+def deploy_agent(agent: Agent):
+    with ssh_pool.connection(agent) as connection:
+        push_config(agent, connection)
+
+        connection.put('deploy.sh', '.')
+        connection.sudo('/bin/sh deploy.sh', timeout=SSH_TIMEOUT)
 
 
 async def deploy(agent: Agent):
-    traced_devices = [scan_address(ip) for ip in traceroute(agent.address)]
+    traced_devices = await probe_executor.run(trace_and_scan, agent.address)
     await create_non_existent_devices(traced_devices, agent)
-    deploy_agent(agent)
+    await ssh_executor.run(deploy_agent, agent)
 
 
-def destroy(agent: Agent):
-    config = None
-
-    if agent.username != 'root':
-        config = FabricConfig(overrides={'sudo': {'password': agent.password}})
+@DEPLOY_OPERATION_DURATION.time(operation='ssh_config')
+def redeploy_config(agent: Agent):
+    with ssh_pool.connection(agent) as connection:
+        push_config(agent, connection)
 
-    connection = Connection(
-        host=agent.address,
-        port=22,
-        user=agent.username,
-        config=config,
-    )
+        connection.sudo(
+            '/bin/sh -c "cp config.json echo-agent/echo_agent && cd echo-agent && docker-compose up --build -d"',
+            timeout=SSH_TIMEOUT,
+        )
 
-    connection.connect_kwargs.password = agent.password
 
-    connection.put('destroy.sh', '.')
-    connection.sudo('/bin/sh destroy.sh')
+@DEPLOY_OPERATION_DURATION.time(operation='ssh_destroy')
+def destroy(agent: Agent):
+    with ssh_pool.connection(agent) as connection:
+        connection.put('destroy.sh', '.')
+        connection.sudo('/bin/sh destroy.sh', timeout=SSH_TIMEOUT)
 
-    connection.close()
+    ssh_pool.discard(agent.pk)
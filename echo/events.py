@@ -0,0 +1,195 @@
+import asyncio
+from typing import AsyncIterator, Iterable, Optional
+
+import ujson
+
+from echo.config import EVENTS_COALESCE_WINDOW, EVENTS_KEEPALIVE, EVENTS_MAX_PENDING
+from echo.coordination import coordinator
+from echo.models.db import Device
+from echo.topology import topology
+
+
+def device_event(op: str, device: Device) -> dict:
+    return {
+        'entity': 'device',
+        'op': op,
+        'id': device.pk,
+        'subnet_id': device.subnet_id,
+        'hostname': device.hostname,
+        'address': device.address,
+        'mac': device.mac,
+        'name': device.name,
+        'type': device.type.value,
+    }
+
+
+def device_removed_event(device_id: int, subnet_id: Optional[int]) -> dict:
+    return {'entity': 'device', 'op': 'removed', 'id': device_id, 'subnet_id': subnet_id}
+
+
+def status_event(device: Device) -> dict:
+    return {
+        'entity': 'status',
+        'op': 'changed',
+        'id': device.pk,
+        'subnet_id': device.subnet_id,
+        'status': device.status.value,
+        'since': device.status_changed_at.isoformat(),
+    }
+
+
+def link_event(a: int, b: int) -> dict:
+    return {'entity': 'link', 'op': 'created', 'a': a, 'b': b}
+
+
+def _event_key(event: dict) -> tuple:
+    if event['entity'] == 'link':
+        return 'link', event['a'], event['b']
+
+    return event['entity'], event['id']
+
+
+def _event_subnets(event: dict) -> set[Optional[int]]:
+    if event['entity'] == 'link':
+        return {topology.subnet_of(event['a']), topology.subnet_of(event['b'])}
+
+    return {event.get('subnet_id')}
+
+
+class Subscription:
+    def __init__(self, subnet_id: Optional[int], max_pending: int):
+        self.subnet_id = subnet_id
+        self.max_pending = max_pending
+
+        self._pending: dict[tuple, dict] = {}
+        self._ready = asyncio.Event()
+
+        self.overflowed = False
+
+    def matches(self, event: dict) -> bool:
+        return self.subnet_id is None or self.subnet_id in _event_subnets(event)
+
+    def push(self, event: dict):
+        if self.overflowed:
+            return
+
+        key = _event_key(event)
+        previous = self._pending.get(key)
+
+        if previous is not None and previous['op'] == 'created':
+            if event['op'] == 'removed':
+                del self._pending[key]
+                return
+
+            event = {**event, 'op': 'created'}
+
+        self._pending[key] = event
+
+        if len(self._pending) > self.max_pending:
+            self._pending.clear()
+            self.overflowed = True
+
+        self._ready.set()
+
+    async def wait(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+
+        return True
+
+    def resync(self):
+        self._pending.clear()
+        self.overflowed = True
+        self._ready.set()
+
+    def drain(self) -> tuple[list[dict], bool]:
+        events = list(self._pending.values())
+        overflowed = self.overflowed
+
+        self._pending = {}
+        self._ready.clear()
+        self.overflowed = False
+
+        return events, overflowed
+
+
+class EventBus:
+    def __init__(self, coalesce_window: float, keepalive: float, max_pending: int):
+        self.coalesce_window = coalesce_window
+        self.keepalive = keepalive
+        self.max_pending = max_pending
+
+        self._subscriptions: set[Subscription] = set()
+
+        self.published = 0
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscriptions)
+
+    def publish(self, events: Iterable[dict]):
+        if coordinator.active:
+            events = list(events)
+            coordinator.publish('events', events)
+
+        self.deliver(events)
+
+    def deliver(self, events: Iterable[dict]):
+        if not self._subscriptions:
+            return
+
+        for event in events:
+            self.published += 1
+
+            for subscription in self._subscriptions:
+                if subscription.matches(event):
+                    subscription.push(event)
+
+    def resync(self):
+        for subscription in self._subscriptions:
+            subscription.resync()
+
+    def devices_created(self, devices: Iterable[Device]):
+        self.publish(device_event('created', device) for device in devices)
+
+    def devices_changed(self, devices: Iterable[Device]):
+        self.publish(device_event('changed', device) for device in devices)
+
+    def devices_removed(self, devices: Iterable[tuple[int, Optional[int]]]):
+        self.publish(device_removed_event(device_id, subnet_id) for device_id, subnet_id in devices)
+
+    def status_changed(self, devices: Iterable[Device]):
+        self.publish(status_event(device) for device in devices)
+
+    def linked(self, pairs: Iterable[tuple[int, int]]):
+        self.publish(link_event(a, b) for a, b in sorted(pairs))
+
+    async def stream(self, subnet_id: Optional[int] = None) -> AsyncIterator[bytes]:
+        subscription = Subscription(subnet_id, self.max_pending)
+        self._subscriptions.add(subscription)
+
+        try:
+            yield b'retry: 3000\n\n'
+
+            while True:
+                if not await subscription.wait(self.keepalive):
+                    yield b': keepalive\n\n'
+                    continue
+
+                await asyncio.sleep(self.coalesce_window)
+
+                events, overflowed = subscription.drain()
+
+                if overflowed:
+                    yield b'event: resync\ndata: {}\n\n'
+                elif events:
+                    yield f'event: delta\ndata: {ujson.dumps(events, escape_forward_slashes=False)}\n\n'.encode()
+        finally:
+            self._subscriptions.discard(subscription)
+
+
+event_bus = EventBus(EVENTS_COALESCE_WINDOW, EVENTS_KEEPALIVE, EVENTS_MAX_PENDING)
+
+coordinator.subscribe('events', event_bus.deliver, event_bus.resync)
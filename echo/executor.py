@@ -0,0 +1,76 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+from echo.config import (
+    HASH_QUEUE_SIZE,
+    HASH_TIMEOUT,
+    HASH_WORKERS,
+    PROBE_TIMEOUT,
+    PROBE_WORKERS,
+    SSH_TIMEOUT,
+    SSH_WORKERS,
+)
+
+
+class JobTimeout(Exception):
+    pass
+
+
+class ExecutorBusy(Exception):
+    pass
+
+
+class BlockingExecutor:
+    def __init__(self, name: str, max_workers: int, timeout: float, max_pending: Optional[int] = None):
+        self.name = name
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_pending = max_pending
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self.pending = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f'echo-{self.name}')
+
+        return self._executor
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        if self.max_pending is not None and self.pending >= self.max_pending:
+            raise ExecutorBusy(f'{self.name} executor is busy')
+
+        loop = asyncio.get_running_loop()
+        job = self._get_executor().submit(partial(func, *args, **kwargs))
+
+        # A timed out job keeps its worker thread until it returns, so it stays pending until then
+        self.pending += 1
+        job.add_done_callback(lambda _: self._release(loop))
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(job), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            raise JobTimeout(f'{self.name} job {getattr(func, "__name__", func)} timed out')
+
+    def _release(self, loop: asyncio.AbstractEventLoop):
+        try:
+            loop.call_soon_threadsafe(self._decrement)
+        except RuntimeError:
+            # The loop is already closed
+            pass
+
+    def _decrement(self):
+        self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+probe_executor = BlockingExecutor('probe', PROBE_WORKERS, PROBE_TIMEOUT)
+ssh_executor = BlockingExecutor('ssh', SSH_WORKERS, SSH_TIMEOUT)
+hash_executor = BlockingExecutor('hash', HASH_WORKERS, HASH_TIMEOUT, HASH_QUEUE_SIZE)
@@ -0,0 +1,66 @@
+from typing import AsyncIterator
+
+import ujson
+
+from echo.config import EXPORT_BATCH_SIZE
+from echo.models.db import Device, DeviceLink, Subnet
+
+
+DEVICE_FIELDS = ['id', 'subnet_id', 'hostname', 'address', 'mac', 'name', 'type', 'connection_options', 'status']
+
+
+async def iter_devices(batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    subnets = {
+        subnet['id']: {'pk': subnet['id'], 'cidr': subnet['cidr'], 'gateway_address': subnet['gateway_address']}
+        for subnet in await Subnet.all().values('id', 'cidr', 'gateway_address')
+    }
+
+    last_id = 0
+
+    while True:
+        rows = await (
+            Device.filter(subnet_id__isnull=False, pk__gt=last_id)
+            .order_by('id')
+            .limit(batch_size)
+            .values(*DEVICE_FIELDS)
+        )
+
+        if not rows:
+            return
+
+        neighbours = await DeviceLink.neighbours([row['id'] for row in rows])
+
+        yield ''.join(
+            ujson.dumps(
+                {
+                    'pk': row['id'],
+                    'subnet': subnets.get(row['subnet_id']),
+                    'hostname': row['hostname'],
+                    'address': row['address'],
+                    'mac': row['mac'],
+                    'name': row['name'],
+                    'type': row['type'].value,
+                    'connection_options': row['connection_options'],
+                    'connected_with': sorted(neighbours.get(row['id'], [])),
+                    'status': row['status'].value if row['status'] is not None else None,
+                },
+                escape_forward_slashes=False,
+            ) + '\n'
+            for row in rows
+        ).encode()
+
+        last_id = rows[-1]['id']
+
+
+async def iter_links(batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    last_id = 0
+
+    while True:
+        rows = await DeviceLink.filter(pk__gt=last_id).order_by('id').limit(batch_size).values_list('id', 'a_id', 'b_id')
+
+        if not rows:
+            return
+
+        yield ''.join(ujson.dumps({'a': a, 'b': b}) + '\n' for _, a, b in rows).encode()
+
+        last_id = rows[-1][0]
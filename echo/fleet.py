@@ -0,0 +1,47 @@
+import asyncio
+from time import monotonic
+
+from echo.config import FLEET_CONCURRENCY
+from echo.jobs import deployment_runner
+from echo.models import DeploymentJobKindEnum, DeploymentJobStatusEnum, FleetOperationEnum
+from echo.models.db import Agent
+from echo.models.pydantic import PyFleetResult
+
+
+FLEET_JOBS = {
+    FleetOperationEnum.CONFIG: DeploymentJobKindEnum.CONFIG,
+    FleetOperationEnum.DEPLOY: DeploymentJobKindEnum.INSTALL,
+    FleetOperationEnum.DESTROY: DeploymentJobKindEnum.DESTROY,
+}
+
+
+async def run_fleet_operation(
+    agents: list[Agent],
+    operation: FleetOperationEnum,
+    concurrency: int = FLEET_CONCURRENCY,
+) -> list[PyFleetResult]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(agent: Agent) -> PyFleetResult:
+        async with semaphore:
+            started_at = monotonic()
+            error = None
+
+            # Operations run as deployment jobs, so they never overlap another job for the same agent
+            try:
+                job = await deployment_runner.schedule(agent, FLEET_JOBS[operation])
+                job = await deployment_runner.wait(job.pk)
+
+                if job.status != DeploymentJobStatusEnum.DONE:
+                    error = job.error or 'Deployment job failed'
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+
+            return PyFleetResult(
+                agent_id=agent.pk,
+                ok=error is None,
+                error=error,
+                duration=monotonic() - started_at,
+            )
+
+    return list(await asyncio.gather(*map(run, agents)))
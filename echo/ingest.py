@@ -0,0 +1,176 @@
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from math import ceil
+from time import monotonic
+from typing import AsyncIterator, Optional
+
+from echo.config import INGEST_QUEUE_SIZE, INGEST_RETRY_AFTER, INGEST_WORKERS
+from echo.metrics import INGEST_QUEUE_WAIT, INGEST_STAGE_DURATION, registry
+from echo.models.db import Agent
+from echo.models.pydantic import PyIngestStats
+from echo.payload import ScannedDevice
+from echo.scan import reconcile_scan
+from echo.status import record_scan_status
+
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__('Scan ingest queue is full')
+        self.retry_after = retry_after
+
+
+class ScanIngestQueue:
+    def __init__(self, workers: int, max_size: int, latency_window: int = 100):
+        self.workers = workers
+        self.max_size = max_size
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._pending: dict[int, tuple[list[ScannedDevice], float]] = {}
+        self._locks: dict[int, tuple[asyncio.Lock, int]] = {}
+
+        self._wait_times = deque(maxlen=latency_window)
+        self._process_times = deque(maxlen=latency_window)
+
+        self.in_progress = 0
+        self.processed = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    @property
+    def length(self) -> int:
+        return len(self._pending)
+
+    def retry_after(self) -> int:
+        if not self._process_times:
+            return INGEST_RETRY_AFTER
+
+        average = sum(self._process_times) / len(self._process_times)
+
+        return max(1, ceil(self.length * average / self.workers))
+
+    def put(self, agent: Agent, devices: list[ScannedDevice]) -> int:
+        if self._queue is None:
+            raise RuntimeError('Scan ingest queue is not started')
+
+        if agent.pk in self._pending:
+            self._pending[agent.pk] = (devices, self._pending[agent.pk][1])
+            self.coalesced += 1
+            return self.length
+
+        if self.length >= self.max_size:
+            self.rejected += 1
+            raise IngestQueueFull(self.retry_after())
+
+        self._pending[agent.pk] = (devices, monotonic())
+        self._queue.put_nowait(agent.pk)
+
+        return self.length
+
+    async def _process(self, agent_id: int, devices: list[ScannedDevice]):
+        agent = await Agent.get_or_none(pk=agent_id).prefetch_related('subnet')
+
+        if agent is None:
+            return
+
+        diff = await reconcile_scan(agent, devices)
+
+        with INGEST_STAGE_DURATION.time(stage='status'):
+            await record_scan_status(diff)
+
+        logger.debug(
+            'Ingested scan report of agent %s: %s created, %s changed, %s not changed, %s vanished',
+            agent_id,
+            len(diff.created),
+            len(diff.changed),
+            len(diff.not_changed),
+            len(diff.vanished),
+        )
+
+    @asynccontextmanager
+    async def _agent_lock(self, agent_id: int) -> AsyncIterator[None]:
+        lock, users = self._locks.get(agent_id, (asyncio.Lock(), 0))
+        self._locks[agent_id] = (lock, users + 1)
+
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[agent_id]
+
+            # Dropped once no worker holds or waits for it, so the map only holds agents being ingested
+            if users == 1:
+                del self._locks[agent_id]
+            else:
+                self._locks[agent_id] = (lock, users - 1)
+
+    async def _work(self):
+        while True:
+            agent_id = await self._queue.get()
+            devices, enqueued_at = self._pending.pop(agent_id)
+
+            async with self._agent_lock(agent_id):
+                started_at = monotonic()
+                self._wait_times.append(started_at - enqueued_at)
+                INGEST_QUEUE_WAIT.observe(started_at - enqueued_at)
+                self.in_progress += 1
+
+                try:
+                    await self._process(agent_id, devices)
+                    self.processed += 1
+                except Exception:  # noqa
+                    self.failed += 1
+                    logger.exception('Failed to ingest scan report of agent %s', agent_id)
+                finally:
+                    self.in_progress -= 1
+                    self._process_times.append(monotonic() - started_at)
+                    self._queue.task_done()
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def join(self):
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        self._tasks = []
+        self._queue = None
+        self._pending.clear()
+
+    def stats(self) -> PyIngestStats:
+        return PyIngestStats(
+            workers=self.workers,
+            max_size=self.max_size,
+            length=self.length,
+            in_progress=self.in_progress,
+            processed=self.processed,
+            failed=self.failed,
+            coalesced=self.coalesced,
+            rejected=self.rejected,
+            avg_wait_time=sum(self._wait_times) / len(self._wait_times) if self._wait_times else 0,
+            avg_process_time=sum(self._process_times) / len(self._process_times) if self._process_times else 0,
+            max_process_time=max(self._process_times, default=0),
+        )
+
+
+ingest_queue = ScanIngestQueue(INGEST_WORKERS, INGEST_QUEUE_SIZE)
+
+registry.gauge('echo_ingest_queue_length', 'Scan reports waiting in the ingest queue', function=lambda: ingest_queue.length)
+registry.gauge('echo_ingest_in_progress', 'Scan reports being ingested', function=lambda: ingest_queue.in_progress)
+registry.counter('echo_ingest_processed_total', 'Ingested scan reports', function=lambda: ingest_queue.processed)
+registry.counter('echo_ingest_failed_total', 'Failed scan report ingests', function=lambda: ingest_queue.failed)
+registry.counter('echo_ingest_coalesced_total', 'Coalesced scan reports', function=lambda: ingest_queue.coalesced)
+registry.counter('echo_ingest_rejected_total', 'Rejected scan reports', function=lambda: ingest_queue.rejected)
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+from time import monotonic
+from typing import Awaitable, Callable, Optional
+
+from tortoise import timezone
+
+from echo.config import DEPLOY_CONCURRENCY
+from echo.coordination import LOCK_AGENT_DEPLOYMENTS, LOCK_DEPLOYMENT_JOB, coordinator
+from echo.deploy import create_non_existent_devices, deploy_agent, destroy, redeploy_config, trace_and_scan
+from echo.executor import probe_executor, ssh_executor
+from echo.metrics import DEPLOYMENT_STEP_DURATION
+from echo.models import DeploymentJobKindEnum, DeploymentJobStatusEnum
+from echo.models.db import Agent, DeploymentJob
+from echo.models.pydantic import PyDeviceTraced
+from echo.response_cache import response_cache
+
+
+logger = logging.getLogger(__name__)
+
+
+class JobConflict(Exception):
+    pass
+
+
+async def _traceroute(job: DeploymentJob):
+    traced_devices = await probe_executor.run(trace_and_scan, job.agent.address)
+    job.context['traced'] = [{'ip': str(device.ip), 'ports': device.ports} for device in traced_devices]
+
+
+async def _discover(job: DeploymentJob):
+    traced_devices = [PyDeviceTraced(**device) for device in job.context.get('traced', [])]
+    await create_non_existent_devices(traced_devices, job.agent)
+
+
+async def _install(job: DeploymentJob):
+    await ssh_executor.run(deploy_agent, job.agent)
+
+
+async def _configure(job: DeploymentJob):
+    await ssh_executor.run(redeploy_config, job.agent)
+
+
+async def _uninstall(job: DeploymentJob):
+    await ssh_executor.run(destroy, job.agent)
+
+
+async def _remove(job: DeploymentJob):
+    await job.agent.delete()
+    job.agent_id = None
+
+    await response_cache.bump('agents')
+
+
+STEPS: dict[DeploymentJobKindEnum, list[tuple[str, Callable[[DeploymentJob], Awaitable]]]] = {
+    DeploymentJobKindEnum.DEPLOY: [
+        ('traceroute', _traceroute),
+        ('discover', _discover),
+        ('install', _install),
+    ],
+    DeploymentJobKindEnum.DESTROY: [
+        ('uninstall', _uninstall),
+        ('remove', _remove),
+    ],
+    DeploymentJobKindEnum.INSTALL: [
+        ('install', _install),
+    ],
+    DeploymentJobKindEnum.CONFIG: [
+        ('configure', _configure),
+    ],
+}
+
+JOB_POLL_INTERVAL = 1
+
+ACTIVE_STATUSES = [DeploymentJobStatusEnum.PENDING, DeploymentJobStatusEnum.RUNNING]
+
+
+class DeploymentRunner:
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    async def schedule(self, agent: Agent, kind: DeploymentJobKindEnum) -> DeploymentJob:
+        async with coordinator.lock(LOCK_AGENT_DEPLOYMENTS, agent.pk):
+            if await DeploymentJob.filter(agent_id=agent.pk, status__in=ACTIVE_STATUSES).exists():
+                raise JobConflict('Agent already has a deployment job in progress')
+
+            job = await DeploymentJob.create(
+                agent=agent,
+                kind=kind,
+                steps=[
+                    {
+                        'name': name,
+                        'status': DeploymentJobStatusEnum.PENDING.value,
+                        'started_at': None,
+                        'finished_at': None,
+                        'duration': None,
+                        'error': None,
+                    }
+                    for name, _ in STEPS[kind]
+                ],
+            )
+
+        self.submit(job.pk)
+
+        return job
+
+    async def wait(self, job_id: int) -> DeploymentJob:
+        while True:
+            task = self._tasks.get(job_id)
+
+            if task is not None:
+                await asyncio.gather(task, return_exceptions=True)
+
+            job = await DeploymentJob.get(pk=job_id)
+
+            # Another worker may have claimed the job
+            if job.status not in ACTIVE_STATUSES:
+                return job
+
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    def submit(self, job_id: int):
+        if job_id in self._tasks:
+            return
+
+        task = asyncio.create_task(self._run(job_id))
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        self._tasks[job_id] = task
+
+    async def _run(self, job_id: int):
+        while True:
+            async with self._semaphore:
+                connected = not coordinator.enabled or coordinator.connected
+
+                if await coordinator.try_lock(LOCK_DEPLOYMENT_JOB, job_id):
+                    try:
+                        await self._run_locked(job_id)
+                    finally:
+                        await coordinator.unlock(LOCK_DEPLOYMENT_JOB, job_id)
+
+                    return
+
+            # The lock is held by another worker unless it could not be checked at all
+            if connected:
+                return
+
+            await asyncio.sleep(coordinator.reconnect_interval)
+
+    async def _run_locked(self, job_id: int):
+        job = await DeploymentJob.get_or_none(pk=job_id).prefetch_related('agent__subnet')
+
+        if job is None or job.status not in ACTIVE_STATUSES:
+            return
+
+        if job.agent is None:
+            job.status = DeploymentJobStatusEnum.FAILED
+            job.error = 'Agent was deleted before the job finished'
+            job.finished_at = timezone.now()
+            await job.save()
+            return
+
+        job.status = DeploymentJobStatusEnum.RUNNING
+        job.started_at = job.started_at or timezone.now()
+        await job.save()
+
+        handlers = dict(STEPS[job.kind])
+
+        for step in job.steps:
+            if step['status'] == DeploymentJobStatusEnum.DONE.value:
+                continue
+
+            step['status'] = DeploymentJobStatusEnum.RUNNING.value
+            step['started_at'] = timezone.now().isoformat()
+            step['error'] = None
+            await job.save()
+
+            started_at = monotonic()
+
+            try:
+                await handlers[step['name']](job)
+            except Exception as e:
+                logger.exception('Deployment job %s failed at step %s', job.pk, step['name'])
+
+                step['status'] = DeploymentJobStatusEnum.FAILED.value
+                job.status = DeploymentJobStatusEnum.FAILED
+                job.error = str(e)
+            else:
+                step['status'] = DeploymentJobStatusEnum.DONE.value
+
+            step['finished_at'] = timezone.now().isoformat()
+            step['duration'] = monotonic() - started_at
+
+            DEPLOYMENT_STEP_DURATION.observe(
+                step['duration'],
+                kind=job.kind.value,
+                step=step['name'],
+                status=step['status'],
+            )
+
+            if job.status == DeploymentJobStatusEnum.FAILED:
+                job.finished_at = timezone.now()
+                await job.save()
+                return
+
+            await job.save()
+
+        job.status = DeploymentJobStatusEnum.DONE
+        job.finished_at = timezone.now()
+        await job.save()
+
+    async def start(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        for job_id in await DeploymentJob.filter(status__in=ACTIVE_STATUSES).order_by('id').values_list('id', flat=True):
+            self.submit(job_id)
+
+    async def join(self):
+        while self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+        self._tasks = {}
+
+
+deployment_runner = DeploymentRunner(DEPLOY_CONCURRENCY)
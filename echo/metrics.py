@@ -0,0 +1,391 @@
+import asyncio
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from math import inf
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Iterator, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from echo.config import METRICS_LOOP_LAG_INTERVAL
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250)
+QUERY_METHODS = ['execute_insert', 'execute_many', 'execute_query', 'execute_query_dict', 'execute_script']
+
+
+def _format_value(value: float) -> str:
+    if value == inf:
+        return '+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ''
+
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + '}'
+
+
+def _add_labels(labels: str, const_labels: str) -> str:
+    if not const_labels:
+        return labels
+
+    if not labels:
+        return '{' + const_labels + '}'
+
+    return f'{labels[:-1]},{const_labels}}}'
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+
+        self._lock = Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[name] for name in self.labels)
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self, const_labels: str = '') -> list[str]:
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type}',
+            *(
+                f'{self.name}{suffix}{_add_labels(labels, const_labels)} {_format_value(value)}'
+                for suffix, labels, value in self.samples()
+            ),
+        ]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), function: Optional[Callable] = None):
+        super().__init__(name, documentation, labels)
+
+        self._function = function
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        if self._function is not None:
+            yield '', '', self._function()
+            return
+
+        for key, value in list(self._values.items()):
+            yield '', _format_labels(self.labels, key), value
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+
+        self.buckets = (*buckets, inf)
+
+        self._values: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * len(self.buckets), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started_at = perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started_at, **labels)
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        for key, (counts, total) in list(self._values.items()):
+            cumulative = 0
+
+            for bucket, count in zip(self.buckets, counts):
+                cumulative += count
+                yield '_bucket', _format_labels((*self.labels, 'le'), (*key, _format_value(bucket))), cumulative
+
+            labels = _format_labels(self.labels, key)
+
+            yield '_sum', labels, total[0]
+            yield '_count', labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+
+        self._metrics[metric.name] = metric
+
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self, **const_labels: str) -> str:
+        labels = _format_labels(tuple(const_labels), tuple(const_labels.values()))[1:-1]
+
+        return '\n'.join(line for metric in self._metrics.values() for line in metric.render(labels)) + '\n'
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.histogram(
+    'echo_http_request_duration_seconds',
+    'HTTP request latency by route',
+    ('method', 'route', 'status'),
+)
+REQUEST_QUERIES = registry.histogram(
+    'echo_http_request_db_queries',
+    'Database queries issued while handling an HTTP request',
+    ('method', 'route'),
+    COUNT_BUCKETS,
+)
+REQUEST_QUERY_DURATION = registry.histogram(
+    'echo_http_request_db_duration_seconds',
+    'Time spent in database queries while handling an HTTP request',
+    ('method', 'route'),
+)
+QUERY_DURATION = registry.histogram('echo_db_query_duration_seconds', 'Database query latency', ('operation',))
+INGEST_STAGE_DURATION = registry.histogram(
+    'echo_ingest_stage_duration_seconds',
+    'Scan ingest time by stage',
+    ('stage',),
+)
+INGEST_QUEUE_WAIT = registry.histogram('echo_ingest_queue_wait_seconds', 'Time scan reports wait in the ingest queue')
+DEPLOY_OPERATION_DURATION = registry.histogram(
+    'echo_deploy_operation_duration_seconds',
+    'Duration of blocking deployment operations',
+    ('operation',),
+)
+DEPLOYMENT_STEP_DURATION = registry.histogram(
+    'echo_deployment_step_duration_seconds',
+    'Deployment job step duration',
+    ('kind', 'step', 'status'),
+)
+LOOP_LAG = registry.histogram('echo_event_loop_lag_seconds', 'Event loop scheduling lag')
+DB_POOL_SIZE = registry.gauge('echo_db_pool_size', 'Configured database pool size', ('connection', 'bound'))
+DB_POOL_IN_USE = registry.gauge('echo_db_pool_connections_in_use', 'Database connections checked out', ('connection',))
+DB_POOL_WAITING = registry.gauge(
+    'echo_db_pool_waiting',
+    'Tasks waiting for a database connection',
+    ('connection',),
+)
+DB_POOL_ACQUIRE_DURATION = registry.histogram(
+    'echo_db_pool_acquire_duration_seconds',
+    'Time spent waiting for a database connection',
+    ('connection',),
+)
+DB_POOL_TIMEOUTS = registry.counter(
+    'echo_db_pool_timeouts_total',
+    'Database connection acquisitions that timed out',
+    ('connection',),
+)
+
+
+class QueryStats:
+    __slots__ = ('count', 'duration')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+class QueryLog:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.queries: list[tuple[str, str, float]] = []
+        self.dropped = 0
+
+    def add(self, operation: str, query: str, duration: float):
+        if len(self.queries) < self.limit:
+            self.queries.append((operation, query, duration))
+        else:
+            self.dropped += 1
+
+
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar('query_stats', default=None)
+_query_log: ContextVar[Optional[QueryLog]] = ContextVar('query_log', default=None)
+
+
+@contextmanager
+def capture_queries(limit: int) -> Iterator[QueryLog]:
+    log = QueryLog(limit)
+    token = _query_log.set(log)
+
+    try:
+        yield log
+    finally:
+        _query_log.reset(token)
+
+
+def _timed_query(operation: str, method: Callable) -> Callable:
+    @wraps(method)
+    async def wrapper(*args, **kwargs):
+        started_at = perf_counter()
+
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            duration = perf_counter() - started_at
+            QUERY_DURATION.observe(duration, operation=operation)
+
+            stats = _query_stats.get()
+
+            if stats is not None:
+                stats.count += 1
+                stats.duration += duration
+
+            log = _query_log.get()
+
+            if log is not None:
+                log.add(operation, args[1] if len(args) > 1 else kwargs.get('query'), duration)
+
+    wrapper.instrumented = True
+
+    return wrapper
+
+
+def _subclasses(cls: type) -> Iterator[type]:
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _subclasses(subclass)
+
+
+def instrument_db(connection: BaseDBAsyncClient):
+    client_class = type(connection)
+
+    for cls in [client_class, *_subclasses(client_class)]:
+        for name in QUERY_METHODS:
+            method = cls.__dict__.get(name)
+
+            if method is not None and not getattr(method, 'instrumented', False):
+                setattr(cls, name, _timed_query(name.replace('execute_', ''), method))
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+        self._routes: dict[Callable, str] = {}
+
+    def _route(self, scope: Scope) -> str:
+        endpoint = scope.get('endpoint')
+
+        if endpoint is None:
+            return 'unmatched'
+
+        if endpoint not in self._routes:
+            self._routes = {
+                route.endpoint: route.path for route in scope['app'].routes if hasattr(route, 'endpoint')
+            }
+
+        return self._routes.get(endpoint, 'unmatched')
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        stats = QueryStats()
+        token = _query_stats.set(stats)
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+            await send(message)
+
+        started_at = perf_counter()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _query_stats.reset(token)
+
+            method = scope['method']
+            route = self._route(scope)
+
+            REQUEST_DURATION.observe(perf_counter() - started_at, method=method, route=route, status=status)
+            REQUEST_QUERIES.observe(stats.count, method=method, route=route)
+            REQUEST_QUERY_DURATION.observe(stats.duration, method=method, route=route)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lag = 0.0
+
+        self._task: Optional[asyncio.Task] = None
+
+    async def _measure_periodically(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            started_at = loop.time()
+            await asyncio.sleep(self.interval)
+
+            self.lag = max(0.0, loop.time() - started_at - self.interval)
+            LOOP_LAG.observe(self.lag)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._measure_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+loop_lag_monitor = LoopLagMonitor(METRICS_LOOP_LAG_INTERVAL)
@@ -0,0 +1,208 @@
+import asyncio
+from typing import Optional
+
+import ujson
+from tortoise import Tortoise
+from tortoise.exceptions import OperationalError
+from tortoise.transactions import in_transaction
+from tortoise.utils import generate_schema_for_client
+
+from echo.coordination import migration_lock
+from echo.database import database_config
+from echo.models.db import Device, DeviceLink, DevicePort, Subnet
+from echo.models.fields import pack_ipv4, pack_mac
+
+
+async def migrate_connected_with():
+    try:
+        rows = await Tortoise.get_connection('default').execute_query_dict(
+            'SELECT id, connected_with FROM device'
+        )
+    except OperationalError:
+        return
+
+    device_ids = {row['id'] for row in rows}
+    pairs = []
+
+    for row in rows:
+        connected_with = row['connected_with']
+
+        if isinstance(connected_with, (str, bytes)):
+            connected_with = ujson.loads(connected_with)
+
+        pairs.extend(
+            (row['id'], neighbour_id) for neighbour_id in connected_with or [] if neighbour_id in device_ids
+        )
+
+    async with in_transaction('default') as connection:
+        await DeviceLink.link(pairs, using_db=connection)
+        await connection.execute_script('ALTER TABLE device DROP COLUMN connected_with')
+
+
+async def add_device_status_columns():
+    connection = Tortoise.get_connection('default')
+
+    try:
+        await connection.execute_query('SELECT status, status_changed_at FROM device LIMIT 1')
+        return
+    except OperationalError:
+        pass
+
+    datetime_type = 'TIMESTAMPTZ' if connection.capabilities.dialect == 'postgres' else 'TIMESTAMP'
+
+    async with in_transaction('default') as connection:
+        await connection.execute_script('ALTER TABLE device ADD COLUMN status VARCHAR(4)')
+        await connection.execute_script(f'ALTER TABLE device ADD COLUMN status_changed_at {datetime_type}')
+
+
+async def column_type(table: str, column: str) -> Optional[str]:
+    connection = Tortoise.get_connection('default')
+
+    if connection.capabilities.dialect == 'postgres':
+        rows = await connection.execute_query_dict(
+            'SELECT data_type AS type FROM information_schema.columns WHERE table_name = $1 AND column_name = $2',
+            [table, column],
+        )
+    else:
+        rows = [row for row in await connection.execute_query_dict(f'PRAGMA table_info({table})') if row['name'] == column]
+
+    return rows[0]['type'].lower() if rows else None
+
+
+async def add_subnet_range_columns():
+    if await column_type('subnet', 'first_address') is None:
+        async with in_transaction('default') as connection:
+            await connection.execute_script('ALTER TABLE subnet ADD COLUMN first_address BIGINT')
+            await connection.execute_script('ALTER TABLE subnet ADD COLUMN last_address BIGINT')
+
+    async with in_transaction('default') as connection:
+        for subnet in await Subnet.filter(first_address__isnull=True).using_db(connection):
+            await subnet.save(using_db=connection, update_fields=['first_address', 'last_address'])
+
+
+def _pack_device_row(row: dict) -> dict:
+    try:
+        mac = pack_mac(row['mac']) if row['mac'] else None
+    except ValueError:
+        mac = None
+
+    return {**row, 'address': pack_ipv4(row['address']), 'mac': mac}
+
+
+async def _rebuild_sqlite_device_table():
+    connection = Tortoise.get_connection('default')
+    table_sql = connection.schema_generator(connection)._get_table_sql(Device, safe=False)['table_creation_string']
+
+    await connection.execute_script('PRAGMA foreign_keys = OFF')
+    await connection.execute_script('PRAGMA legacy_alter_table = ON')
+
+    try:
+        async with in_transaction('default') as connection:
+            await connection.execute_script('ALTER TABLE device RENAME TO _device_old')
+
+            for row in await connection.execute_query_dict(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = '_device_old' AND sql IS NOT NULL"
+            ):
+                await connection.execute_script(f'DROP INDEX "{row["name"]}"')
+
+            await connection.execute_script(table_sql)
+
+            rows = [_pack_device_row(row) for row in await connection.execute_query_dict('SELECT * FROM _device_old')]
+
+            if rows:
+                columns = list(rows[0])
+                await connection.execute_many(
+                    f'INSERT INTO device ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                    [[row[column] for column in columns] for row in rows],
+                )
+
+            await connection.execute_script('DROP TABLE _device_old')
+    finally:
+        connection = Tortoise.get_connection('default')
+        await connection.execute_script('PRAGMA legacy_alter_table = OFF')
+        await connection.execute_script('PRAGMA foreign_keys = ON')
+
+
+async def pack_device_addresses():
+    if await column_type('device', 'address') in ('bigint', None):
+        return
+
+    connection = Tortoise.get_connection('default')
+
+    if connection.capabilities.dialect != 'postgres':
+        await _rebuild_sqlite_device_table()
+        return
+
+    async with in_transaction('default') as connection:
+        await connection.execute_script('DROP INDEX IF EXISTS idx_device_address_pattern')
+        await connection.execute_script(
+            "ALTER TABLE device ALTER COLUMN address TYPE BIGINT USING (address::inet - '0.0.0.0'::inet)"
+        )
+        # Like _pack_device_row, legacy values that are not a valid MAC address become NULL
+        await connection.execute_script(
+            "ALTER TABLE device ALTER COLUMN mac TYPE BYTEA USING CASE"
+            " WHEN translate(mac, ':-', '') ~* '^[0-9a-f]{12}$' THEN decode(translate(mac, ':-', ''), 'hex')"
+            " END"
+        )
+
+
+async def backfill_device_ports():
+    if await DevicePort.exists() or not await Device.exists():
+        return
+
+    async with in_transaction('default') as connection:
+        await DevicePort.replace(await Device.all().using_db(connection), using_db=connection)
+
+
+async def ensure_indexes():
+    connection = Tortoise.get_connection('default')
+
+    statements = [
+        'CREATE INDEX IF NOT EXISTS idx_device_subnet_id_id ON device (subnet_id, id)',
+        'CREATE INDEX IF NOT EXISTS idx_device_type_id ON device (type, id)',
+        'CREATE INDEX IF NOT EXISTS idx_deviceport_port_device_id ON deviceport (port, device_id)',
+        'CREATE INDEX IF NOT EXISTS idx_device_status_id ON device (status, id)',
+        'CREATE INDEX IF NOT EXISTS idx_subnet_first_address_last_address ON subnet (first_address, last_address)',
+        'CREATE INDEX IF NOT EXISTS idx_scanunit_status_not_before ON scanunit (status, not_before)',
+        'CREATE INDEX IF NOT EXISTS idx_scanunit_round_id_status ON scanunit (round_id, status)',
+        'CREATE INDEX IF NOT EXISTS idx_devicestatussample_device_id_observed_at '
+        'ON devicestatussample (device_id, observed_at)',
+        'CREATE INDEX IF NOT EXISTS idx_devicestatusperiod_device_id_ended_at '
+        'ON devicestatusperiod (device_id, ended_at)',
+    ]
+
+    if connection.capabilities.dialect == 'postgres':
+        statements.append(
+            'CREATE INDEX IF NOT EXISTS idx_devicestatussample_observed_at ON devicestatussample USING brin (observed_at)'
+        )
+
+    for statement in statements:
+        await connection.execute_script(statement)
+
+
+async def migrate():
+    await migrate_connected_with()
+    await add_device_status_columns()
+    await add_subnet_range_columns()
+    await pack_device_addresses()
+    await backfill_device_ports()
+    await ensure_indexes()
+
+
+async def upgrade():
+    async with migration_lock():
+        await generate_schema_for_client(Tortoise.get_connection('default'), safe=True)
+        await migrate()
+
+
+async def main():
+    await Tortoise.init(config=database_config())
+
+    try:
+        await upgrade()
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
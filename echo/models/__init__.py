@@ -32,3 +32,39 @@ class DeviceTypeEnum(SerializableEnum):
 class DeviceStatusEnum(SerializableEnum):
     DOWN = 'down'
     UP = 'up'
+
+
+class DeploymentJobKindEnum(SerializableEnum):
+    DEPLOY = 'deploy'
+    DESTROY = 'destroy'
+    INSTALL = 'install'
+    CONFIG = 'config'
+
+
+class DeploymentJobStatusEnum(SerializableEnum):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+class ProfilingModeEnum(SerializableEnum):
+    SAMPLE = 'sample'
+    CPROFILE = 'cprofile'
+
+
+class FleetOperationEnum(SerializableEnum):
+    CONFIG = 'config'
+    DEPLOY = 'deploy'
+    DESTROY = 'destroy'
+
+
+class ScanRoundStatusEnum(SerializableEnum):
+    RUNNING = 'running'
+    DONE = 'done'
+
+
+class ScanUnitStatusEnum(SerializableEnum):
+    PENDING = 'pending'
+    LEASED = 'leased'
+    DONE = 'done'
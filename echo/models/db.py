@@ -1,8 +1,21 @@
+from ipaddress import IPv4Network
+from typing import Iterable, Optional
+
 from passlib.context import CryptContext
 from tortoise import Model, fields
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.query_utils import Q
 import ujson
 
-from echo.models import DeviceTypeEnum
+from echo.models import (
+    DeploymentJobKindEnum,
+    DeploymentJobStatusEnum,
+    DeviceStatusEnum,
+    DeviceTypeEnum,
+    ScanRoundStatusEnum,
+    ScanUnitStatusEnum,
+)
+from echo.models.fields import IPv4Field, MACField
 
 
 crypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
@@ -11,6 +24,18 @@ crypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 class Subnet(Model):
     cidr = fields.CharField(max_length=18, unique=True)
     gateway_address = fields.CharField(max_length=15)
+    first_address = fields.BigIntField(null=True)
+    last_address = fields.BigIntField(null=True)
+
+    def compute_range(self):
+        network = IPv4Network(self.cidr)
+
+        self.first_address = int(network.network_address)
+        self.last_address = int(network.broadcast_address)
+
+    async def save(self, *args, **kwargs):
+        self.compute_range()
+        await super().save(*args, **kwargs)
 
 
 class Agent(Model):
@@ -21,6 +46,56 @@ class Agent(Model):
     password = fields.CharField(max_length=64)
 
 
+class ScanSnapshot(Model):
+    agent = fields.OneToOneField(model_name='models.Agent', related_name='scan_snapshot', on_delete=fields.CASCADE)
+    generation = fields.IntField(default=0)
+    digest = fields.CharField(max_length=40)
+    devices = fields.JSONField(encoder=ujson.dumps, decoder=ujson.loads)
+
+
+class ScanRound(Model):
+    subnet = fields.ForeignKeyField(model_name='models.Subnet', related_name='scan_rounds', on_delete=fields.CASCADE)
+    status = fields.CharEnumField(enum_type=ScanRoundStatusEnum, default=ScanRoundStatusEnum.RUNNING)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    finished_at = fields.DatetimeField(null=True)
+
+
+class ScanUnit(Model):
+    round = fields.ForeignKeyField(model_name='models.ScanRound', related_name='units', on_delete=fields.CASCADE)
+    first_address = fields.BigIntField()
+    last_address = fields.BigIntField()
+    ports = fields.JSONField(encoder=ujson.dumps, decoder=ujson.loads)
+    status = fields.CharEnumField(enum_type=ScanUnitStatusEnum, default=ScanUnitStatusEnum.PENDING)
+    agent = fields.ForeignKeyField(
+        model_name='models.Agent',
+        related_name='scan_units',
+        null=True,
+        on_delete=fields.SET_NULL,
+    )
+    not_before = fields.DatetimeField()
+    lease_expires_at = fields.DatetimeField(null=True)
+    attempts = fields.IntField(default=0)
+    devices = fields.JSONField(encoder=ujson.dumps, decoder=ujson.loads, null=True)
+    finished_at = fields.DatetimeField(null=True)
+
+
+class DeploymentJob(Model):
+    agent = fields.ForeignKeyField(
+        model_name='models.Agent',
+        related_name='deployments',
+        null=True,
+        on_delete=fields.SET_NULL,
+    )
+    kind = fields.CharEnumField(enum_type=DeploymentJobKindEnum)
+    status = fields.CharEnumField(enum_type=DeploymentJobStatusEnum, default=DeploymentJobStatusEnum.PENDING)
+    steps = fields.JSONField(encoder=ujson.dumps, decoder=ujson.loads)
+    context = fields.JSONField(encoder=ujson.dumps, decoder=ujson.loads, default=dict)
+    error = fields.TextField(null=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    started_at = fields.DatetimeField(null=True)
+    finished_at = fields.DatetimeField(null=True)
+
+
 class Device(Model):
     subnet = fields.ForeignKeyField(
         model_name='models.Subnet',
@@ -29,12 +104,123 @@ class Device(Model):
         on_delete=fields.RESTRICT,
     )
     hostname = fields.CharField(max_length=255, default='')
-    address = fields.CharField(max_length=15, unique=True)
-    mac = fields.CharField(max_length=17, null=True)
+    address = IPv4Field(unique=True)
+    mac = MACField(null=True)
     name = fields.CharField(max_length=64, default='')
     type = fields.CharEnumField(enum_type=DeviceTypeEnum)
     connection_options = fields.JSONField(encoder=ujson.dumps, decoder=ujson.loads)
-    connected_with = fields.JSONField(encoder=ujson.dumps, decoder=ujson.loads)
+    status = fields.CharEnumField(enum_type=DeviceStatusEnum, null=True)
+    status_changed_at = fields.DatetimeField(null=True)
+
+    connected_with: Iterable[int] = ()
+
+
+class DevicePort(Model):
+    device = fields.ForeignKeyField(model_name='models.Device', related_name='ports', on_delete=fields.CASCADE)
+    port = fields.IntField()
+
+    class Meta:
+        unique_together = (('device', 'port'),)
+
+    @classmethod
+    async def replace(cls, devices: list[Device], using_db: Optional[BaseDBAsyncClient] = None):
+        if not devices:
+            return
+
+        db = using_db or cls._choose_db(True)
+
+        await cls.filter(device_id__in=[device.pk for device in devices]).using_db(db).delete()
+        await cls.bulk_create(
+            [
+                cls(device_id=device.pk, port=port)
+                for device in devices
+                for port in {port for _, port in device.connection_options or []}
+            ],
+            using_db=db,
+        )
+
+
+class DeviceLink(Model):
+    a = fields.ForeignKeyField(model_name='models.Device', related_name='links_a', on_delete=fields.CASCADE)
+    b = fields.ForeignKeyField(model_name='models.Device', related_name='links_b', on_delete=fields.CASCADE, index=True)
+
+    class Meta:
+        unique_together = (('a', 'b'),)
+
+    @staticmethod
+    def normalize(pairs: Iterable[tuple[int, int]]) -> set[tuple[int, int]]:
+        return {(min(a, b), max(a, b)) for a, b in pairs if a != b}
+
+    @classmethod
+    async def link(
+        cls,
+        pairs: Iterable[tuple[int, int]],
+        using_db: Optional[BaseDBAsyncClient] = None,
+    ) -> set[tuple[int, int]]:
+        edges = cls.normalize(pairs)
+
+        if not edges:
+            return edges
+
+        db = using_db or cls._choose_db(True)
+        executor = db.executor_class(model=cls, db=db)
+
+        await db.execute_many(
+            f'INSERT INTO "{cls._meta.db_table}" ("a_id", "b_id") '
+            f'VALUES ({executor.parameter(0).get_sql()}, {executor.parameter(1).get_sql()}) '
+            'ON CONFLICT DO NOTHING',
+            [list(edge) for edge in sorted(edges)],
+        )
+
+        return edges
+
+    @classmethod
+    async def neighbours(cls, device_ids: Optional[Iterable[int]] = None) -> dict[int, list[int]]:
+        connection = cls._choose_db()
+
+        if device_ids is None:
+            pairs = await cls.all().using_db(connection).values_list('a_id', 'b_id')
+        elif connection.capabilities.dialect == 'postgres':
+            # One array parameter keeps the statement text stable for any number of devices
+            rows = await connection.execute_query_dict(
+                'SELECT "a_id", "b_id" FROM "devicelink" WHERE "a_id" = ANY($1::int[]) OR "b_id" = ANY($1::int[])',
+                [list(device_ids)],
+            )
+            pairs = [(row['a_id'], row['b_id']) for row in rows]
+        else:
+            device_ids = list(device_ids)
+            pairs = await cls.filter(Q(a_id__in=device_ids) | Q(b_id__in=device_ids)).values_list('a_id', 'b_id')
+
+        neighbours = {}
+
+        for a, b in pairs:
+            neighbours.setdefault(a, []).append(b)
+            neighbours.setdefault(b, []).append(a)
+
+        return neighbours
+
+    @classmethod
+    async def fetch_connected_with(cls, devices: list[Device]):
+        if not devices:
+            return
+
+        neighbours = await cls.neighbours([device.pk for device in devices])
+
+        for device in devices:
+            device.connected_with = sorted(neighbours.get(device.pk, []))
+
+
+class DeviceStatusSample(Model):
+    device = fields.ForeignKeyField(model_name='models.Device', related_name='status_samples', on_delete=fields.CASCADE)
+    status = fields.CharEnumField(enum_type=DeviceStatusEnum)
+    observed_at = fields.DatetimeField()
+
+
+class DeviceStatusPeriod(Model):
+    device = fields.ForeignKeyField(model_name='models.Device', related_name='status_periods', on_delete=fields.CASCADE)
+    status = fields.CharEnumField(enum_type=DeviceStatusEnum)
+    started_at = fields.DatetimeField()
+    ended_at = fields.DatetimeField()
 
 
 class User(Model):
@@ -47,6 +233,10 @@ class User(Model):
     def verify_password(plain_password: str, hashed_password: str) -> bool:
         return crypt_context.verify(plain_password, hashed_password)
 
+    @staticmethod
+    def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        return crypt_context.verify_and_update(plain_password, hashed_password)
+
     @staticmethod
     def get_password_hash(plain_password: str) -> str:
         return crypt_context.hash(plain_password)
@@ -0,0 +1,95 @@
+from ipaddress import IPv4Network
+from socket import AF_INET, inet_ntop, inet_pton
+from typing import Any, Optional, Union
+
+from tortoise.fields import Field
+
+
+def pack_ipv4(address: str) -> int:
+    return int.from_bytes(inet_pton(AF_INET, address), 'big')
+
+
+def unpack_ipv4(value: int) -> str:
+    return inet_ntop(AF_INET, value.to_bytes(4, 'big'))
+
+
+def ipv4_prefix_ranges(prefix: str) -> list[tuple[int, int]]:
+    if '/' in prefix:
+        try:
+            network = IPv4Network(prefix, strict=False)
+        except ValueError:
+            return []
+
+        return [(int(network.network_address), int(network.broadcast_address))]
+
+    *octets, partial = prefix.split('.')
+
+    if len(octets) > 3 or not all(octet.isdigit() and str(int(octet)) == octet and int(octet) < 256 for octet in octets):
+        return []
+
+    base = 0
+
+    for octet in octets:
+        base = base << 8 | int(octet)
+
+    shift = 8 * (3 - len(octets))
+    values = [value for value in range(256) if str(value).startswith(partial)]
+    ranges = []
+
+    for value in values:
+        first = (base << 8 | value) << shift
+
+        if ranges and ranges[-1][1] + 1 == first:
+            ranges[-1] = (ranges[-1][0], first + (1 << shift) - 1)
+        else:
+            ranges.append((first, first + (1 << shift) - 1))
+
+    return ranges
+
+
+def pack_mac(mac: str) -> bytes:
+    packed = bytes.fromhex(mac.replace(':', '').replace('-', ''))
+
+    if len(packed) != 6:
+        raise ValueError(f'Invalid MAC address: {mac!r}')
+
+    return packed
+
+
+def unpack_mac(value: bytes) -> str:
+    return ':'.join(f'{octet:02x}' for octet in value)
+
+
+class IPv4Field(Field, str):
+    SQL_TYPE = 'BIGINT'
+
+    def to_db_value(self, value: Any, instance: Any) -> Optional[int]:
+        if value is None or isinstance(value, int):
+            return value
+
+        return pack_ipv4(str(value))
+
+    def to_python_value(self, value: Union[int, str, None]) -> Optional[str]:
+        if value is None or isinstance(value, str):
+            return value
+
+        return unpack_ipv4(int(value))
+
+
+class MACField(Field, str):
+    SQL_TYPE = 'BLOB'
+
+    class _db_postgres:
+        SQL_TYPE = 'BYTEA'
+
+    def to_db_value(self, value: Any, instance: Any) -> Optional[bytes]:
+        if value is None or isinstance(value, bytes):
+            return value
+
+        return pack_mac(value)
+
+    def to_python_value(self, value: Union[bytes, str, None]) -> Optional[str]:
+        if value is None or isinstance(value, str):
+            return value
+
+        return unpack_mac(bytes(value))
@@ -1,9 +1,19 @@
+from datetime import datetime
 from ipaddress import IPv4Address, IPv4Network
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, confloat, conint, validator
 
-from echo.models import DeviceTypeEnum, DeviceConnectionOption
+from echo.config import FLEET_CONCURRENCY_MAX
+from echo.models import (
+    DeploymentJobKindEnum,
+    DeploymentJobStatusEnum,
+    DeviceConnectionOption,
+    DeviceStatusEnum,
+    DeviceTypeEnum,
+    ProfilingModeEnum,
+)
+from echo.models.fields import pack_mac, unpack_mac
 
 
 class PyDeleteOut(BaseModel):
@@ -50,6 +60,46 @@ class PyAgentCreateIn(BaseModel):
     password: str
 
 
+class PyFleetIn(BaseModel):
+    agent_ids: Optional[list[int]]
+    concurrency: Optional[conint(gt=0, le=FLEET_CONCURRENCY_MAX)]
+
+
+class PyFleetResult(BaseModel):
+    agent_id: int
+    ok: bool
+    error: Optional[str]
+    duration: float
+
+
+class PyDeploymentStep(BaseModel):
+    name: str
+    status: DeploymentJobStatusEnum
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    duration: Optional[float]
+    error: Optional[str]
+
+    class Config:
+        use_enum_values = True
+
+
+class PyDeploymentJob(BaseModel):
+    pk: int
+    agent_id: Optional[int]
+    kind: DeploymentJobKindEnum
+    status: DeploymentJobStatusEnum
+    steps: list[PyDeploymentStep]
+    error: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+    class Config:
+        orm_mode = True
+        use_enum_values = True
+
+
 class PyDevice(BaseModel):
     pk: int
     subnet: Optional[PySubnet]
@@ -60,12 +110,42 @@ class PyDevice(BaseModel):
     type: DeviceTypeEnum
     connection_options: list[DeviceConnectionOption]
     connected_with: list[int]
+    status: Optional[DeviceStatusEnum]
 
     class Config:
         orm_mode = True
         use_enum_values = True
 
 
+class PyDeviceStatus(BaseModel):
+    device_id: int
+    status: Optional[DeviceStatusEnum]
+    since: Optional[datetime]
+    last_observed_at: Optional[datetime]
+
+    class Config:
+        use_enum_values = True
+
+
+class PyDeviceUptime(BaseModel):
+    device_id: int
+    start: datetime
+    end: datetime
+    up: float
+    down: float
+    unknown: float
+    uptime: Optional[float]
+
+
+class PyDeviceStatusTransition(BaseModel):
+    at: datetime
+    previous: DeviceStatusEnum
+    status: DeviceStatusEnum
+
+    class Config:
+        use_enum_values = True
+
+
 class PyDeviceCreateIn(BaseModel):
     subnet_id: int
     hostname: Optional[str]
@@ -79,6 +159,10 @@ class PyDeviceCreateIn(BaseModel):
     class Config:
         use_enum_values = True
 
+    @validator('mac')
+    def validate_mac(cls, mac: Optional[str]) -> Optional[str]:
+        return unpack_mac(pack_mac(mac)) if mac else None
+
 
 class PyDeviceUpdateIn(BaseModel):
     name: Optional[str]
@@ -93,22 +177,61 @@ class PyDeviceTraced(BaseModel):
     ports: list[tuple[str, int]]
 
 
-class PyDeviceFromScanIn(BaseModel):
-    ip: IPv4Address
-    mac: str
-    ports: list[tuple[str, int]]
-    is_gateway: bool
-
-
-class PyFromScanIn(BaseModel):
-    agent_token: str
-    devices: list[PyDeviceFromScanIn]
-
-
 class PyFromScanOut(BaseModel):
     created: int
     changed: int
     not_changed: int
+    vanished: list[int]
+
+
+class PyFromScanQueued(BaseModel):
+    queue_length: int
+    generation: int
+    digest: str
+
+
+class PyIngestStats(BaseModel):
+    workers: int
+    max_size: int
+    length: int
+    in_progress: int
+    processed: int
+    failed: int
+    coalesced: int
+    rejected: int
+    avg_wait_time: float
+    avg_process_time: float
+    max_process_time: float
+
+
+class PyScanLease(BaseModel):
+    pk: int
+    first_address: IPv4Address
+    last_address: IPv4Address
+    ports: dict[str, str]
+    lease_expires_at: datetime
+
+
+class PyScanUnitDone(BaseModel):
+    pk: int
+    devices: int
+    round_complete: bool
+
+
+class PySchedulerStats(BaseModel):
+    enabled: bool
+    rounds_running: int
+    units_pending: int
+    units_leased: int
+    units_done: int
+    issued: int
+    expired: int
+    completed: int
+    merged: int
+
+
+class PyTopologyPath(BaseModel):
+    path: list[int]
 
 
 class PyUserIn(BaseModel):
@@ -128,3 +251,47 @@ class PyUserOut(BaseModel):
 
 class PyToken(BaseModel):
     access_token: str
+
+
+class PyCacheStats(BaseModel):
+    size: int
+    hits: int
+    misses: int
+    hit_rate: float
+
+
+class PyAuthCacheStats(BaseModel):
+    tokens: PyCacheStats
+    users: PyCacheStats
+
+
+class PyProfilingSettings(BaseModel):
+    sample_rate: confloat(ge=0, le=1) = 0
+    path_prefix: str = '/'
+
+
+class PyProfiledQuery(BaseModel):
+    operation: str
+    query: str
+    duration: float
+
+
+class PyProfileSummary(BaseModel):
+    pk: int
+    method: str
+    path: str
+    status: int
+    mode: ProfilingModeEnum
+    started_at: datetime
+    duration: float
+    query_count: int
+    query_duration: float
+    truncated: bool
+
+    class Config:
+        use_enum_values = True
+
+
+class PyProfile(PyProfileSummary):
+    queries: list[PyProfiledQuery]
+    dropped_queries: int
@@ -0,0 +1,281 @@
+import zlib
+from base64 import b64decode
+from binascii import Error as BinasciiError
+from socket import AF_INET, inet_ntop, inet_pton
+from typing import Any, NamedTuple, Optional
+
+import ujson
+from fastapi.requests import Request
+
+from echo.config import INGEST_MAX_BODY_SIZE
+from echo.models.fields import pack_mac, unpack_mac
+
+
+JSON_MEDIA_TYPES = {'application/json'}
+MSGPACK_MEDIA_TYPES = {'application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack'}
+TRUE_VALUES = {True, 1, '1', 'on', 't', 'true', 'y', 'yes'}
+FALSE_VALUES = {False, 0, '0', 'off', 'f', 'false', 'n', 'no'}
+
+
+class ScannedDevice(NamedTuple):
+    ip: str
+    mac: Optional[str]
+    ports: list[tuple[str, int]]
+    is_gateway: bool
+
+
+class PayloadError(Exception):
+    pass
+
+
+class UnsupportedPayload(Exception):
+    pass
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+def _inflate(body: bytes, wbits: int, max_size: int) -> bytes:
+    decompressor = zlib.decompressobj(wbits)
+
+    try:
+        data = decompressor.decompress(body, max_size + 1)
+    except zlib.error as e:
+        raise PayloadError(f'Invalid compressed body: {e}')
+
+    if len(data) > max_size or decompressor.unconsumed_tail:
+        raise PayloadTooLarge()
+
+    return data
+
+
+def _unzstd(body: bytes, max_size: int) -> bytes:
+    try:
+        import zstandard
+    except ImportError:
+        raise UnsupportedPayload('zstd request bodies require the zstandard package')
+
+    try:
+        with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+            data = reader.read(max_size + 1)
+    except zstandard.ZstdError as e:
+        raise PayloadError(f'Invalid compressed body: {e}')
+
+    if len(data) > max_size:
+        raise PayloadTooLarge()
+
+    return data
+
+
+def decompress(body: bytes, encoding: Optional[str], max_size: int = INGEST_MAX_BODY_SIZE) -> bytes:
+    encoding = (encoding or 'identity').strip().lower()
+
+    if encoding == 'identity':
+        data = body
+    elif encoding in ('gzip', 'x-gzip'):
+        data = _inflate(body, 16 + zlib.MAX_WBITS, max_size)
+    elif encoding == 'deflate':
+        data = _inflate(body, zlib.MAX_WBITS, max_size)
+    elif encoding == 'zstd':
+        data = _unzstd(body, max_size)
+    else:
+        raise UnsupportedPayload(f'Unsupported content encoding: {encoding}')
+
+    if len(data) > max_size:
+        raise PayloadTooLarge()
+
+    return data
+
+
+def parse(data: bytes, content_type: Optional[str]) -> dict:
+    media_type = (content_type or 'application/json').split(';')[0].strip().lower()
+
+    if media_type in JSON_MEDIA_TYPES:
+        try:
+            payload = ujson.loads(data)
+        except ValueError as e:
+            raise PayloadError(f'Invalid JSON body: {e}')
+    elif media_type in MSGPACK_MEDIA_TYPES:
+        try:
+            import msgpack
+        except ImportError:
+            raise UnsupportedPayload('msgpack request bodies require the msgpack package')
+
+        try:
+            payload = msgpack.unpackb(data, raw=False, strict_map_key=False)
+        except (ValueError, msgpack.UnpackException) as e:
+            raise PayloadError(f'Invalid msgpack body: {e}')
+    else:
+        raise UnsupportedPayload(f'Unsupported content type: {media_type}')
+
+    if not isinstance(payload, dict):
+        raise PayloadError('Scan payload must be an object')
+
+    return payload
+
+
+async def read_payload(request: Request) -> dict:
+    return parse(decompress(await request.body(), request.headers.get('content-encoding')), request.headers.get('content-type'))
+
+
+def canonical_ip(value: Any) -> str:
+    try:
+        return inet_ntop(AF_INET, inet_pton(AF_INET, value))
+    except (OSError, TypeError):
+        raise PayloadError(f'Invalid IPv4 address: {value!r}')
+
+
+def _bytes(value: Any, name: str) -> bytes:
+    if isinstance(value, bytes):
+        return value
+
+    if isinstance(value, str):
+        try:
+            return b64decode(value, validate=True)
+        except BinasciiError:
+            raise PayloadError(f'{name} must be base64 encoded')
+
+    raise PayloadError(f'{name} must be binary or base64 encoded')
+
+
+def canonical_mac(value: Any) -> Optional[str]:
+    if not value:
+        return None
+
+    # Unparseable addresses are stored as NULL, the same way existing rows were migrated
+    try:
+        return unpack_mac(pack_mac(str(value)))
+    except ValueError:
+        return None
+
+
+def _mac(raw: bytes) -> Optional[str]:
+    if not any(raw):
+        return None
+
+    return unpack_mac(raw)
+
+
+def _bool(value: Any, name: str) -> bool:
+    if isinstance(value, bytes):
+        value = value.decode(errors='replace')
+
+    if isinstance(value, str):
+        value = value.lower()
+
+    # Same values the original request model accepted
+    try:
+        if value in TRUE_VALUES:
+            return True
+
+        if value in FALSE_VALUES:
+            return False
+    except TypeError:
+        pass
+
+    raise PayloadError(f'{name} must be a boolean')
+
+
+def _ports(value: Any) -> list[tuple[str, int]]:
+    if not isinstance(value, list):
+        raise PayloadError('ports must be a list')
+
+    ports = []
+
+    for port in value:
+        if not isinstance(port, (list, tuple)) or len(port) != 2:
+            raise PayloadError('ports must be a list of [name, port] pairs')
+
+        name, number = port
+
+        # Numeric strings were coerced by the original request model, and existing agents still send them
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PayloadError(f'Invalid port: {port!r}')
+
+        if not isinstance(name, str) or not 0 < number < 65536:
+            raise PayloadError(f'Invalid port: {port!r}')
+
+        ports.append((name, number))
+
+    return ports
+
+
+def decode_device_list(items: Any) -> list[ScannedDevice]:
+    if not isinstance(items, list):
+        raise PayloadError('devices must be a list')
+
+    devices = []
+
+    for item in items:
+        if not isinstance(item, dict):
+            raise PayloadError('devices must be a list of objects')
+
+        devices.append(
+            ScannedDevice(
+                ip=canonical_ip(item.get('ip')),
+                mac=canonical_mac(item.get('mac')),
+                ports=_ports(item.get('ports', [])),
+                is_gateway=_bool(item.get('is_gateway', False), 'is_gateway'),
+            )
+        )
+
+    return devices
+
+
+def decode_columns(columns: Any) -> list[ScannedDevice]:
+    if not isinstance(columns, dict):
+        raise PayloadError('columns must be an object')
+
+    ips = _bytes(columns.get('ips', b''), 'ips')
+    macs = _bytes(columns.get('macs', b''), 'macs')
+    port_table = _ports(columns.get('port_table', []))
+    bitmaps = columns.get('ports')
+    gateway = columns.get('gateway')
+
+    count, remainder = divmod(len(ips), 4)
+
+    if remainder:
+        raise PayloadError('ips must be packed 32-bit addresses')
+
+    if macs and len(macs) != count * 6:
+        raise PayloadError('macs must hold one 6-byte address per device')
+
+    if bitmaps is None:
+        bitmaps = [0] * count
+    elif not isinstance(bitmaps, list) or len(bitmaps) != count or not all(isinstance(bitmap, int) for bitmap in bitmaps):
+        raise PayloadError('ports must hold one integer bitmap per device')
+
+    if gateway is not None and (not isinstance(gateway, int) or not 0 <= gateway < count):
+        raise PayloadError('gateway must be a device index')
+
+    return [
+        ScannedDevice(
+            ip=inet_ntop(AF_INET, ips[i * 4:i * 4 + 4]),
+            mac=_mac(macs[i * 6:i * 6 + 6]) if macs else None,
+            ports=[port for bit, port in enumerate(port_table) if bitmaps[i] >> bit & 1],
+            is_gateway=i == gateway,
+        )
+        for i in range(count)
+    ]
+
+
+def decode_devices(payload: dict, devices_key: str = 'devices', columns_key: str = 'columns') -> list[ScannedDevice]:
+    if columns_key in payload:
+        return decode_columns(payload[columns_key])
+
+    return decode_device_list(payload.get(devices_key, []))
+
+
+def decode_addresses(value: Any) -> list[str]:
+    if isinstance(value, list):
+        return [canonical_ip(ip) for ip in value]
+
+    packed = _bytes(value, 'removed')
+
+    if len(packed) % 4:
+        raise PayloadError('removed must be packed 32-bit addresses')
+
+    return [inet_ntop(AF_INET, packed[i:i + 4]) for i in range(0, len(packed), 4)]
@@ -0,0 +1,89 @@
+import asyncio
+from time import perf_counter
+from typing import Any
+
+import asyncpg
+from tortoise.backends.asyncpg.client import AsyncpgDBClient, TransactionWrapper
+from tortoise.backends.base.client import TransactionContextPooled
+from tortoise.transactions import current_transaction_map
+
+from echo.database import PoolTimeout
+from echo.metrics import DB_POOL_ACQUIRE_DURATION, DB_POOL_IN_USE, DB_POOL_SIZE, DB_POOL_TIMEOUTS, DB_POOL_WAITING
+
+
+class TimedPool:
+    def __init__(self, pool: asyncpg.pool.Pool, connection_name: str, timeout: float):
+        self.connection_name = connection_name
+        self.timeout = timeout
+
+        self._pool = pool
+
+        self.in_use = 0
+        self.waiting = 0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+    def _update_gauges(self):
+        DB_POOL_IN_USE.set(self.in_use, connection=self.connection_name)
+        DB_POOL_WAITING.set(self.waiting, connection=self.connection_name)
+
+    async def acquire(self) -> asyncpg.Connection:
+        self.waiting += 1
+        self._update_gauges()
+        started_at = perf_counter()
+
+        try:
+            connection = await self._pool.acquire(timeout=self.timeout)
+        except asyncio.TimeoutError:
+            DB_POOL_TIMEOUTS.inc(connection=self.connection_name)
+            raise PoolTimeout(self.connection_name, self.timeout)
+        finally:
+            self.waiting -= 1
+            DB_POOL_ACQUIRE_DURATION.observe(perf_counter() - started_at, connection=self.connection_name)
+
+        self.in_use += 1
+        self._update_gauges()
+
+        return connection
+
+    async def release(self, connection: asyncpg.Connection):
+        self.in_use -= 1
+        self._update_gauges()
+
+        await self._pool.release(connection)
+
+
+class TimedTransactionContext(TransactionContextPooled):
+    async def __aenter__(self):
+        try:
+            return await super().__aenter__()
+        except BaseException:
+            # The parent context sets the current transaction before acquiring a connection
+            current_transaction_map[self.connection_name].reset(self.token)
+
+            if self.connection._connection is not None:
+                await self.connection._parent._pool.release(self.connection._connection)
+
+            raise
+
+
+class PooledAsyncpgClient(AsyncpgDBClient):
+    def __init__(self, *args, acquire_timeout: float = 10, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.acquire_timeout = float(acquire_timeout)
+
+    async def create_connection(self, with_db: bool):
+        await super().create_connection(with_db)
+
+        self._pool = TimedPool(self._pool, self.connection_name, self.acquire_timeout)
+
+        DB_POOL_SIZE.set(self.pool_minsize, connection=self.connection_name, bound='min')
+        DB_POOL_SIZE.set(self.pool_maxsize, connection=self.connection_name, bound='max')
+
+    def _in_transaction(self) -> TimedTransactionContext:
+        return TimedTransactionContext(TransactionWrapper(self))
+
+
+client_class = PooledAsyncpgClient
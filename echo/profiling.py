@@ -0,0 +1,234 @@
+import cProfile
+import io
+import pstats
+import sys
+import threading
+from itertools import count
+from random import random
+from time import perf_counter
+from typing import Optional
+
+from fastapi import HTTPException
+from fastapi.requests import Request
+from fastapi_jwt_auth.exceptions import AuthJWTException
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from tortoise import timezone
+
+from echo.auth import authenticate
+from echo.cache import TTLCache
+from echo.config import (
+    PROFILING_MAX_CONCURRENT,
+    PROFILING_MAX_DURATION,
+    PROFILING_MAX_PROFILES,
+    PROFILING_MAX_QUERIES,
+    PROFILING_RETENTION,
+    PROFILING_SAMPLE_INTERVAL,
+)
+from echo.coordination import coordinator
+from echo.metrics import capture_queries
+from echo.models import ProfilingModeEnum
+from echo.models.pydantic import PyProfile, PyProfiledQuery, PyProfileSummary, PyProfilingSettings
+
+
+PROFILE_HEADER = 'x-profile'
+PROFILE_ID_HEADER = b'x-profile-id'
+CPROFILE_LINES = 100
+
+
+def _full_path(scope: Scope) -> str:
+    if scope.get('query_string'):
+        return f'{scope["path"]}?{scope["query_string"].decode("latin-1")}'
+
+    return scope['path']
+
+
+class StackSampler:
+    def __init__(self, interval: float, max_duration: float):
+        self.interval = interval
+        self.max_duration = max_duration
+        self.truncated = False
+
+        self._thread_id = threading.get_ident()
+        self._stacks: dict[str, int] = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='echo-profiler', daemon=True)
+
+    def _sample(self):
+        deadline = perf_counter() + self.max_duration
+
+        while not self._stopped.wait(self.interval):
+            if perf_counter() > deadline:
+                self.truncated = True
+                return
+
+            frame = sys._current_frames().get(self._thread_id)  # noqa
+            stack = []
+
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                frame = frame.f_back
+
+            key = ';'.join(reversed(stack))
+            self._stacks[key] = self._stacks.get(key, 0) + 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stopped.set()
+        self._thread.join()
+
+        return ''.join(f'{stack} {samples}\n' for stack, samples in sorted(self._stacks.items()))
+
+
+class FunctionProfiler:
+    truncated = False
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self) -> str:
+        self._profile.disable()
+
+        output = io.StringIO()
+        pstats.Stats(self._profile, stream=output).sort_stats('cumulative').print_stats(CPROFILE_LINES)
+
+        return output.getvalue()
+
+
+class Profiler:
+    def __init__(self, max_profiles: int, retention: float, max_concurrent: int):
+        self.max_concurrent = max_concurrent
+        self.settings = PyProfilingSettings()
+
+        self._profiles = TTLCache(max_profiles, retention)
+        self._ids = count(1)
+        self._running = 0
+        self._cprofile_running = False
+
+    def update_settings(self, settings: PyProfilingSettings):
+        self.settings = settings
+
+        coordinator.publish('profiling', [settings.dict()])
+
+    def apply_settings(self, items: list[dict]):
+        self.settings = PyProfilingSettings(**items[-1])
+
+    async def requested_mode(self, scope: Scope) -> Optional[ProfilingModeEnum]:
+        if self._running >= self.max_concurrent:
+            return None
+
+        header = Headers(scope=scope).get(PROFILE_HEADER)
+
+        if header is not None:
+            try:
+                mode = ProfilingModeEnum(header or ProfilingModeEnum.SAMPLE.value)
+                await authenticate(Request(scope))
+            except (ValueError, HTTPException, AuthJWTException):
+                return None
+        elif self.settings.sample_rate and scope['path'].startswith(self.settings.path_prefix):
+            if random() >= self.settings.sample_rate:
+                return None
+
+            mode = ProfilingModeEnum.SAMPLE
+        else:
+            return None
+
+        if mode is ProfilingModeEnum.CPROFILE and self._cprofile_running:
+            return None
+
+        return mode
+
+    async def profile(self, mode: ProfilingModeEnum, scope: Scope, receive: Receive, send: Send, app: ASGIApp):
+        profile_id = next(self._ids)
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                message['headers'] = [*message.get('headers', []), (PROFILE_ID_HEADER, str(profile_id).encode())]
+
+            await send(message)
+
+        if mode is ProfilingModeEnum.CPROFILE:
+            collector = FunctionProfiler()
+            self._cprofile_running = True
+        else:
+            collector = StackSampler(PROFILING_SAMPLE_INTERVAL, PROFILING_MAX_DURATION)
+
+        self._running += 1
+        started_at = timezone.now()
+        started = perf_counter()
+
+        try:
+            with capture_queries(PROFILING_MAX_QUERIES) as queries:
+                collector.start()
+
+                try:
+                    await app(scope, receive, send_wrapper)
+                finally:
+                    report = collector.stop()
+                    duration = perf_counter() - started
+
+                    self._store(
+                        PyProfile(
+                            pk=profile_id,
+                            method=scope['method'],
+                            path=_full_path(scope),
+                            status=status,
+                            mode=mode,
+                            started_at=started_at,
+                            duration=duration,
+                            query_count=len(queries.queries) + queries.dropped,
+                            query_duration=sum(query[2] for query in queries.queries),
+                            truncated=collector.truncated,
+                            queries=[
+                                PyProfiledQuery(operation=operation, query=query, duration=query_duration)
+                                for operation, query, query_duration in queries.queries
+                            ],
+                            dropped_queries=queries.dropped,
+                        ),
+                        report,
+                    )
+        finally:
+            self._running -= 1
+
+            if mode is ProfilingModeEnum.CPROFILE:
+                self._cprofile_running = False
+
+    def _store(self, profile: PyProfile, report: str):
+        self._profiles.set(profile.pk, (profile, report))
+
+    def profiles(self) -> list[PyProfileSummary]:
+        return [
+            PyProfileSummary(**profile.dict(exclude={'queries', 'dropped_queries'}))
+            for profile, _ in reversed(self._profiles.values())
+        ]
+
+    def get(self, profile_id: int) -> Optional[tuple[PyProfile, str]]:
+        return self._profiles.get(profile_id)
+
+
+profiler = Profiler(PROFILING_MAX_PROFILES, PROFILING_RETENTION, PROFILING_MAX_CONCURRENT)
+
+coordinator.subscribe('profiling', profiler.apply_settings)
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        mode = await profiler.requested_mode(scope) if scope['type'] == 'http' else None
+
+        if mode is None:
+            await self.app(scope, receive, send)
+        else:
+            await profiler.profile(mode, scope, receive, send, self.app)
@@ -0,0 +1,187 @@
+from hashlib import sha1
+from typing import Callable, Coroutine, Optional
+
+import ujson
+from fastapi import Depends
+from fastapi.requests import Request
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+
+from echo.cache import TTLCache
+from echo.config import DATABASE_REPLICA_CACHE_TTL, RESPONSE_CACHE_BACKEND, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL
+from echo.coordination import coordinator
+from echo.database import reads_from_replica
+
+
+CACHED_HEADERS = ['content-type', 'x-next-cursor']
+
+CacheEntry = tuple[bytes, dict[str, str]]
+
+
+class MemoryBackend:
+    def __init__(self, maxsize: int):
+        self._entries = TTLCache(maxsize, RESPONSE_CACHE_TTL)
+        self._versions: dict[str, int] = {}
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        return self._entries.get(key)
+
+    async def set(self, key: str, entry: CacheEntry, ttl: float):
+        self._entries.set(key, entry, ttl)
+
+    async def versions(self, namespaces: list[str]) -> list[int]:
+        return [self._versions.get(namespace, 0) for namespace in namespaces]
+
+    async def bump(self, namespaces: list[str]):
+        self.apply(namespaces)
+
+        coordinator.publish('cache', namespaces)
+
+    def apply(self, namespaces: list[str]):
+        for namespace in namespaces:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+    def clear(self):
+        self._entries.clear()
+
+
+class RedisBackend:
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError('The redis package is required for a Redis response cache backend')
+
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        value = await self._redis.get(f'echo:response:{key}')
+
+        if value is None:
+            return None
+
+        body, headers = ujson.loads(value)
+
+        return body.encode(), headers
+
+    async def set(self, key: str, entry: CacheEntry, ttl: float):
+        body, headers = entry
+        await self._redis.set(f'echo:response:{key}', ujson.dumps([body.decode(), headers]), ex=max(1, int(ttl)))
+
+    async def versions(self, namespaces: list[str]) -> list[int]:
+        values = await self._redis.mget([f'echo:version:{namespace}' for namespace in namespaces])
+
+        return [int(value or 0) for value in values]
+
+    async def bump(self, namespaces: list[str]):
+        async with self._redis.pipeline(transaction=False) as pipeline:
+            for namespace in namespaces:
+                pipeline.incr(f'echo:version:{namespace}')
+
+            await pipeline.execute()
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    async def key(self, request: Request, namespaces: list[str]) -> str:
+        versions = await self.backend.versions(namespaces)
+        query = '&'.join(f'{name}={value}' for name, value in sorted(request.query_params.multi_items()))
+        tags = ','.join(f'{namespace}:{version}' for namespace, version in zip(namespaces, versions))
+
+        return f'{request.url.path}?{query}|{tags}'
+
+    async def bump(self, *namespaces: str):
+        await self.backend.bump(list(namespaces))
+
+
+def make_backend(url: Optional[str]):
+    if not url or url == 'memory':
+        return MemoryBackend(RESPONSE_CACHE_SIZE)
+
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+
+    raise ValueError(f'Unsupported response cache backend: {url}')
+
+
+response_cache = ResponseCache(make_backend(RESPONSE_CACHE_BACKEND), RESPONSE_CACHE_TTL)
+
+if isinstance(response_cache.backend, MemoryBackend):
+    coordinator.subscribe('cache', response_cache.backend.apply, response_cache.backend.clear)
+
+
+class CacheHit(Exception):
+    def __init__(self, response: Response):
+        self.response = response
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+
+    if if_none_match is None:
+        return False
+
+    return if_none_match.strip() == '*' or etag in map(str.strip, if_none_match.split(','))
+
+
+def cached(*namespaces: str):
+    async def lookup(request: Request):
+        key = await response_cache.key(request, list(namespaces))
+        entry = await response_cache.backend.get(key)
+
+        if entry is None:
+            response_cache.misses += 1
+            request.state.response_cache_key = key
+            return
+
+        body, headers = entry
+
+        if etag_matches(request, headers['etag']):
+            response_cache.not_modified += 1
+            raise CacheHit(Response(status_code=304, headers={'etag': headers['etag']}))
+
+        response_cache.hits += 1
+        raise CacheHit(Response(content=body, headers=headers))
+
+    return Depends(lookup)
+
+
+class CachedRoute(APIRoute):
+    def get_route_handler(self) -> Callable[[Request], Coroutine]:
+        handler = super().get_route_handler()
+
+        async def cached_handler(request: Request) -> Response:
+            try:
+                response = await handler(request)
+            except CacheHit as hit:
+                return hit.response
+
+            key = getattr(request.state, 'response_cache_key', None)
+
+            if key is None or response.status_code != 200 or not hasattr(response, 'body'):
+                return response
+
+            etag = f'"{sha1(response.body).hexdigest()}"'
+            response.headers['etag'] = etag
+
+            headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+            headers['etag'] = etag
+
+            # A lagging replica may serve data older than the cache version it is stored under
+            ttl = min(response_cache.ttl, DATABASE_REPLICA_CACHE_TTL) if reads_from_replica() else response_cache.ttl
+
+            await response_cache.backend.set(key, (response.body, headers), ttl)
+
+            if etag_matches(request, etag):
+                return Response(status_code=304, headers={'etag': etag})
+
+            return response
+
+        return cached_handler
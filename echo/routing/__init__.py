@@ -1,15 +1,30 @@
+from fastapi import Depends
 from fastapi.routing import APIRouter
 
+from echo.auth import authenticate
+from echo.config import PROFILING_ENABLED
 from echo.routing.agents import router as agents_router
 from echo.routing.devices import router as devices_router
+from echo.routing.export import router as export_router
+from echo.routing.ingest import router as ingest_router
+from echo.routing.metrics import router as metrics_router
+from echo.routing.profiling import router as profiling_router
 from echo.routing.subnets import router as subnets_router
+from echo.routing.topology import router as topology_router
 from echo.routing.users import router as users_router
 
 
 router = APIRouter()
 
 
-router.include_router(agents_router, prefix='/agents')
-router.include_router(devices_router, prefix='/devices')
-router.include_router(subnets_router, prefix='/subnets')
+router.include_router(agents_router, prefix='/agents', dependencies=[Depends(authenticate)])
+router.include_router(ingest_router, prefix='/devices')
+router.include_router(devices_router, prefix='/devices', dependencies=[Depends(authenticate)])
+router.include_router(export_router, prefix='/export', dependencies=[Depends(authenticate)])
+router.include_router(subnets_router, prefix='/subnets', dependencies=[Depends(authenticate)])
+router.include_router(topology_router, prefix='/topology', dependencies=[Depends(authenticate)])
 router.include_router(users_router, prefix='/account')
+router.include_router(metrics_router)
+
+if PROFILING_ENABLED:
+    router.include_router(profiling_router, prefix='/profiling', dependencies=[Depends(authenticate)])
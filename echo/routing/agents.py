@@ -1,41 +1,38 @@
 from secrets import token_urlsafe
 
-from fastapi import Depends, HTTPException
+from fastapi import HTTPException
 from fastapi.routing import APIRouter
-from fastapi_jwt_auth import AuthJWT
 from tortoise.exceptions import IntegrityError
 
-from echo.deploy import deploy, destroy
-from echo.models.db import Agent, Device, Subnet
-from echo.models.pydantic import PyDeleteOut, PyAgent, PyAgentCreateIn
+from echo.fleet import run_fleet_operation
+from echo.jobs import JobConflict, deployment_runner
+from echo.models import DeploymentJobKindEnum, FleetOperationEnum
+from echo.models.db import Agent, DeploymentJob, Subnet
+from echo.models.pydantic import PyAgent, PyAgentCreateIn, PyDeploymentJob, PyFleetIn, PyFleetResult
+from echo.response_cache import CachedRoute, cached, response_cache
+from echo.serializers import TrustedJSONResponse, agent_to_dict
 
 
-router = APIRouter()
+router = APIRouter(route_class=CachedRoute)
 
 
-@router.get('/', response_model=list[PyAgent])
-async def list_agents(auth: AuthJWT = Depends()) -> list[PyAgent]:
-    auth.jwt_required()
+@router.get('/', response_model=list[PyAgent], dependencies=[cached('agents', 'subnets')])
+async def list_agents():
+    return TrustedJSONResponse(content=[agent_to_dict(agent) for agent in await Agent.all().prefetch_related('subnet')])
 
-    return [PyAgent.from_orm(agent) for agent in await Agent.all().prefetch_related('subnet')]
-
-
-@router.get('/{agent_id}')
-async def get_agent(agent_id: int, auth: AuthJWT = Depends()):
-    auth.jwt_required()
 
+@router.get('/{agent_id}', dependencies=[cached('agents', 'subnets')])
+async def get_agent(agent_id: int):
     agent = await Agent.get_or_none(pk=agent_id).prefetch_related('subnet')
 
     if agent is not None:
-        return PyAgent.from_orm(agent)
+        return TrustedJSONResponse(content=agent_to_dict(agent))
     else:
         raise HTTPException(status_code=404)
 
 
 @router.post('/', status_code=201, response_model=PyAgent)
-async def create_agent(data: PyAgentCreateIn, auth: AuthJWT = Depends()):
-    auth.jwt_required()
-
+async def create_agent(data: PyAgentCreateIn):
     subnet = await Subnet.get_or_none(pk=data.subnet_id)
 
     if subnet is None:
@@ -52,26 +49,72 @@ async def create_agent(data: PyAgentCreateIn, auth: AuthJWT = Depends()):
     except IntegrityError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+    await response_cache.bump('agents')
+    await deployment_runner.schedule(agent, DeploymentJobKindEnum.DEPLOY)
+
+    return TrustedJSONResponse(content=agent_to_dict(agent), status_code=201)
+
+
+@router.delete('/{agent_id}', status_code=202, response_model=PyDeploymentJob)
+async def delete_agent(agent_id: int):
+    agent = await Agent.get_or_none(pk=agent_id)
+
+    if agent is None:
+        raise HTTPException(status_code=404)
+
     try:
-        await deploy(agent)
-    except Exception as e:
-        await agent.delete()
-        raise HTTPException(status_code=500, detail=str(e))
+        job = await deployment_runner.schedule(agent, DeploymentJobKindEnum.DESTROY)
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
-    return PyAgent.from_orm(agent)
+    return PyDeploymentJob.from_orm(job)
 
 
-@router.delete('/{agent_id}', response_model=PyDeleteOut)
-async def delete_agent(agent_id: int, auth: AuthJWT = Depends()):
-    auth.jwt_required()
+@router.get('/{agent_id}/deployment', response_model=PyDeploymentJob)
+async def get_agent_deployment(agent_id: int):
+    job = await DeploymentJob.filter(agent_id=agent_id).order_by('-id').first()
+
+    if job is None:
+        raise HTTPException(status_code=404)
+
+    return PyDeploymentJob.from_orm(job)
 
-    agent = await Agent.get_or_none(pk=agent_id)
+
+@router.post('/{agent_id}/deployment', status_code=202, response_model=PyDeploymentJob)
+async def redeploy_agent(agent_id: int):
+    agent = await Agent.get_or_none(pk=agent_id).prefetch_related('subnet')
 
     if agent is None:
-        return PyDeleteOut(deleted=False)
+        raise HTTPException(status_code=404)
+
+    try:
+        job = await deployment_runner.schedule(agent, DeploymentJobKindEnum.DEPLOY)
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return PyDeploymentJob.from_orm(job)
+
+
+@router.get('/deployments/{job_id}', response_model=PyDeploymentJob)
+async def get_deployment(job_id: int):
+    job = await DeploymentJob.get_or_none(pk=job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404)
+
+    return PyDeploymentJob.from_orm(job)
+
+
+@router.post('/fleet/{operation}', response_model=list[PyFleetResult])
+async def run_fleet(operation: FleetOperationEnum, data: PyFleetIn):
+    agents = Agent.all()
+
+    if data.agent_ids is not None:
+        agents = agents.filter(pk__in=data.agent_ids)
 
-    destroy(agent)
+    agents = await agents.prefetch_related('subnet')
 
-    await agent.delete()
+    if data.concurrency is not None:
+        return await run_fleet_operation(agents, operation, data.concurrency)
 
-    return PyDeleteOut(deleted=True)
+    return await run_fleet_operation(agents, operation)
@@ -1,64 +1,173 @@
-from fastapi import Depends, HTTPException
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException, Query
 from fastapi.routing import APIRouter
-from fastapi_jwt_auth import AuthJWT
+from tortoise import timezone
 from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
+
+from echo.config import DEVICE_PAGE_SIZE, DEVICE_PAGE_SIZE_MAX, STATUS_HISTORY_WINDOW
+from echo.database import Parameters, fetch_models, select_columns
+from echo.events import event_bus
+from echo.ingest import ingest_queue
+from echo.models import DeviceStatusEnum, DeviceTypeEnum
+from echo.models.db import Device, DeviceLink, DevicePort, Subnet
+from echo.models.fields import ipv4_prefix_ranges
+from echo.models.pydantic import (
+    PyDeleteOut,
+    PyDevice,
+    PyDeviceCreateIn,
+    PyDeviceStatus,
+    PyDeviceStatusTransition,
+    PyDeviceUpdateIn,
+    PyDeviceUptime,
+    PyIngestStats,
+    PySchedulerStats,
+)
+from echo.response_cache import CachedRoute, cached, response_cache
+from echo.scheduler import scan_scheduler
+from echo.serializers import TrustedJSONResponse, device_to_dict
+from echo.status import last_observed_at, transitions, uptime
+from echo.topology import topology
+
+
+router = APIRouter(route_class=CachedRoute)
+
+
+@router.get('/', response_model=list[PyDevice], dependencies=[cached('devices', 'subnets')])
+async def list_devices(
+    after: Optional[int] = None,
+    limit: int = Query(DEVICE_PAGE_SIZE, ge=1, le=DEVICE_PAGE_SIZE_MAX),
+    subnet_id: Optional[int] = None,
+    type: Optional[DeviceTypeEnum] = None,  # noqa
+    address: Optional[str] = None,
+    port: Optional[int] = None,
+    status: Optional[DeviceStatusEnum] = None,
+    fields: Optional[str] = None,
+):
+    include = None
+
+    if fields is not None:
+        include = set(filter(None, map(str.strip, fields.split(','))))
+        unknown = include - set(PyDevice.__fields__)
+
+        if unknown:
+            raise HTTPException(status_code=400, detail=f'Unknown fields: {", ".join(sorted(unknown))}')
+
+    # Values are bound as parameters so each filter combination maps to one reusable prepared statement
+    connection = Device._choose_db()
+    parameters = Parameters(connection)
+    conditions = ['"device"."subnet_id" IS NOT NULL']
+
+    if after is not None:
+        conditions.append(f'"device"."id" > {parameters.add(after)}')
+
+    if subnet_id is not None:
+        conditions.append(f'"device"."subnet_id" = {parameters.add(subnet_id)}')
+
+    if type is not None:
+        conditions.append(f'"device"."type" = {parameters.add(type.value)}')
 
-from echo.models import DeviceTypeEnum
-from echo.models.db import Agent, Device, Subnet
-from echo.models.pydantic import PyDeleteOut, PyDevice, PyDeviceCreateIn, PyDeviceUpdateIn, PyFromScanIn, PyFromScanOut
+    if address:
+        address_ranges = ipv4_prefix_ranges(address)
 
+        if not address_ranges:
+            return TrustedJSONResponse(content=[])
 
-router = APIRouter()
+        ranges = ' OR '.join(
+            f'"device"."address" BETWEEN {parameters.add(first)} AND {parameters.add(last)}'
+            for first, last in address_ranges
+        )
+        conditions.append(f'({ranges})')
+
+    if port is not None:
+        conditions.append(
+            'EXISTS (SELECT 1 FROM "deviceport" WHERE "deviceport"."device_id" = "device"."id"'
+            f' AND "deviceport"."port" = {parameters.add(port)})'
+        )
+
+    if status is not None:
+        conditions.append(f'"device"."status" = {parameters.add(status.value)}')
+
+    devices = await fetch_models(
+        Device,
+        f'SELECT {select_columns(Device)} FROM "device" WHERE {" AND ".join(conditions)}'
+        f' ORDER BY "device"."id" LIMIT {parameters.add(limit + 1)}',
+        parameters.values,
+        connection,
+    )
 
+    await Device.fetch_for_list(devices, 'subnet', using_db=connection)
 
-@router.get('/', response_model=list[PyDevice])
-async def list_devices(auth: AuthJWT = Depends()) -> list[PyDevice]:
-    auth.jwt_required()
+    headers = {}
 
-    return [
-        PyDevice.from_orm(device)
-        for device in filter(lambda x: x.subnet is not None, await Device.all().prefetch_related('subnet'))
-    ]
+    if len(devices) > limit:
+        devices = devices[:limit]
+        headers['X-Next-Cursor'] = str(devices[-1].pk)
 
+    if include is None or 'connected_with' in include:
+        await DeviceLink.fetch_connected_with(devices)
 
-@router.get('/{device_id}')
-async def get_device(device_id: int, auth: AuthJWT = Depends()):
-    auth.jwt_required()
+    return TrustedJSONResponse(content=[device_to_dict(device, include) for device in devices], headers=headers)
 
+
+@router.get('/{device_id}', dependencies=[cached('devices', 'subnets')])
+async def get_device(device_id: int):
     device = await Device.get_or_none(pk=device_id).prefetch_related('subnet')
 
     if device is None or device.subnet is None:
         raise HTTPException(status_code=404)
 
-    return PyDevice.from_orm(device)
+    await DeviceLink.fetch_connected_with([device])
 
+    return TrustedJSONResponse(content=device_to_dict(device))
 
-@router.post('/', status_code=201, response_model=PyDevice)
-async def create_device(data: PyDeviceCreateIn, auth: AuthJWT = Depends()):
-    auth.jwt_required()
 
+@router.post('/', status_code=201, response_model=PyDevice)
+async def create_device(data: PyDeviceCreateIn):
     subnet = await Subnet.get_or_none(pk=data.subnet_id)
 
     if subnet is None:
         raise HTTPException(status_code=400, detail='Subnet with provided ID does not exist')
 
     try:
-        device = await Device.create(**data.dict(exclude_none=True, exclude_unset=True))
+        async with in_transaction('default') as connection:
+            device = await Device.create(
+                **data.dict(exclude={'connected_with'}, exclude_none=True, exclude_unset=True),
+                using_db=connection,
+            )
+            links = await DeviceLink.link(
+                [(device.pk, neighbour_id) for neighbour_id in data.connected_with],
+                using_db=connection,
+            )
+            await DevicePort.replace([device], using_db=connection)
     except IntegrityError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    return PyDevice.from_orm(device)
+    topology.update_devices([device])
+    topology.link(links)
 
+    event_bus.devices_created([device])
+    event_bus.linked(links)
 
-@router.put('/{device_id}', response_model=PyDevice)
-async def update_device(device_id: int, data: PyDeviceUpdateIn, auth: AuthJWT = Depends()):
-    auth.jwt_required()
+    await response_cache.bump('devices')
 
+    await device.fetch_related('subnet')
+    await DeviceLink.fetch_connected_with([device])
+
+    return TrustedJSONResponse(content=device_to_dict(device), status_code=201)
+
+
+@router.put('/{device_id}', response_model=PyDevice)
+async def update_device(device_id: int, data: PyDeviceUpdateIn):
     device = await Device.get_or_none(pk=device_id)
 
     if device is None:
         raise HTTPException(status_code=404)
 
+    previous_subnet_id = device.subnet_id
+
     await device.update_from_dict(data.dict(exclude_none=True, exclude_unset=True))
 
     try:
@@ -66,15 +175,23 @@ async def update_device(device_id: int, data: PyDeviceUpdateIn, auth: AuthJWT =
     except IntegrityError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+    topology.update_devices([device])
+
+    if device.subnet_id != previous_subnet_id:
+        event_bus.devices_removed([(device.pk, previous_subnet_id)])
+
+    event_bus.devices_changed([device])
+
+    await response_cache.bump('devices')
+
     await device.fetch_related('subnet')
+    await DeviceLink.fetch_connected_with([device])
 
-    return PyDevice.from_orm(device)
+    return TrustedJSONResponse(content=device_to_dict(device))
 
 
 @router.delete('/{device_id}', response_model=PyDeleteOut)
-async def delete_device(device_id: int, auth: AuthJWT = Depends()):
-    auth.jwt_required()
-
+async def delete_device(device_id: int):
     device = await Device.get_or_none(pk=device_id)
 
     if device is None:
@@ -82,115 +199,68 @@ async def delete_device(device_id: int, auth: AuthJWT = Depends()):
 
     await device.delete()
 
-    return PyDeleteOut(deleted=True)
+    topology.remove_device(device_id)
 
+    event_bus.devices_removed([(device_id, device.subnet_id)])
 
-@router.post(
-    '/from_scan',
-    response_model=PyFromScanOut,
-    response_model_exclude_none=True,
-    response_model_exclude_unset=True,
-)
-async def from_scan(data: PyFromScanIn) -> PyFromScanOut:
-    print(data.dict())
+    await response_cache.bump('devices')
 
-    agent = await Agent.get_or_none(token=data.agent_token).prefetch_related('subnet')
+    return PyDeleteOut(deleted=True)
 
-    if agent is None:
-        raise HTTPException(status_code=401, detail='Token is invalid or missing')
 
-    try:
-        gateway_data = next(filter(lambda x: x.is_gateway, data.devices))
-    except StopIteration:
-        raise HTTPException(status_code=400, detail='Gateway data is missing in scan data')
-
-    gateway = await Device.get_or_none(address=agent.subnet.gateway_address)
-
-    if gateway is None:
-        gateway = await Device.create(
-            subnet=agent.subnet,
-            address=gateway_data.ip,
-            mac=gateway_data.mac,
-            type=DeviceTypeEnum.UNKNOWN,
-            connection_options=gateway_data.ports,
-            connected_with=[],
-        )
+async def _status_range(device_id: int, start: Optional[datetime], end: Optional[datetime]) -> tuple[datetime, datetime]:
+    if not await Device.exists(pk=device_id):
+        raise HTTPException(status_code=404)
+
+    end = end or timezone.now()
+    start = start or end - timedelta(seconds=STATUS_HISTORY_WINDOW)
 
-    all_subnet_devices = [
-        x[0] for x in await Device.filter(subnet_id=agent.subnet_id).exclude(address=gateway.address).values_list('id')
-    ]
+    start, end = [timezone.make_aware(value) if timezone.is_naive(value) else value for value in (start, end)]
 
-    created = changed = not_changed = 0
-    is_changed = False
+    if start >= end:
+        raise HTTPException(status_code=400, detail='Range start must be before its end')
 
-    agent.subnet.gateway_address = str(gateway_data.ip)
-    await agent.subnet.save()
+    return start, end
 
-    if gateway.address != str(gateway_data.ip):
-        is_changed = True
-        gateway.address = str(gateway_data.ip)
 
-    if gateway.mac != gateway_data.mac and gateway_data.mac is not None:
-        is_changed = True
-        gateway.mac = gateway_data.mac
+@router.get('/{device_id}/status', response_model=PyDeviceStatus)
+async def get_device_status(device_id: int) -> PyDeviceStatus:
+    device = await Device.get_or_none(pk=device_id).only('id', 'status', 'status_changed_at')
 
-    if gateway.connection_options != gateway_data.ports:
-        is_changed = True
-        gateway.connection_options = gateway_data.ports
+    if device is None:
+        raise HTTPException(status_code=404)
+
+    return PyDeviceStatus(
+        device_id=device.pk,
+        status=device.status,
+        since=device.status_changed_at,
+        last_observed_at=await last_observed_at(device.pk),
+    )
 
-    if is_changed:
-        changed += 1
-        await gateway.save()
-    else:
-        not_changed += 1
 
-    for device_data in data.devices:
-        if device_data.is_gateway:
-            continue
+@router.get('/{device_id}/status/uptime', response_model=PyDeviceUptime)
+async def get_device_uptime(
+    device_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> PyDeviceUptime:
+    return await uptime(device_id, *await _status_range(device_id, start, end))
 
-        is_changed = is_created = False
 
-        device = await Device.get_or_none(subnet=agent.subnet, address=str(gateway_data.ip))
+@router.get('/{device_id}/status/transitions', response_model=list[PyDeviceStatusTransition])
+async def get_device_transitions(
+    device_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> list[PyDeviceStatusTransition]:
+    return await transitions(device_id, *await _status_range(device_id, start, end))
 
-        if device is None:
-            device = Device(
-                subnet=agent.subnet,
-                address=str(gateway_data.ip),
-                mac=device_data.mac,
-                type=DeviceTypeEnum.UNKNOWN,
-                connection_options=device_data.ports,
-                connected_with=[gateway.pk],
-            )
 
-            is_created = True
-        else:
-            if device.mac != device_data.mac and device_data.mac is not None:
-                is_changed = True
-                device.mac = device_data.mac
-
-            if device.connection_options != device_data.ports:
-                is_changed = True
-                device.connection_options = device_data.ports
-
-        if is_changed or is_created:
-            await device.save()
-
-            if device.pk in all_subnet_devices:
-                all_subnet_devices.remove(device.pk)
-
-        if is_created:
-            created += 1
-        elif is_changed:
-            changed += 1
-        else:
-            not_changed += 1
-
-    result = PyFromScanOut(
-        created=created,
-        changed=changed,
-        not_changed=not_changed,
-    )
+@router.get('/from_scan/queue', response_model=PyIngestStats)
+async def get_ingest_stats() -> PyIngestStats:
+    return ingest_queue.stats()
 
-    print(result.dict())
 
-    return result
+@router.get('/scan/schedule', response_model=PySchedulerStats)
+async def get_scheduler_stats() -> PySchedulerStats:
+    return await scan_scheduler.stats()
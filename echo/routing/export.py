@@ -0,0 +1,20 @@
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRouter
+
+from echo.export import iter_devices, iter_links
+
+
+router = APIRouter()
+
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+
+@router.get('/devices')
+async def export_devices():
+    return StreamingResponse(iter_devices(), media_type=NDJSON_MEDIA_TYPE)
+
+
+@router.get('/links')
+async def export_links():
+    return StreamingResponse(iter_links(), media_type=NDJSON_MEDIA_TYPE)
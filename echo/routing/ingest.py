@@ -0,0 +1,151 @@
+import logging
+
+from fastapi import HTTPException
+from fastapi.requests import Request
+from fastapi.responses import Response
+from fastapi.routing import APIRouter
+
+from echo.ingest import IngestQueueFull, ingest_queue
+from echo.metrics import INGEST_STAGE_DURATION
+from echo.models.db import Agent
+from echo.models.fields import unpack_ipv4
+from echo.models.pydantic import PyFromScanQueued, PyScanLease, PyScanUnitDone
+from echo.payload import (
+    PayloadError,
+    PayloadTooLarge,
+    ScannedDevice,
+    UnsupportedPayload,
+    decode_addresses,
+    decode_devices,
+    read_payload,
+)
+from echo.scan import find_gateway
+from echo.scheduler import LeaseLost, scan_scheduler
+from echo.snapshot import GenerationMismatch, scan_snapshots
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+async def get_payload(request: Request) -> dict:
+    try:
+        return await read_payload(request)
+    except PayloadTooLarge:
+        raise HTTPException(status_code=413, detail='Scan payload is too large')
+    except UnsupportedPayload as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except PayloadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def get_agent(token: str) -> Agent:
+    agent = await Agent.get_or_none(token=token) if isinstance(token, str) else None
+
+    if agent is None:
+        raise HTTPException(status_code=401, detail='Token is invalid or missing')
+
+    return agent
+
+
+def enqueue(agent: Agent, devices: list[ScannedDevice]):
+    if find_gateway(devices) is None:
+        raise HTTPException(status_code=400, detail='Gateway data is missing in scan data')
+
+    try:
+        ingest_queue.put(agent, devices)
+    except IngestQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={'Retry-After': str(e.retry_after)})
+
+    logger.debug('Queued scan report of agent %s with %s devices', agent.pk, len(devices))
+
+
+@router.post('/from_scan', status_code=202, response_model=PyFromScanQueued)
+async def from_scan(request: Request) -> PyFromScanQueued:
+    with INGEST_STAGE_DURATION.time(stage='validate'):
+        payload = await get_payload(request)
+        agent = await get_agent(payload.get('agent_token'))
+
+        try:
+            devices = decode_devices(payload)
+        except PayloadError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        with INGEST_STAGE_DURATION.time(stage='snapshot'):
+            snapshot = await scan_snapshots.replace(agent, devices, lambda merged: enqueue(agent, merged))
+    except GenerationMismatch as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={'X-Scan-Generation': str(e.generation)})
+
+    return PyFromScanQueued(queue_length=ingest_queue.length, generation=snapshot.generation, digest=snapshot.digest)
+
+
+@router.post('/from_scan/delta', status_code=202, response_model=PyFromScanQueued)
+async def from_scan_delta(request: Request) -> PyFromScanQueued:
+    with INGEST_STAGE_DURATION.time(stage='validate'):
+        payload = await get_payload(request)
+        agent = await get_agent(payload.get('agent_token'))
+        generation = payload.get('generation')
+
+        if not isinstance(generation, int):
+            raise HTTPException(status_code=400, detail='generation must be an integer')
+
+        try:
+            upserted = decode_devices(payload, 'upserted', 'upserted_columns')
+            removed = decode_addresses(payload.get('removed', []))
+        except PayloadError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        with INGEST_STAGE_DURATION.time(stage='snapshot'):
+            snapshot = await scan_snapshots.apply_delta(
+                agent,
+                generation,
+                upserted,
+                removed,
+                lambda devices: enqueue(agent, devices),
+            )
+    except GenerationMismatch as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={'X-Scan-Generation': str(e.generation)})
+
+    return PyFromScanQueued(queue_length=ingest_queue.length, generation=snapshot.generation, digest=snapshot.digest)
+
+
+@router.post('/scan/lease', response_model=PyScanLease, responses={204: {'description': 'No scan unit is due'}})
+async def lease_scan_unit(request: Request):
+    payload = await get_payload(request)
+    agent = await get_agent(payload.get('agent_token'))
+    await agent.fetch_related('subnet')
+
+    unit = await scan_scheduler.lease(agent)
+
+    if unit is None:
+        return Response(status_code=204, headers={'Retry-After': str(await scan_scheduler.retry_after(agent))})
+
+    return PyScanLease(
+        pk=unit.pk,
+        first_address=unpack_ipv4(unit.first_address),
+        last_address=unpack_ipv4(unit.last_address),
+        ports=unit.ports,
+        lease_expires_at=unit.lease_expires_at,
+    )
+
+
+@router.post('/scan/lease/{unit_id}', response_model=PyScanUnitDone)
+async def complete_scan_unit(unit_id: int, request: Request) -> PyScanUnitDone:
+    with INGEST_STAGE_DURATION.time(stage='validate'):
+        payload = await get_payload(request)
+        agent = await get_agent(payload.get('agent_token'))
+
+        try:
+            devices = decode_devices(payload)
+        except PayloadError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        unit, round_complete = await scan_scheduler.complete(agent, unit_id, devices)
+    except LeaseLost as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return PyScanUnitDone(pk=unit.pk, devices=len(unit.devices), round_complete=round_complete)
@@ -0,0 +1,24 @@
+from secrets import compare_digest
+from typing import Optional
+
+from fastapi import Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRouter
+
+from echo.config import METRICS_TOKEN
+from echo.coordination import coordinator
+from echo.metrics import registry
+
+
+router = APIRouter()
+
+
+@router.get('/metrics', include_in_schema=False)
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and not compare_digest(authorization or '', f'Bearer {METRICS_TOKEN}'):
+        raise HTTPException(status_code=401)
+
+    # Every worker keeps its own metrics and answers scrapes alone, so series are labelled with the worker
+    labels = {'worker': coordinator.worker_id} if coordinator.enabled else {}
+
+    return PlainTextResponse(registry.render(**labels), media_type='text/plain; version=0.0.4')
@@ -0,0 +1,46 @@
+from fastapi import HTTPException
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRouter
+
+from echo.models.pydantic import PyProfile, PyProfileSummary, PyProfilingSettings
+from echo.profiling import profiler
+
+
+router = APIRouter()
+
+
+@router.get('/', response_model=list[PyProfileSummary])
+async def list_profiles() -> list[PyProfileSummary]:
+    return profiler.profiles()
+
+
+@router.get('/settings', response_model=PyProfilingSettings)
+async def get_profiling_settings() -> PyProfilingSettings:
+    return profiler.settings
+
+
+@router.put('/settings', response_model=PyProfilingSettings)
+async def update_profiling_settings(data: PyProfilingSettings) -> PyProfilingSettings:
+    profiler.update_settings(data)
+
+    return profiler.settings
+
+
+@router.get('/{profile_id}', response_model=PyProfile)
+async def get_profile(profile_id: int) -> PyProfile:
+    entry = profiler.get(profile_id)
+
+    if entry is None:
+        raise HTTPException(status_code=404)
+
+    return entry[0]
+
+
+@router.get('/{profile_id}/report', response_class=PlainTextResponse)
+async def get_profile_report(profile_id: int):
+    entry = profiler.get(profile_id)
+
+    if entry is None:
+        raise HTTPException(status_code=404)
+
+    return PlainTextResponse(entry[1])
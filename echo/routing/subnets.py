@@ -1,57 +1,68 @@
-from fastapi import Depends, HTTPException
+from fastapi import HTTPException
 from fastapi.routing import APIRouter
-from fastapi_jwt_auth import AuthJWT
 from tortoise.exceptions import IntegrityError
 
+from echo.events import event_bus
 from echo.models.db import Subnet
 from echo.models.pydantic import PyDeleteOut, PySubnet, PySubnetCreateIn
+from echo.response_cache import CachedRoute, cached, response_cache
+from echo.serializers import TrustedJSONResponse, subnet_to_dict
+from echo.subnet_index import subnet_index
+from echo.topology import topology
 
 
-router = APIRouter()
+router = APIRouter(route_class=CachedRoute)
 
 
-@router.get('/', response_model=list[PySubnet])
-async def list_subnets(auth: AuthJWT = Depends()) -> list[PySubnet]:
-    auth.jwt_required()
+@router.get('/', response_model=list[PySubnet], dependencies=[cached('subnets')])
+async def list_subnets():
+    return TrustedJSONResponse(content=[subnet_to_dict(subnet) for subnet in await Subnet.all()])
 
-    return [PySubnet.from_orm(subnet) for subnet in await Subnet.all()]
-
-
-@router.get('/{subnet_id}')
-async def get_subnet(subnet_id: int, auth: AuthJWT = Depends()):
-    auth.jwt_required()
 
+@router.get('/{subnet_id}', dependencies=[cached('subnets')])
+async def get_subnet(subnet_id: int):
     subnet = await Subnet.get_or_none(pk=subnet_id)
 
     if subnet is not None:
-        return PySubnet.from_orm(subnet)
+        return TrustedJSONResponse(content=subnet_to_dict(subnet))
     else:
         raise HTTPException(status_code=404)
 
 
 @router.post('/', status_code=201, response_model=PySubnet)
-async def create_subnet(data: PySubnetCreateIn, auth: AuthJWT = Depends()):
-    auth.jwt_required()
-
+async def create_subnet(data: PySubnetCreateIn):
     try:
         subnet = await Subnet.create(**data.dict())
     except IntegrityError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    return PySubnet.from_orm(subnet)
+    subnet_index.update([subnet])
 
+    await response_cache.bump('subnets')
+
+    return TrustedJSONResponse(content=subnet_to_dict(subnet), status_code=201)
 
-@router.delete('/{subnet_id}', response_model=PyDeleteOut)
-async def delete_subnet(subnet_id: int, auth: AuthJWT = Depends()):
-    auth.jwt_required()
 
+@router.delete('/{subnet_id}', response_model=PyDeleteOut)
+async def delete_subnet(subnet_id: int):
     subnet = await Subnet.get_or_none(pk=subnet_id)
 
     if subnet is None:
         return PyDeleteOut(deleted=False)
 
+    device_ids = await subnet.devices.all().values_list('id', flat=True)  # noqa
+
     await subnet.devices.all().delete()  # noqa
     await subnet.agent.delete()  # noqa
     await subnet.delete()
 
+    subnet_index.remove(subnet_id)
+
+    for device_id in device_ids:
+        topology.remove_device(device_id)
+
+    event_bus.devices_removed((device_id, subnet_id) for device_id in device_ids)
+
+    await response_cache.bump('subnets', 'agents', 'devices')
+
     return PyDeleteOut(deleted=True)
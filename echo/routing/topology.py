@@ -0,0 +1,44 @@
+from typing import Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRouter
+
+from echo.events import event_bus
+from echo.models.pydantic import PyTopologyPath
+from echo.topology import topology
+
+
+router = APIRouter()
+
+
+@router.get('/devices/{device_id}/neighbours', response_model=list[int])
+async def get_neighbours(device_id: int) -> list[int]:
+    if device_id not in topology:
+        raise HTTPException(status_code=404)
+
+    return topology.neighbours(device_id)
+
+
+@router.get('/path', response_model=PyTopologyPath)
+async def get_path(source_id: int, target_id: int) -> PyTopologyPath:
+    path = topology.shortest_path(source_id, target_id)
+
+    if path is None:
+        raise HTTPException(status_code=404, detail='No path between provided devices')
+
+    return PyTopologyPath(path=path)
+
+
+@router.get('/components', response_model=list[list[int]])
+async def get_components(subnet_id: Optional[int] = None) -> list[list[int]]:
+    return topology.components(subnet_id)
+
+
+@router.get('/events')
+async def stream_events(subnet_id: Optional[int] = None):
+    return StreamingResponse(
+        event_bus.stream(subnet_id),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
@@ -1,48 +1,61 @@
 from fastapi import Depends, HTTPException
+from fastapi.requests import Request
 from fastapi.routing import APIRouter
 from fastapi_jwt_auth import AuthJWT
-from pydantic import BaseModel
 
-from echo.config import JWT_SECRET_KEY
+from echo.auth import (
+    auth_cache_stats,
+    authenticate,
+    check_password,
+    client_address,
+    get_current_user,
+    login_throttle,
+)
+from echo.executor import ExecutorBusy, JobTimeout
 from echo.models.db import User
-from echo.models.pydantic import PyToken, PyUserIn, PyUserOut
+from echo.models.pydantic import PyAuthCacheStats, PyToken, PyUserIn, PyUserOut
 
 
 router = APIRouter()
 
 
-class JWTConfig(BaseModel):
-    authjwt_secret_key: str = JWT_SECRET_KEY
-
-
-@AuthJWT.load_config
-def get_config():
-    return JWTConfig()
-
-
 @router.get('/', response_model=PyUserOut)
-async def get_user(auth: AuthJWT = Depends()):
-    auth.jwt_required()
-
-    user_id = auth.get_jwt_subject()
-    user = await User.get_or_none(pk=user_id)
+async def get_user(user: User = Depends(get_current_user)):
+    return PyUserOut.from_orm(user)
 
-    if user is None:
-        raise HTTPException(status_code=404)
 
-    return PyUserOut.from_orm(user)
+@router.get('/cache', response_model=PyAuthCacheStats, dependencies=[Depends(authenticate)])
+async def get_auth_cache_stats() -> PyAuthCacheStats:
+    return auth_cache_stats()
 
 
 @router.post('/login', response_model=PyToken)
-async def login(data: PyUserIn, auth: AuthJWT = Depends()):
+async def login(data: PyUserIn, request: Request, auth: AuthJWT = Depends()):
+    user_key = f'user:{data.username}'
+    throttle_keys = (user_key, f'ip:{client_address(request)}')
+    retry_after = login_throttle.retry_after(*throttle_keys)
+
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail='Too many login attempts',
+            headers={'Retry-After': str(retry_after)},
+        )
+
     user = await User.get_or_none(username=data.username)
 
-    if user is None:
-        raise HTTPException(status_code=401, detail='Invalid username or password')
+    try:
+        is_valid = user is not None and await check_password(user, data.password)
+    except (ExecutorBusy, JobTimeout):
+        raise HTTPException(status_code=503, detail='Login is temporarily unavailable', headers={'Retry-After': '1'})
 
-    if not User.verify_password(data.password, user.password):
+    if not is_valid:
+        login_throttle.fail(*throttle_keys)
         raise HTTPException(status_code=401, detail='Invalid username or password')
 
+    # The address counter is left to expire, or one valid account could clear it between guesses
+    login_throttle.reset(user_key)
+
     access_token = auth.create_access_token(user.pk, expires_time=3600)
 
     return PyToken(access_token=access_token)
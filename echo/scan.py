@@ -0,0 +1,233 @@
+from typing import Iterable, Optional
+
+from tortoise import Model
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.query_utils import Q
+from tortoise.transactions import in_transaction
+
+from echo.coordination import LOCK_SUBNET, coordinator
+from echo.database import fetch_models, select_columns
+from echo.events import event_bus
+from echo.metrics import INGEST_STAGE_DURATION
+from echo.models import DeviceTypeEnum
+from echo.models.db import Agent, Device, DeviceLink, DevicePort
+from echo.models.fields import pack_ipv4
+from echo.models.pydantic import PyFromScanOut
+from echo.payload import ScannedDevice
+from echo.response_cache import response_cache
+from echo.subnet_index import subnet_index
+from echo.topology import topology
+
+
+UPDATABLE_FIELDS = ['subnet_id', 'address', 'mac', 'connection_options']
+
+
+class ScanDiff:
+    def __init__(self, agent: Agent):
+        self.agent = agent
+        self.gateway: Optional[Device] = None
+        self.created: list[Device] = []
+        self.changed: list[Device] = []
+        self.not_changed: list[Device] = []
+        self.vanished: list[Device] = []
+        self.links: set[tuple[int, int]] = set()
+        self.subnet_changed = False
+
+    def to_out(self) -> PyFromScanOut:
+        return PyFromScanOut(
+            created=len(self.created),
+            changed=len(self.changed),
+            not_changed=len(self.not_changed),
+            vanished=[device.pk for device in self.vanished],
+        )
+
+
+def find_gateway(devices: Iterable[ScannedDevice]) -> Optional[ScannedDevice]:
+    return next(filter(lambda x: x.is_gateway, devices), None)
+
+
+def _ports_to_db(ports: Iterable[tuple[str, int]]) -> list[list]:
+    return [[name, port] for name, port in ports]
+
+
+async def load_subnet_devices(agent: Agent, addresses: set[str]) -> list[Device]:
+    addresses = list(addresses | {agent.subnet.gateway_address})
+    connection = Device._choose_db()
+
+    if connection.capabilities.dialect != 'postgres':
+        return await Device.filter(Q(subnet_id=agent.subnet_id) | Q(address__in=addresses))
+
+    # One array parameter keeps the statement text stable for any scan size
+    return await fetch_models(
+        Device,
+        f'SELECT {select_columns(Device)} FROM "device" WHERE "device"."subnet_id" = $1'
+        ' OR "device"."address" = ANY($2::bigint[])',
+        [agent.subnet_id, [pack_ipv4(address) for address in addresses]],
+        connection,
+    )
+
+
+def compute_diff(agent: Agent, devices: Iterable[ScannedDevice], existing: list[Device]) -> ScanDiff:
+    diff = ScanDiff(agent)
+
+    scanned = {device_data.ip: device_data for device_data in devices}
+
+    by_address = {device.address: device for device in existing}
+    by_mac = {
+        device.mac: device
+        for device in existing
+        if device.mac is not None and device.subnet_id == agent.subnet_id and device.address not in scanned
+    }
+
+    matches: dict[str, Optional[Device]] = {address: by_address.get(address) for address in scanned}
+    claimed = {device.pk for device in matches.values() if device is not None}
+
+    for address, device_data in scanned.items():
+        if matches[address] is not None:
+            continue
+
+        candidate = None
+
+        if device_data.is_gateway and agent.subnet.gateway_address not in scanned:
+            candidate = by_address.get(agent.subnet.gateway_address)
+
+        if candidate is None and device_data.mac is not None:
+            candidate = by_mac.get(device_data.mac)
+
+        if candidate is not None and candidate.pk not in claimed:
+            matches[address] = candidate
+            claimed.add(candidate.pk)
+
+    for address, device_data in scanned.items():
+        device = matches[address]
+        ports = _ports_to_db(device_data.ports)
+        subnet_id = subnet_index.resolve(address) or agent.subnet_id
+
+        if device is None:
+            device = Device(
+                subnet_id=subnet_id,
+                address=address,
+                mac=device_data.mac,
+                type=DeviceTypeEnum.UNKNOWN,
+                connection_options=ports,
+            )
+
+            if device_data.is_gateway:
+                diff.gateway = device
+
+            diff.created.append(device)
+
+            continue
+
+        is_changed = False
+
+        if device.subnet_id != subnet_id:
+            is_changed = True
+            device.subnet_id = subnet_id
+
+        if device.address != address:
+            is_changed = True
+            device.address = address
+
+        if device.mac != device_data.mac and device_data.mac is not None:
+            is_changed = True
+            device.mac = device_data.mac
+
+        if device.connection_options != ports:
+            is_changed = True
+            device.connection_options = ports
+
+        if device_data.is_gateway:
+            diff.gateway = device
+
+        if is_changed:
+            diff.changed.append(device)
+        else:
+            diff.not_changed.append(device)
+
+    diff.vanished = [
+        device for device in existing if device.subnet_id == agent.subnet_id and device.pk not in claimed
+    ]
+
+    return diff
+
+
+async def bulk_update(objects: list[Model], fields: list[str], connection: BaseDBAsyncClient):
+    if not objects:
+        return
+
+    model = type(objects[0])
+    executor = connection.executor_class(model=model, db=connection)
+
+    await connection.execute_many(
+        executor.get_update_sql(fields, None),
+        [
+            [executor.column_map[field](getattr(instance, field), instance) for field in fields]
+            + [model._meta.pk.to_db_value(instance.pk, instance)]
+            for instance in objects
+        ],
+    )
+
+
+async def apply_diff(diff: ScanDiff):
+    subnet = diff.agent.subnet
+    gateway = diff.gateway
+    created = [device for device in diff.created if device is not gateway]
+
+    async with in_transaction('default') as connection:
+        if gateway is not None and not gateway._saved_in_db:
+            await gateway.save(using_db=connection)
+
+        if gateway is not None and subnet.gateway_address != gateway.address:
+            subnet.gateway_address = gateway.address
+            await subnet.save(using_db=connection, update_fields=['gateway_address'])
+            diff.subnet_changed = True
+
+        if created:
+            await Device.bulk_create(created, using_db=connection)
+
+            created_ids = dict(
+                await Device.filter(address__in=[device.address for device in created])
+                .using_db(connection)
+                .values_list('address', 'id')
+            )
+
+            for device in created:
+                device.pk = created_ids[device.address]
+                device._saved_in_db = True
+
+            if gateway is not None:
+                diff.links = await DeviceLink.link(
+                    [(gateway.pk, device.pk) for device in created],
+                    using_db=connection,
+                )
+
+        await bulk_update(diff.changed, UPDATABLE_FIELDS, connection)
+        await DevicePort.replace(diff.created + diff.changed, using_db=connection)
+
+
+async def reconcile_scan(agent: Agent, devices: list[ScannedDevice]) -> ScanDiff:
+    async with coordinator.lock(LOCK_SUBNET, agent.subnet_id):
+        with INGEST_STAGE_DURATION.time(stage='load'):
+            existing = await load_subnet_devices(agent, {device_data.ip for device_data in devices})
+
+        with INGEST_STAGE_DURATION.time(stage='diff'):
+            diff = compute_diff(agent, devices, existing)
+
+        with INGEST_STAGE_DURATION.time(stage='write'):
+            await apply_diff(diff)
+
+    topology.update_devices(diff.created + diff.changed)
+    topology.link(diff.links)
+
+    event_bus.devices_created(diff.created)
+    event_bus.devices_changed(diff.changed)
+    event_bus.linked(diff.links)
+
+    if diff.created or diff.changed:
+        await response_cache.bump('devices')
+
+    if diff.subnet_changed:
+        await response_cache.bump('subnets')
+
+    return diff
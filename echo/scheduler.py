@@ -0,0 +1,385 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from tortoise import timezone
+from tortoise.functions import Count
+from tortoise.transactions import in_transaction
+
+from echo.config import (
+    SCAN_LEASE_DURATION,
+    SCAN_ROUND_INTERVAL,
+    SCAN_SCHEDULER_ENABLED,
+    SCAN_SCHEDULER_INTERVAL,
+    SCAN_SPREAD,
+    SCAN_UNIT_PORTS,
+    SCAN_UNIT_SIZE,
+)
+from echo.coordination import LOCK_SCAN_SCHEDULER, coordinator
+from echo.deploy import load_ports
+from echo.ingest import IngestQueueFull, ingest_queue
+from echo.metrics import registry
+from echo.models import ScanRoundStatusEnum, ScanUnitStatusEnum
+from echo.models.db import Agent, ScanRound, ScanUnit, Subnet
+from echo.models.fields import pack_ipv4
+from echo.models.pydantic import PySchedulerStats
+from echo.payload import ScannedDevice
+from echo.snapshot import SnapshotRow, scan_snapshots, to_rows
+
+
+logger = logging.getLogger(__name__)
+
+LEASE_CANDIDATES = 10
+
+Range = tuple[int, int]
+
+
+class LeaseLost(Exception):
+    def __init__(self):
+        super().__init__('Scan unit is not leased to this agent')
+
+
+def split_range(first: int, last: int, size: int) -> list[Range]:
+    return [(start, min(start + size - 1, last)) for start in range(first, last + 1, size)]
+
+
+def unit_ranges(subnet: Range, excluded: Iterable[Range], size: int) -> list[Range]:
+    ranges = []
+    start, last = subnet
+
+    for excluded_first, excluded_last in sorted(excluded):
+        if excluded_first > start:
+            ranges.extend(split_range(start, excluded_first - 1, size))
+
+        start = max(start, excluded_last + 1)
+
+    if start <= last:
+        ranges.extend(split_range(start, last, size))
+
+    return ranges
+
+
+def port_sets(ports: dict[str, str], size: int) -> list[dict[str, str]]:
+    items = sorted(ports.items(), key=lambda item: int(item[0]))
+    size = size or len(items) or 1
+
+    return [dict(items[i:i + size]) for i in range(0, len(items), size)] or [{}]
+
+
+def merge_rows(units: Iterable[list[SnapshotRow]], gateway_address: str) -> list[ScannedDevice]:
+    macs: dict[str, Optional[str]] = {}
+    ports: dict[str, dict[tuple[str, int], None]] = {}
+
+    for rows in units:
+        for ip, mac, unit_ports, _ in rows:
+            ports.setdefault(ip, {}).update((tuple(port), None) for port in unit_ports)
+
+            if mac is not None or ip not in macs:
+                macs[ip] = mac
+
+    return [ScannedDevice(ip, macs[ip], list(ports[ip]), ip == gateway_address) for ip in ports]
+
+
+class ScanScheduler:
+    def __init__(
+        self,
+        interval: float,
+        round_interval: float,
+        spread: float,
+        lease_duration: float,
+        unit_size: int,
+        unit_ports: int,
+    ):
+        self.interval = interval
+        self.round_interval = timedelta(seconds=round_interval)
+        self.spread = spread
+        self.lease_duration = timedelta(seconds=lease_duration)
+        self.unit_size = unit_size
+        self.unit_ports = unit_ports
+
+        self._task: Optional[asyncio.Task] = None
+
+        self.issued = 0
+        self.expired = 0
+        self.completed = 0
+        self.merged = 0
+
+    async def expire_leases(self, now: datetime) -> int:
+        expired = await ScanUnit.filter(status=ScanUnitStatusEnum.LEASED, lease_expires_at__lt=now).update(
+            status=ScanUnitStatusEnum.PENDING,
+            agent_id=None,
+            lease_expires_at=None,
+        )
+
+        self.expired += expired
+
+        return expired
+
+    async def plan(self, now: datetime) -> int:
+        subnet_ids = await Agent.all().values_list('subnet_id', flat=True)
+        subnets = await Subnet.filter(pk__in=subnet_ids)
+
+        latest: dict[int, ScanRound] = {}
+
+        for scan_round in await ScanRound.filter(subnet_id__in=subnet_ids).order_by('created_at'):
+            latest[scan_round.subnet_id] = scan_round
+
+        due = [
+            subnet
+            for subnet in subnets
+            if subnet.pk not in latest
+            or latest[subnet.pk].status == ScanRoundStatusEnum.DONE
+            and latest[subnet.pk].created_at <= now - self.round_interval
+        ]
+
+        if not due:
+            return 0
+
+        ranges = {subnet.pk: (subnet.first_address, subnet.last_address) for subnet in subnets}
+        ports = port_sets(load_ports(), self.unit_ports)
+        planned = []
+
+        for subnet in due:
+            first, last = ranges[subnet.pk]
+            nested = [
+                subnet_range
+                for subnet_id, subnet_range in ranges.items()
+                if subnet_id != subnet.pk and first <= subnet_range[0] and subnet_range[1] <= last
+            ]
+
+            subnet_units = [
+                (unit_range, unit_ports)
+                for unit_range in unit_ranges((first, last), nested, self.unit_size)
+                for unit_ports in ports
+            ]
+
+            # Subnets fully covered by nested subnets are scanned by their own agents
+            if subnet_units:
+                planned.append((subnet, subnet_units))
+
+        total = sum(len(units) for _, units in planned)
+
+        if not total:
+            return 0
+
+        step = timedelta(seconds=self.spread / total)
+        units = []
+
+        async with in_transaction('default') as connection:
+            await ScanRound.filter(subnet_id__in=[subnet.pk for subnet, _ in planned]).using_db(connection).delete()
+
+            for subnet, subnet_units in planned:
+                scan_round = await ScanRound.create(subnet=subnet, using_db=connection)
+
+                for (first, last), unit_ports in subnet_units:
+                    units.append(
+                        ScanUnit(
+                            round_id=scan_round.pk,
+                            first_address=first,
+                            last_address=last,
+                            ports=unit_ports,
+                            not_before=now + step * len(units),
+                        )
+                    )
+
+            await ScanUnit.bulk_create(units, using_db=connection)
+
+        logger.debug('Planned scan rounds for %s subnets with %s units', len(planned), len(units))
+
+        return len(planned)
+
+    async def lease(self, agent: Agent) -> Optional[ScanUnit]:
+        now = timezone.now()
+
+        # Subnets can overlap, so only units planned for the agent's own subnet are leased
+        candidates = await ScanUnit.filter(
+            status=ScanUnitStatusEnum.PENDING,
+            not_before__lte=now,
+            round__subnet_id=agent.subnet_id,
+        ).order_by('not_before', 'id').limit(LEASE_CANDIDATES)
+
+        for unit in candidates:
+            lease_expires_at = now + self.lease_duration
+
+            leased = await ScanUnit.filter(pk=unit.pk, status=ScanUnitStatusEnum.PENDING).update(
+                status=ScanUnitStatusEnum.LEASED,
+                agent_id=agent.pk,
+                lease_expires_at=lease_expires_at,
+                attempts=unit.attempts + 1,
+            )
+
+            if leased:
+                unit.status = ScanUnitStatusEnum.LEASED
+                unit.agent_id = agent.pk
+                unit.lease_expires_at = lease_expires_at
+                unit.attempts += 1
+
+                self.issued += 1
+
+                return unit
+
+        return None
+
+    async def retry_after(self, agent: Agent) -> int:
+        unit = await ScanUnit.filter(
+            status=ScanUnitStatusEnum.PENDING,
+            round__subnet_id=agent.subnet_id,
+        ).order_by('not_before').first()
+
+        if unit is None:
+            return max(1, round(self.interval))
+
+        return max(1, round((unit.not_before - timezone.now()).total_seconds()))
+
+    async def complete(self, agent: Agent, unit_id: int, devices: list[ScannedDevice]) -> tuple[ScanUnit, bool]:
+        unit = await ScanUnit.get_or_none(pk=unit_id, agent_id=agent.pk, status=ScanUnitStatusEnum.LEASED)
+
+        if unit is None:
+            raise LeaseLost()
+
+        rows = to_rows(
+            [device for device in devices if unit.first_address <= pack_ipv4(device.ip) <= unit.last_address]
+        )
+
+        completed = await ScanUnit.filter(pk=unit.pk, agent_id=agent.pk, status=ScanUnitStatusEnum.LEASED).update(
+            status=ScanUnitStatusEnum.DONE,
+            devices=rows,
+            finished_at=timezone.now(),
+        )
+
+        if not completed:
+            raise LeaseLost()
+
+        unit.status = ScanUnitStatusEnum.DONE
+        unit.devices = rows
+
+        self.completed += 1
+
+        return unit, await self.merge(unit.round_id)
+
+    async def merge(self, round_id: int) -> bool:
+        if await ScanUnit.filter(round_id=round_id).exclude(status=ScanUnitStatusEnum.DONE).exists():
+            return False
+
+        finished = await ScanRound.filter(pk=round_id, status=ScanRoundStatusEnum.RUNNING).update(
+            status=ScanRoundStatusEnum.DONE,
+            finished_at=timezone.now(),
+        )
+
+        if not finished:
+            return False
+
+        try:
+            merged = await self._merge_units(round_id)
+        except IngestQueueFull:
+            await self._reopen(round_id)
+            logger.debug('Ingest queue is full, postponing merge of scan round %s', round_id)
+            return False
+        except Exception:  # noqa
+            await self._reopen(round_id)
+            logger.exception('Failed to merge scan round %s, retrying later', round_id)
+            return False
+
+        if merged:
+            self.merged += 1
+
+        return True
+
+    async def _reopen(self, round_id: int):
+        await ScanRound.filter(pk=round_id).update(status=ScanRoundStatusEnum.RUNNING, finished_at=None)
+
+    async def _merge_units(self, round_id: int) -> bool:
+        scan_round = await ScanRound.get(pk=round_id).prefetch_related('subnet')
+        agent = await Agent.get_or_none(subnet_id=scan_round.subnet_id)
+
+        if agent is None:
+            return False
+
+        units = await ScanUnit.filter(round_id=round_id).only('id', 'devices')
+        devices = merge_rows((unit.devices for unit in units), scan_round.subnet.gateway_address)
+
+        await scan_snapshots.replace(agent, devices, lambda merged: ingest_queue.put(agent, merged))
+
+        logger.debug('Merged %s scan units of subnet %s into %s devices', len(units), scan_round.subnet_id, len(devices))
+
+        return True
+
+    async def merge_completed(self) -> int:
+        running = set(await ScanRound.filter(status=ScanRoundStatusEnum.RUNNING).values_list('id', flat=True))
+
+        if not running:
+            return 0
+
+        unfinished = await (
+            ScanUnit.filter(round_id__in=running)
+            .exclude(status=ScanUnitStatusEnum.DONE)
+            .distinct()
+            .values_list('round_id', flat=True)
+        )
+
+        merged = 0
+
+        for round_id in running - set(unfinished):
+            merged += await self.merge(round_id)
+
+        return merged
+
+    async def run_once(self):
+        now = timezone.now()
+
+        await self.expire_leases(now)
+        await self.merge_completed()
+        await self.plan(now)
+
+    async def _schedule_periodically(self):
+        while True:
+            try:
+                if await coordinator.is_leader(LOCK_SCAN_SCHEDULER):
+                    await self.run_once()
+            except Exception:  # noqa
+                logger.exception('Failed to schedule scans')
+
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if SCAN_SCHEDULER_ENABLED:
+            self._task = asyncio.create_task(self._schedule_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def stats(self) -> PySchedulerStats:
+        units = dict(
+            await ScanUnit.annotate(count=Count('id')).group_by('status').values_list('status', 'count')
+        )
+
+        return PySchedulerStats(
+            enabled=self._task is not None,
+            rounds_running=await ScanRound.filter(status=ScanRoundStatusEnum.RUNNING).count(),
+            units_pending=units.get(ScanUnitStatusEnum.PENDING, 0),
+            units_leased=units.get(ScanUnitStatusEnum.LEASED, 0),
+            units_done=units.get(ScanUnitStatusEnum.DONE, 0),
+            issued=self.issued,
+            expired=self.expired,
+            completed=self.completed,
+            merged=self.merged,
+        )
+
+
+scan_scheduler = ScanScheduler(
+    SCAN_SCHEDULER_INTERVAL,
+    SCAN_ROUND_INTERVAL,
+    SCAN_SPREAD,
+    SCAN_LEASE_DURATION,
+    SCAN_UNIT_SIZE,
+    SCAN_UNIT_PORTS,
+)
+
+registry.counter('echo_scan_leases_issued_total', 'Scan unit leases issued', function=lambda: scan_scheduler.issued)
+registry.counter('echo_scan_leases_expired_total', 'Scan unit leases expired', function=lambda: scan_scheduler.expired)
+registry.counter('echo_scan_units_completed_total', 'Completed scan units', function=lambda: scan_scheduler.completed)
+registry.counter('echo_scan_rounds_merged_total', 'Scan rounds merged', function=lambda: scan_scheduler.merged)
@@ -0,0 +1,45 @@
+from enum import Enum
+from typing import Any, Optional
+
+import ujson
+from fastapi.responses import UJSONResponse
+
+from echo.models.db import Agent, Device, Subnet
+
+
+class TrustedJSONResponse(UJSONResponse):
+    def render(self, content: Any) -> bytes:
+        return ujson.dumps(content, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+
+
+def _value(value: Any) -> Any:
+    return value.value if isinstance(value, Enum) else value
+
+
+def subnet_to_dict(subnet: Subnet) -> dict:
+    return {'pk': subnet.pk, 'cidr': subnet.cidr, 'gateway_address': subnet.gateway_address}
+
+
+def agent_to_dict(agent: Agent) -> dict:
+    return {'pk': agent.pk, 'address': agent.address, 'subnet': subnet_to_dict(agent.subnet)}
+
+
+def device_to_dict(device: Device, include: Optional[set[str]] = None) -> dict:
+    data = {
+        'pk': device.pk,
+        'subnet': subnet_to_dict(device.subnet) if device.subnet is not None else None,
+        'hostname': device.hostname,
+        'address': device.address,
+        'mac': device.mac,
+        'name': device.name,
+        'type': _value(device.type),
+        'connection_options': device.connection_options,
+        'connected_with': list(device.connected_with),
+        'status': _value(device.status),
+    }
+
+    if include is not None:
+        return {key: value for key, value in data.items() if key in include}
+
+    return data
+
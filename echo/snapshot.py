@@ -0,0 +1,125 @@
+from hashlib import sha1
+from socket import AF_INET, inet_pton
+from typing import Callable, Optional
+
+import ujson
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
+
+from echo.coordination import LOCK_SNAPSHOT, coordinator
+from echo.models.db import Agent, ScanSnapshot
+from echo.payload import ScannedDevice
+
+
+SnapshotRow = list
+
+
+class GenerationMismatch(Exception):
+    def __init__(self, generation: int):
+        super().__init__('Scan generation does not match, a full scan report is required')
+        self.generation = generation
+
+
+def _row_key(row: SnapshotRow) -> bytes:
+    return inet_pton(AF_INET, row[0])
+
+
+def to_rows(devices: list[ScannedDevice]) -> list[SnapshotRow]:
+    return sorted(
+        ([device.ip, device.mac, [list(port) for port in device.ports], device.is_gateway] for device in devices),
+        key=_row_key,
+    )
+
+
+def from_rows(rows: list[SnapshotRow]) -> list[ScannedDevice]:
+    return [
+        ScannedDevice(ip, mac, [tuple(port) for port in ports], is_gateway)
+        for ip, mac, ports, is_gateway in rows
+    ]
+
+
+def digest(rows: list[SnapshotRow]) -> str:
+    return sha1(ujson.dumps(rows).encode()).hexdigest()
+
+
+class ScanSnapshots:
+    async def _save(
+        self,
+        agent: Agent,
+        snapshot: Optional[ScanSnapshot],
+        rows: list[SnapshotRow],
+        enqueue: Callable[[list[ScannedDevice]], None],
+    ) -> ScanSnapshot:
+        devices = from_rows(rows)
+
+        # The report is queued only after its snapshot is written, and a rejected report rolls the write back
+        try:
+            async with in_transaction('default') as connection:
+                if snapshot is None:
+                    snapshot = await ScanSnapshot.create(
+                        agent=agent,
+                        generation=1,
+                        digest=digest(rows),
+                        devices=rows,
+                        using_db=connection,
+                    )
+                else:
+                    generation = snapshot.generation
+
+                    snapshot.generation += 1
+                    snapshot.digest = digest(rows)
+                    snapshot.devices = rows
+
+                    updated = (
+                        await ScanSnapshot.filter(pk=snapshot.pk, generation=generation)
+                        .using_db(connection)
+                        .update(generation=snapshot.generation, digest=snapshot.digest, devices=rows)
+                    )
+
+                    if not updated:
+                        raise GenerationMismatch((await ScanSnapshot.get(pk=snapshot.pk)).generation)
+
+                enqueue(devices)
+        except IntegrityError:
+            # A concurrent first report created the snapshot, read it once the aborted transaction is closed
+            raise GenerationMismatch((await ScanSnapshot.get(agent_id=agent.pk)).generation)
+
+        return snapshot
+
+    async def replace(
+        self,
+        agent: Agent,
+        devices: list[ScannedDevice],
+        enqueue: Callable[[list[ScannedDevice]], None],
+    ) -> ScanSnapshot:
+        async with coordinator.lock(LOCK_SNAPSHOT, agent.pk):
+            snapshot = await ScanSnapshot.get_or_none(agent_id=agent.pk)
+
+            return await self._save(agent, snapshot, to_rows(devices), enqueue)
+
+    async def apply_delta(
+        self,
+        agent: Agent,
+        generation: int,
+        upserted: list[ScannedDevice],
+        removed: list[str],
+        enqueue: Callable[[list[ScannedDevice]], None],
+    ) -> ScanSnapshot:
+        async with coordinator.lock(LOCK_SNAPSHOT, agent.pk):
+            snapshot = await ScanSnapshot.get_or_none(agent_id=agent.pk)
+
+            if snapshot is None or snapshot.generation != generation:
+                raise GenerationMismatch(snapshot.generation if snapshot is not None else 0)
+
+            rows = {row[0]: row for row in snapshot.devices}
+
+            for ip in removed:
+                rows.pop(ip, None)
+
+            for row in to_rows(upserted):
+                rows[row[0]] = row
+
+            return await self._save(agent, snapshot, sorted(rows.values(), key=_row_key), enqueue)
+
+
+scan_snapshots = ScanSnapshots()
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+from threading import Lock
+from time import monotonic
+from typing import Iterator, Optional
+
+from fabric import Config as FabricConfig, Connection
+
+from echo.config import SSH_CONNECT_TIMEOUT, SSH_IDLE_TIMEOUT
+from echo.executor import ssh_executor
+from echo.models.db import Agent
+
+
+logger = logging.getLogger(__name__)
+
+
+class PooledConnection:
+    def __init__(self, agent: Agent):
+        self.key = (agent.address, agent.username, agent.password)
+        self.lock = Lock()
+        self.last_used = monotonic()
+
+        self.connection = self._connect()
+
+    def _connect(self) -> Connection:
+        address, username, password = self.key
+        config = None
+
+        if username != 'root':
+            config = FabricConfig(overrides={'sudo': {'password': password}})
+
+        connection = Connection(
+            host=address,
+            port=22,
+            user=username,
+            config=config,
+            connect_timeout=SSH_CONNECT_TIMEOUT,
+        )
+
+        connection.connect_kwargs.password = password
+
+        return connection
+
+    def is_healthy(self) -> bool:
+        if not self.connection.is_connected:
+            return False
+
+        try:
+            self.connection.transport.send_ignore()
+        except Exception:  # noqa
+            return False
+
+        return True
+
+    def close(self):
+        try:
+            self.connection.close()
+        except Exception:  # noqa
+            logger.exception('Failed to close SSH connection to %s', self.key[0])
+
+    def reopen(self):
+        # Fabric caches the SFTP client of a connection, so a dead one is replaced rather than reopened
+        self.close()
+
+        self.connection = self._connect()
+        self.connection.open()
+
+
+class SSHPool:
+    def __init__(self, idle_timeout: float):
+        self.idle_timeout = idle_timeout
+
+        self._lock = Lock()
+        self._connections: dict[int, PooledConnection] = {}
+        self._evict_task: Optional[asyncio.Task] = None
+
+        self.opened = 0
+        self.reused = 0
+
+    def _checkout(self, agent: Agent) -> PooledConnection:
+        key = (agent.address, agent.username, agent.password)
+
+        with self._lock:
+            pooled = self._connections.get(agent.pk)
+
+            if pooled is None or pooled.key != key:
+                if pooled is not None:
+                    pooled.close()
+
+                pooled = self._connections[agent.pk] = PooledConnection(agent)
+
+        return pooled
+
+    def _is_current(self, agent_id: int, pooled: PooledConnection) -> bool:
+        with self._lock:
+            return self._connections.get(agent_id) is pooled
+
+    def _forget(self, agent_id: int, pooled: PooledConnection):
+        with self._lock:
+            if self._connections.get(agent_id) is pooled:
+                del self._connections[agent_id]
+
+        pooled.close()
+
+    @contextmanager
+    def connection(self, agent: Agent) -> Iterator[Connection]:
+        while True:
+            pooled = self._checkout(agent)
+
+            with pooled.lock:
+                # The connection may have been discarded while this thread waited for it
+                if not self._is_current(agent.pk, pooled):
+                    continue
+
+                if pooled.is_healthy():
+                    self.reused += 1
+                else:
+                    pooled.reopen()
+                    self.opened += 1
+
+                try:
+                    yield pooled.connection
+                except Exception:
+                    self._forget(agent.pk, pooled)
+                    raise
+                finally:
+                    pooled.last_used = monotonic()
+
+                return
+
+    def discard(self, agent_id: int):
+        with self._lock:
+            pooled = self._connections.pop(agent_id, None)
+
+        if pooled is not None:
+            with pooled.lock:
+                pooled.close()
+
+    def evict_idle(self):
+        deadline = monotonic() - self.idle_timeout
+
+        with self._lock:
+            idle = [
+                agent_id
+                for agent_id, pooled in self._connections.items()
+                if pooled.last_used < deadline and not pooled.lock.locked()
+            ]
+
+        for agent_id in idle:
+            self.discard(agent_id)
+
+    def close_all(self):
+        with self._lock:
+            agent_ids = list(self._connections)
+
+        for agent_id in agent_ids:
+            self.discard(agent_id)
+
+    @property
+    def size(self) -> int:
+        return len(self._connections)
+
+    async def _evict_periodically(self):
+        while True:
+            await asyncio.sleep(self.idle_timeout / 2)
+
+            try:
+                await ssh_executor.run(self.evict_idle)
+            except Exception:  # noqa
+                logger.exception('Failed to evict idle SSH connections')
+
+    async def start(self):
+        self._evict_task = asyncio.create_task(self._evict_periodically())
+
+    async def stop(self):
+        if self._evict_task is not None:
+            self._evict_task.cancel()
+            await asyncio.gather(self._evict_task, return_exceptions=True)
+            self._evict_task = None
+
+        self.close_all()
+
+
+ssh_pool = SSHPool(SSH_IDLE_TIMEOUT)
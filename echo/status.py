@@ -0,0 +1,257 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from tortoise import timezone
+from tortoise.functions import Min
+from tortoise.transactions import in_transaction
+
+from echo.config import (
+    STATUS_COMPACT_AFTER,
+    STATUS_COMPACT_BATCH,
+    STATUS_COMPACT_INTERVAL,
+    STATUS_MAX_GAP,
+    STATUS_RETENTION,
+)
+from echo.coordination import LOCK_STATUS_COMPACTOR, coordinator
+from echo.events import event_bus
+from echo.models import DeviceStatusEnum
+from echo.models.db import Device, DeviceStatusPeriod, DeviceStatusSample
+from echo.models.pydantic import PyDeviceStatusTransition, PyDeviceUptime
+from echo.response_cache import response_cache
+from echo.scan import ScanDiff, bulk_update
+
+
+logger = logging.getLogger(__name__)
+
+MAX_GAP = timedelta(seconds=STATUS_MAX_GAP)
+
+Interval = tuple[DeviceStatusEnum, datetime, datetime]
+
+
+def _append(intervals: list[Interval], status: DeviceStatusEnum, started_at: datetime, ended_at: datetime):
+    if intervals and intervals[-1][0] == status and intervals[-1][2] >= started_at:
+        intervals[-1] = (status, intervals[-1][1], max(intervals[-1][2], ended_at))
+    else:
+        intervals.append((status, started_at, ended_at))
+
+
+def samples_to_intervals(
+    samples: list[tuple[DeviceStatusEnum, datetime]],
+    next_observed_at: Optional[datetime] = None,
+) -> list[Interval]:
+    intervals = []
+
+    for i, (status, observed_at) in enumerate(samples):
+        next_at = samples[i + 1][1] if i + 1 < len(samples) else next_observed_at
+        ended_at = observed_at + MAX_GAP
+
+        if next_at is not None:
+            ended_at = min(next_at, ended_at)
+
+        _append(intervals, status, observed_at, ended_at)
+
+    return intervals
+
+
+async def record_observations(observations: list[tuple[Device, DeviceStatusEnum]], observed_at: datetime) -> list[Device]:
+    if not observations:
+        return []
+
+    transitioned = []
+
+    for device, status in observations:
+        if device.status != status:
+            device.status = status
+            device.status_changed_at = observed_at
+            transitioned.append(device)
+
+    async with in_transaction('default') as connection:
+        await DeviceStatusSample.bulk_create(
+            [
+                DeviceStatusSample(device_id=device.pk, status=status, observed_at=observed_at)
+                for device, status in observations
+            ],
+            using_db=connection,
+        )
+        await bulk_update(transitioned, ['status', 'status_changed_at'], connection)
+
+    if transitioned:
+        event_bus.status_changed(transitioned)
+        await response_cache.bump('devices')
+
+    return transitioned
+
+
+async def record_scan_status(diff: ScanDiff) -> list[Device]:
+    return await record_observations(
+        [(device, DeviceStatusEnum.UP) for device in diff.created + diff.changed + diff.not_changed]
+        + [(device, DeviceStatusEnum.DOWN) for device in diff.vanished],
+        timezone.now(),
+    )
+
+
+async def load_intervals(device_id: int, start: datetime, end: datetime) -> list[Interval]:
+    periods = await (
+        DeviceStatusPeriod.filter(device_id=device_id, ended_at__gt=start, started_at__lt=end)
+        .order_by('started_at')
+        .values_list('status', 'started_at', 'ended_at')
+    )
+    samples = await (
+        DeviceStatusSample.filter(device_id=device_id, observed_at__gte=start - MAX_GAP, observed_at__lt=end)
+        .order_by('observed_at', 'id')
+        .values_list('status', 'observed_at')
+    )
+
+    end = min(end, timezone.now())
+    intervals = []
+
+    for status, started_at, ended_at in periods + samples_to_intervals(samples):
+        started_at, ended_at = max(started_at, start), min(ended_at, end)
+
+        if started_at < ended_at:
+            _append(intervals, status, started_at, ended_at)
+
+    return intervals
+
+
+async def uptime(device_id: int, start: datetime, end: datetime) -> PyDeviceUptime:
+    durations = {status: 0.0 for status in DeviceStatusEnum}
+
+    for status, started_at, ended_at in await load_intervals(device_id, start, end):
+        durations[status] += (ended_at - started_at).total_seconds()
+
+    observed = sum(durations.values())
+
+    return PyDeviceUptime(
+        device_id=device_id,
+        start=start,
+        end=end,
+        up=durations[DeviceStatusEnum.UP],
+        down=durations[DeviceStatusEnum.DOWN],
+        unknown=max(0.0, (end - start).total_seconds() - observed),
+        uptime=durations[DeviceStatusEnum.UP] / observed if observed else None,
+    )
+
+
+async def transitions(device_id: int, start: datetime, end: datetime) -> list[PyDeviceStatusTransition]:
+    intervals = await load_intervals(device_id, start, end)
+
+    return [
+        PyDeviceStatusTransition(at=current[1], previous=previous[0], status=current[0])
+        for previous, current in zip(intervals, intervals[1:])
+        if previous[0] != current[0]
+    ]
+
+
+async def last_observed_at(device_id: int) -> Optional[datetime]:
+    sample = await DeviceStatusSample.filter(device_id=device_id).order_by('-observed_at').first()
+
+    if sample is not None:
+        return sample.observed_at
+
+    period = await DeviceStatusPeriod.filter(device_id=device_id).order_by('-ended_at').first()
+
+    return period.ended_at if period is not None else None
+
+
+async def _compact_devices(device_ids: list[int], cutoff: datetime) -> int:
+    samples: dict[int, list[tuple[DeviceStatusEnum, datetime]]] = {}
+
+    for device_id, status, observed_at in await (
+        DeviceStatusSample.filter(device_id__in=device_ids, observed_at__lt=cutoff)
+        .order_by('device_id', 'observed_at', 'id')
+        .values_list('device_id', 'status', 'observed_at')
+    ):
+        samples.setdefault(device_id, []).append((status, observed_at))
+
+    if not samples:
+        return 0
+
+    next_observed_at = dict(
+        await DeviceStatusSample.filter(device_id__in=device_ids, observed_at__gte=cutoff)
+        .annotate(next_observed_at=Min('observed_at'))
+        .group_by('device_id')
+        .values_list('device_id', 'next_observed_at')
+    )
+
+    earliest = min(device_samples[0][1] for device_samples in samples.values())
+    last_periods = {
+        period.device_id: period
+        for period in await DeviceStatusPeriod.filter(device_id__in=device_ids, ended_at__gte=earliest).order_by('ended_at')
+    }
+
+    created = []
+    updated = []
+
+    for device_id, device_samples in samples.items():
+        intervals = samples_to_intervals(device_samples, next_observed_at.get(device_id))
+        last_period = last_periods.get(device_id)
+
+        if last_period is not None and last_period.status == intervals[0][0] and last_period.ended_at >= intervals[0][1]:
+            last_period.ended_at = max(last_period.ended_at, intervals.pop(0)[2])
+            updated.append(last_period)
+
+        created.extend(
+            DeviceStatusPeriod(device_id=device_id, status=status, started_at=started_at, ended_at=ended_at)
+            for status, started_at, ended_at in intervals
+        )
+
+    async with in_transaction('default') as connection:
+        await DeviceStatusPeriod.bulk_create(created, using_db=connection)
+        await bulk_update(updated, ['ended_at'], connection)
+        await DeviceStatusSample.filter(device_id__in=device_ids, observed_at__lt=cutoff).using_db(connection).delete()
+
+    return sum(map(len, samples.values()))
+
+
+async def compact(now: Optional[datetime] = None) -> int:
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=STATUS_COMPACT_AFTER)
+
+    device_ids = sorted(
+        await DeviceStatusSample.filter(observed_at__lt=cutoff).distinct().values_list('device_id', flat=True)
+    )
+
+    compacted = 0
+
+    for i in range(0, len(device_ids), STATUS_COMPACT_BATCH):
+        compacted += await _compact_devices(device_ids[i:i + STATUS_COMPACT_BATCH], cutoff)
+
+    await DeviceStatusPeriod.filter(ended_at__lt=now - timedelta(seconds=STATUS_RETENTION)).delete()
+
+    return compacted
+
+
+class StatusCompactor:
+    def __init__(self, interval: float):
+        self.interval = interval
+
+        self._task: Optional[asyncio.Task] = None
+
+        self.runs = 0
+        self.compacted = 0
+
+    async def _compact_periodically(self):
+        while True:
+            try:
+                if await coordinator.is_leader(LOCK_STATUS_COMPACTOR):
+                    self.compacted += await compact()
+                    self.runs += 1
+            except Exception:  # noqa
+                logger.exception('Failed to compact device status history')
+
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._compact_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+status_compactor = StatusCompactor(STATUS_COMPACT_INTERVAL)
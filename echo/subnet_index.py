@@ -0,0 +1,80 @@
+from bisect import bisect_right
+from typing import Iterable, Optional, Union
+
+from echo.coordination import coordinator
+from echo.models.db import Subnet
+from echo.models.fields import pack_ipv4
+
+
+class SubnetIndex:
+    def __init__(self):
+        self._ranges: dict[int, tuple[int, int]] = {}
+
+        self._starts: list[int] = []
+        self._ends: list[int] = []
+        self._ids: list[int] = []
+        self._parents: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._ranges)
+
+    def _rebuild(self):
+        intervals = sorted(
+            ((first, last, subnet_id) for subnet_id, (first, last) in self._ranges.items()),
+            key=lambda interval: (interval[0], -interval[1]),
+        )
+
+        self._starts = [first for first, _, _ in intervals]
+        self._ends = [last for _, last, _ in intervals]
+        self._ids = [subnet_id for _, _, subnet_id in intervals]
+        self._parents = []
+
+        stack = []
+
+        for i, (first, last, _) in enumerate(intervals):
+            while stack and self._ends[stack[-1]] < first:
+                stack.pop()
+
+            self._parents.append(stack[-1] if stack else -1)
+            stack.append(i)
+
+    def _update(self, subnets: Iterable[Subnet]):
+        for subnet in subnets:
+            if subnet.first_address is None:
+                subnet.compute_range()
+
+            self._ranges[subnet.pk] = (subnet.first_address, subnet.last_address)
+
+        self._rebuild()
+
+    async def load(self):
+        self._ranges = {}
+        self._update(await Subnet.all())
+
+    def update(self, subnets: Iterable[Subnet]):
+        subnets = list(subnets)
+        self._update(subnets)
+
+        coordinator.publish('subnets', [subnet.pk for subnet in subnets])
+
+    def remove(self, subnet_id: int):
+        if self._ranges.pop(subnet_id, None) is not None:
+            self._rebuild()
+
+        coordinator.publish('subnets', [subnet_id])
+
+    def resolve(self, address: Union[str, int]) -> Optional[int]:
+        if isinstance(address, str):
+            address = pack_ipv4(address)
+
+        i = bisect_right(self._starts, address) - 1
+
+        while i >= 0 and self._ends[i] < address:
+            i = self._parents[i]
+
+        return self._ids[i] if i >= 0 else None
+
+
+subnet_index = SubnetIndex()
+
+coordinator.subscribe('subnets', lambda _: subnet_index.load(), subnet_index.load)
@@ -0,0 +1,144 @@
+from collections import deque
+from typing import Iterable, Optional
+
+from echo.coordination import coordinator
+from echo.models.db import Device, DeviceLink
+
+
+class Topology:
+    def __init__(self):
+        self._adjacency: dict[int, set[int]] = {}
+        self._subnets: dict[int, Optional[int]] = {}
+
+    def __contains__(self, device_id: int) -> bool:
+        return device_id in self._subnets
+
+    def __len__(self) -> int:
+        return len(self._subnets)
+
+    async def load(self):
+        self._adjacency = {}
+        self._subnets = {}
+
+        for device_id, subnet_id in await Device.all().values_list('id', 'subnet_id'):
+            self._subnets[device_id] = subnet_id
+            self._adjacency[device_id] = set()
+
+        self._link(await DeviceLink.all().values_list('a_id', 'b_id'))
+
+    def _link(self, pairs: Iterable[tuple[int, int]]):
+        for a, b in pairs:
+            if a == b:
+                continue
+
+            for device_id in (a, b):
+                self._subnets.setdefault(device_id, None)
+
+            self._adjacency.setdefault(a, set()).add(b)
+            self._adjacency.setdefault(b, set()).add(a)
+
+    def _update_device(self, device_id: int, subnet_id: Optional[int]):
+        self._subnets[device_id] = subnet_id
+        self._adjacency.setdefault(device_id, set())
+
+    def _remove_device(self, device_id: int):
+        for neighbour_id in self._adjacency.pop(device_id, set()):
+            self._adjacency.get(neighbour_id, set()).discard(device_id)
+
+        self._subnets.pop(device_id, None)
+
+    def link(self, pairs: Iterable[tuple[int, int]]):
+        pairs = list(pairs)
+        self._link(pairs)
+
+        coordinator.publish('topology', [['link', a, b] for a, b in pairs])
+
+    def update_devices(self, devices: Iterable[Device]):
+        items = []
+
+        for device in devices:
+            self._update_device(device.pk, device.subnet_id)
+            items.append(['device', device.pk, device.subnet_id])
+
+        coordinator.publish('topology', items)
+
+    def remove_device(self, device_id: int):
+        self._remove_device(device_id)
+
+        coordinator.publish('topology', [['remove', device_id]])
+
+    def apply(self, items: list):
+        for op, *args in items:
+            if op == 'link':
+                self._link([args])
+            elif op == 'device':
+                self._update_device(*args)
+            elif op == 'remove':
+                self._remove_device(*args)
+
+    def subnet_of(self, device_id: int) -> Optional[int]:
+        return self._subnets.get(device_id)
+
+    def neighbours(self, device_id: int) -> list[int]:
+        return sorted(self._adjacency.get(device_id, ()))
+
+    def shortest_path(self, source_id: int, target_id: int) -> Optional[list[int]]:
+        if source_id not in self._adjacency or target_id not in self._adjacency:
+            return None
+
+        parents = {source_id: None}
+        queue = deque([source_id])
+
+        while queue:
+            current = queue.popleft()
+
+            if current == target_id:
+                path = []
+
+                while current is not None:
+                    path.append(current)
+                    current = parents[current]
+
+                return path[::-1]
+
+            for neighbour_id in self._adjacency[current]:
+                if neighbour_id not in parents:
+                    parents[neighbour_id] = current
+                    queue.append(neighbour_id)
+
+        return None
+
+    def components(self, subnet_id: Optional[int] = None) -> list[list[int]]:
+        if subnet_id is None:
+            nodes = set(self._subnets)
+        else:
+            nodes = {device_id for device_id, device_subnet_id in self._subnets.items() if device_subnet_id == subnet_id}
+
+        seen = set()
+        components = []
+
+        for start in sorted(nodes):
+            if start in seen:
+                continue
+
+            component = []
+            queue = deque([start])
+            seen.add(start)
+
+            while queue:
+                current = queue.popleft()
+                component.append(current)
+
+                for neighbour_id in self._adjacency.get(current, ()):
+                    if neighbour_id in nodes and neighbour_id not in seen:
+                        seen.add(neighbour_id)
+                        queue.append(neighbour_id)
+
+            components.append(sorted(component))
+
+        return components
+
+
+topology = Topology()
+
+coordinator.subscribe('topology', topology.apply, topology.load)